@@ -1,45 +1,268 @@
+import sys
+import time
+import click
+from datetime import datetime, timedelta
 from flask import Flask
 from flask_cors import CORS
-from models import db
+from config import Config
+from database import init_db, ensure_schema
+from metrics import init_metrics
+from models import db, User
+from search import rebuild_search_index, search_json
+from stats import user_stats, stale_list_stats, rebuild_list_stats
+from sync import changes_json, prune_tombstones
+from archive import archive_completed, archived_json
+from sharding import databases, use_shard, home_shard, move_user
+from workspace import export_lines, import_lines, ImportFormatError, DEFAULT_IMPORT_CHUNK
+from task_tree import (rebuild_subtask_counters, rebuild_paths, delete_orphans,
+                       user_lists_json, list_tasks_json, subtree_json)
 from routes.auth_routes import auth_blueprint
 from routes.task_routes import tasks
-import os
 
-# Create Flask application instance
-app = Flask(__name__)
 
-# Database configuration
-basedir = os.path.abspath(os.path.dirname(__file__))
-instance_dir = os.path.join(basedir, 'instance')
-if not os.path.exists(instance_dir):
-    os.makedirs(instance_dir, mode=0o777)
+def create_app(config=None):
+    """Build the Flask application; `config` overrides entries of config.Config.
 
-db_path = os.path.join(instance_dir, 'todo.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'your-secret-key-here'
+    Nothing here touches the database or the filesystem: the engine is
+    created without connecting, and the schema is checked and migrated on the
+    first request (or by warm_up). That keeps importing and building the app
+    cheap and safe to do before forking (gunicorn --preload).
+    """
+    app = Flask(__name__)
 
-# Enable CORS
-CORS(app)
+    # Configuration, including the database URI, comes from config.py / the environment
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
 
-# Initialize database
-db.init_app(app)
+    # Enable CORS
+    CORS(app)
 
-# Register blueprints for authentication and task routes
-app.register_blueprint(auth_blueprint, url_prefix='/api/auth')
-app.register_blueprint(tasks, url_prefix='/api/tasks')
+    # Initialize database (pool sizing and SQLite pragmas live in database.py)
+    init_db(app)
 
-# Create database tables if they do not exist
-with app.app_context():
-    if not os.path.exists(db_path):
-        db.create_all()
-        os.chmod(db_path, 0o666)
+    # Per-request timings and SQL counts, served at /metrics (see metrics.py)
+    if app.config.get('METRICS_ENABLED', True):
+        init_metrics(app)
+
+    # Register blueprints for authentication and task routes
+    app.register_blueprint(auth_blueprint, url_prefix='/api/auth')
+    app.register_blueprint(tasks, url_prefix='/api/tasks')
+
+    # Create or migrate the schema before the first request is handled
+    @app.before_request
+    def prepare_database():
+        ensure_schema(app)
+
+    _register_commands(app)
+    return app
+
+
+def warm_up(app):
+    """Get a freshly forked worker ready to serve (see gunicorn.conf.py).
+
+    Drops any connections inherited from the parent without closing them,
+    makes sure the schema is current, fills the connection pool and runs
+    each read route's queries once, so the first real requests find open
+    connections and compiled statements instead of paying for them. With
+    sharding, every shard's pool is filled too.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        ensure_schema(app)
+
+        for engine in db.engines.values():
+            connections = [engine.connect() for _ in range(app.config.get('DB_POOL_SIZE', 1))]
+            for connection in connections:
+                connection.exec_driver_sql('SELECT 1')
+                connection.close()
+
+        # User id 0 never exists; the queries run and compile but match nothing
+        user_lists_json(0)
+        list_tasks_json(0, 0)
+        subtree_json(0, 0)
+        changes_json(0, 0)
+        search_json(0, 'warm')
+        user_stats(0)
+        archived_json(0)
+        db.session.remove()
+
+
+def _register_commands(app):
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Apply pending schema migrations to the configured database."""
+        applied = ensure_schema(app)
+        print(f"Applied: {', '.join(applied)}" if applied else "Schema is up to date")
+
+    @app.cli.command('rebuild-counters')
+    def rebuild_counters_command():
+        """Recompute the stored subtask counters of every task."""
+        ensure_schema(app)
+        for _, engine in databases():
+            with engine.begin() as conn:
+                rebuild_subtask_counters(conn)
+        print("Subtask counters rebuilt")
+
+    @app.cli.command('rebuild-paths')
+    def rebuild_paths_command():
+        """Recompute the materialized path of every task from parent_id."""
+        ensure_schema(app)
+        for _, engine in databases():
+            with engine.begin() as conn:
+                rebuild_paths(conn)
+        print("Task paths rebuilt")
+
+    @app.cli.command('rebuild-search')
+    def rebuild_search_command():
+        """Refill the full-text search index from the tasks table."""
+        ensure_schema(app)
+        for _, engine in databases():
+            with engine.begin() as conn:
+                rebuild_search_index(conn)
+        print("Search index rebuilt")
+
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        """Check the per-list task stats against the tasks table and recompute them."""
+        ensure_schema(app)
+        stale = 0
+        for _, engine in databases():
+            with engine.begin() as conn:
+                stale += len(stale_list_stats(conn))
+                rebuild_list_stats(conn)
+        print(f"List stats rebuilt ({stale} lists were out of step)")
+
+    def find_user(username):
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"No user named {username!r}")
+        return user
+
+    @app.cli.command('export-workspace')
+    @click.argument('username')
+    @click.argument('output', type=click.File('w'), default='-')
+    def export_workspace_command(username, output):
+        """Write a user's lists and tasks as NDJSON to OUTPUT (default stdout)."""
+        ensure_schema(app)
+        start, lines = time.perf_counter(), 0
+        user = find_user(username)
+        use_shard(user.shard)
+        for chunk in export_lines(user.id):
+            output.write(chunk)
+            lines += chunk.count('\n')
+        seconds = time.perf_counter() - start
+        print(f"Exported {lines - 1} records in {seconds:.1f} s ({(lines - 1) / seconds:.0f}/s)", file=sys.stderr)
+
+    @app.cli.command('import-workspace')
+    @click.argument('username')
+    @click.argument('source', type=click.File('rb'), default='-')
+    @click.option('--chunk-size', default=DEFAULT_IMPORT_CHUNK, show_default=True,
+                  help='records inserted per transaction')
+    def import_workspace_command(username, source, chunk_size):
+        """Add the lists and tasks of an NDJSON export to a user's workspace."""
+        ensure_schema(app)
+
+        def progress(lists, tasks, seconds):
+            print(f"{lists} lists, {tasks} tasks, {seconds:.1f} s ({tasks / seconds:.0f} tasks/s)", file=sys.stderr)
+
+        user = find_user(username)
+        use_shard(user.shard)
+        try:
+            import_lines(user.id, source, chunk_size, progress)
+        except ImportFormatError as e:
+            raise click.ClickException(f"{e} (records before this line's chunk were imported)")
+
+    @app.cli.command('archive-tasks')
+    @click.option('--older-than-days', type=int, help='archive trees completed more than this long ago '
+                                                       '[default: ARCHIVE_AFTER_DAYS]')
+    @click.option('--batch-rows', type=int, help='tasks moved per transaction [default: ARCHIVE_BATCH_ROWS]')
+    @click.option('--pause-ms', type=int, help='pause between transactions [default: ARCHIVE_PAUSE_MS]')
+    def archive_tasks_command(older_than_days, batch_rows, pause_ms):
+        """Move long-completed task trees out of the tasks table (run it from cron)."""
+        ensure_schema(app)
+        start = time.perf_counter()
+
+        def progress(trees, tasks):
+            seconds = time.perf_counter() - start
+            print(f"{trees} trees, {tasks} tasks, {seconds:.1f} s", file=sys.stderr)
+
+        trees = tasks = 0
+        for shard, _ in databases():
+            use_shard(shard)
+            done = archive_completed(
+                app.config.get('ARCHIVE_AFTER_DAYS', 90) if older_than_days is None else older_than_days,
+                app.config.get('ARCHIVE_BATCH_ROWS', 1000) if batch_rows is None else batch_rows,
+                app.config.get('ARCHIVE_PAUSE_MS', 50) if pause_ms is None else pause_ms,
+                lambda shard_trees, shard_tasks: progress(trees + shard_trees, tasks + shard_tasks))
+            trees, tasks = trees + done[0], tasks + done[1]
+        print(f"Archived {trees} task trees ({tasks} tasks)")
+
+    @app.cli.command('prune-tombstones')
+    @click.option('--older-than-days', type=int, help='prune tombstones written more than this long ago '
+                                                       '[default: TOMBSTONE_RETENTION_DAYS]')
+    def prune_tombstones_command(older_than_days):
+        """Delete old tombstones; clients that synced before them get a full resync (run it from cron)."""
+        ensure_schema(app)
+        if older_than_days is None:
+            older_than_days = app.config.get('TOMBSTONE_RETENTION_DAYS', 30)
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        pruned = 0
+        for _, engine in databases():
+            with engine.begin() as conn:
+                pruned += prune_tombstones(conn, cutoff)
+        print(f"Pruned {pruned} tombstones")
+
+    @app.cli.command('cleanup-orphans')
+    def cleanup_orphans_command():
+        """Delete task trees whose parent task or list no longer exists."""
+        ensure_schema(app)
+        deleted = 0
+        for _, engine in databases():
+            with engine.begin() as conn:
+                deleted += delete_orphans(conn)
+                rebuild_list_stats(conn)
+        print(f"Deleted {deleted} orphaned tasks")
+
+    def shard_argument(value):
+        if value == 'main':
+            return None
+        if not value.isdigit() or int(value) >= len(databases()) - 1:
+            raise click.BadParameter(f"expected 'main' or a shard number below {len(databases()) - 1}")
+        return int(value)
+
+    def move(user_id, username, target):
+        start = time.perf_counter()
+        moved = move_user(user_id, target)
+        print(f"{username}: {moved.get('tasks', 0)} tasks, {moved.get('todo_lists', 0)} lists to "
+              f"{'main' if target is None else f'shard {target}'} in {time.perf_counter() - start:.1f} s",
+              file=sys.stderr)
+
+    @app.cli.command('move-user')
+    @click.argument('username')
+    @click.argument('target')
+    def move_user_command(username, target):
+        """Move a user's lists and tasks to TARGET, a shard number or 'main'."""
+        ensure_schema(app)
+        move(find_user(username).id, username, shard_argument(target))
+
+    @app.cli.command('rebalance-shards')
+    @click.option('--dry-run', is_flag=True, help='only count the users that would move')
+    def rebalance_shards_command(dry_run):
+        """Move every user to the shard their id maps to (after adding or removing shards)."""
+        ensure_schema(app)
+        misplaced = [(user_id, username, home_shard(user_id))
+                     for user_id, username, shard in db.session.execute(
+                         db.select(User.id, User.username, User.shard).order_by(User.id))
+                     if shard != home_shard(user_id)]
+        db.session.rollback()
+        if not dry_run:
+            for user_id, username, target in misplaced:
+                move(user_id, username, target)
+        print(f"{len(misplaced)} users {'would move' if dry_run else 'moved'}")
 
-# Print all registered routes for debugging
-print("Registered routes:")
-for rule in app.url_map.iter_rules():
-    print(rule)
 
 # Run the application
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,208 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import insert, literal, select, text
+from models import db, Task, User, ArchivedTask, ListStats
+from task_json import TASK_COLUMNS, task_layout
+from task_tree import delete_subtree
+from positions import key_between, last_key
+
+# Hot/cold tiering: completed top-level task trees that have stayed
+# completed for a while move, whole, from tasks to archived_tasks, so the
+# read routes, search and stats only ever see the hot rows. Archived trees
+# can be browsed and restored.
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+DEFAULT_BATCH_ROWS = 1000
+DEFAULT_PAUSE_MS = 50
+DEFAULT_BROWSE_LIMIT = 50
+
+# Spelled as in the WHERE of the ix_tasks_archivable partial index, so
+# SQLite can use it (the ORM would compare completed = 1)
+COMPLETED = text('completed')
+# Columns shared by tasks and archived_tasks
+COPIED_COLUMNS = ('id', 'title', 'description', 'completed', 'list_id', 'parent_id', 'user_id', 'created_at',
+                  'is_expanded', 'subtask_total', 'subtask_completed', 'path', 'revision', 'completed_at',
+                  'position')
+# TASK_COLUMNS read from archived_tasks, in the same positions, for task_json
+ARCHIVE_COLUMNS = tuple(ArchivedTask.__table__.c[column.key] for column in TASK_COLUMNS)
+
+
+def archive_batch(cutoff, max_rows=DEFAULT_BATCH_ROWS):
+    """Archive trees completed before `cutoff` in one transaction; returns (trees, tasks).
+
+    Stops after the tree that brings the batch to max_rows tasks, so the
+    write lock is held for a bounded time (a single larger tree still moves
+    in one piece). Each tree leaves tombstones, so synced clients drop it.
+    """
+    candidates = db.session.execute(
+        select(Task.id, Task.user_id).where(COMPLETED, Task.parent_id.is_(None), Task.completed_at < cutoff)
+        .order_by(Task.completed_at).limit(max_rows)).all()
+    trees = tasks = 0
+    archived_at = datetime.utcnow()
+    for root_id, user_id in candidates:
+        # Takes the write lock, so the root is re-read as it is now
+        User.bump_revision(user_id)
+        root = Task.query.filter(Task.id == root_id, COMPLETED, Task.parent_id.is_(None),
+                                 Task.completed_at < cutoff).first()
+        if root is None:
+            continue
+        tree = select(*[getattr(Task, name) for name in COPIED_COLUMNS], literal(root.id), literal(archived_at)) \
+            .where(root.subtree_filter())
+        db.session.execute(insert(ArchivedTask).from_select(COPIED_COLUMNS + ('root_id', 'archived_at'), tree))
+        tasks += delete_subtree(root)
+        trees += 1
+        if tasks >= max_rows:
+            break
+    db.session.commit()
+    return trees, tasks
+
+
+def archive_completed(older_than_days=DEFAULT_ARCHIVE_AFTER_DAYS, batch_rows=DEFAULT_BATCH_ROWS,
+                      pause_ms=DEFAULT_PAUSE_MS, progress=None):
+    """Archive every tree completed more than older_than_days ago, batch by batch.
+
+    Sleeps pause_ms between batches so other writers get the lock. Calls
+    progress(trees, tasks) after each batch; returns the totals.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    total_trees = total_tasks = 0
+    while True:
+        trees, tasks = archive_batch(cutoff, batch_rows)
+        if not trees:
+            return total_trees, total_tasks
+        total_trees += trees
+        total_tasks += tasks
+        if progress:
+            progress(total_trees, total_tasks)
+        time.sleep(pause_ms / 1000)
+
+
+def archived_json(user_id, list_id=None, before=None, limit=DEFAULT_BROWSE_LIMIT):
+    """JSON body of GET /archive and the cursor of the next page (or None).
+
+    A user's archived trees, newest root id first, each as
+    {"archived_at": ..., "task": <task in the format of to_dict>}. `before`
+    is the cursor: a root id to continue below.
+    """
+    stmt = select(*ARCHIVE_COLUMNS, ArchivedTask.archived_at).where(
+        ArchivedTask.user_id == user_id, ArchivedTask.parent_id.is_(None))
+    if list_id is not None:
+        stmt = stmt.where(ArchivedTask.list_id == list_id)
+    if before is not None:
+        stmt = stmt.where(ArchivedTask.id < before)
+    roots = db.session.execute(stmt.order_by(ArchivedTask.id.desc()).limit(limit + 1)).all()
+    next_cursor = str(roots[limit - 1].id) if len(roots) > limit else None
+    roots = roots[:limit]
+
+    children = defaultdict(list)
+    if roots:
+        for row in db.session.execute(
+                select(*ARCHIVE_COLUMNS).where(ArchivedTask.root_id.in_([root.id for root in roots]),
+                                               ArchivedTask.parent_id.is_not(None))
+                .order_by(ArchivedTask.position, ArchivedTask.id)):
+            children[row.parent_id].append(row)
+    layout = task_layout()
+    body = ','.join([f'{{"archived_at":"{root.archived_at.isoformat()}","task":{layout.encode(root, children)}}}'
+                     for root in roots])
+    return f'[{body}]\n', next_cursor
+
+
+def archived_root(user_id, task_id):
+    """(root id, list id) of the archived tree holding task_id, or None."""
+    row = db.session.execute(
+        select(ArchivedTask.root_id).where(ArchivedTask.id == task_id, ArchivedTask.user_id == user_id)).first()
+    if row is None:
+        return None
+    return row.root_id, db.session.execute(
+        select(ArchivedTask.list_id).where(ArchivedTask.id == row.root_id)).scalar()
+
+
+def reserve_task_ids(executor, count=0):
+    """Raise the tasks AUTOINCREMENT counter past every task id in use, and `count` more.
+
+    SQLite never hands out an id below its counter, but only ids inserted
+    into tasks move it. Archived and tombstoned ids can also arrive another
+    way (moved from another database, renumbered), and a deleted id must
+    not come back while a tombstone for it is kept. Returns the first of
+    the `count` ids reserved for the caller to insert with.
+    """
+    highest = executor.execute(text(
+        "SELECT MAX(COALESCE((SELECT MAX(id) FROM tasks), 0), COALESCE((SELECT MAX(id) FROM archived_tasks), 0), "
+        "COALESCE((SELECT MAX(row_id) FROM tombstones WHERE kind = 'task'), 0), "
+        "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'tasks'), 0))")).scalar()
+    counter = executor.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'tasks'")).scalar()
+    if counter is None:
+        executor.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', :seq)"),
+                         {'seq': highest + count})
+    elif counter < highest + count:
+        executor.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'tasks'"), {'seq': highest + count})
+    return highest + 1
+
+
+def _fresh_ids(executor, ids):
+    first = reserve_task_ids(executor, len(ids))
+    return {old: first + offset for offset, old in enumerate(ids)}
+
+
+def _renumber(rows, new_ids):
+    # Rewrite the ids, parent ids and paths of a tree's row dicts in place
+    for row in rows:
+        row['id'] = new_ids[row['id']]
+        row['parent_id'] = new_ids.get(row['parent_id'])
+        row['path'] = '/' + ''.join(f'{new_ids[int(part)]}/' for part in row['path'].strip('/').split('/') if part)
+        if 'root_id' in row:
+            row['root_id'] = new_ids[row['root_id']]
+
+
+def renumber_reused_archive(conn):
+    """Give archived trees fresh ids where a task has been given one of their ids.
+
+    Before tasks.id was AUTOINCREMENT, SQLite reused the ids of archived
+    tasks, and archiving the new task would then fail. Returns the number of
+    trees renumbered.
+    """
+    archived = ArchivedTask.__table__
+    roots = conn.execute(text('SELECT DISTINCT archived_tasks.root_id FROM archived_tasks '
+                              'JOIN tasks ON tasks.id = archived_tasks.id')).scalars().all()
+    for root_id in roots:
+        rows = [dict(row._mapping) for row in conn.execute(
+            select(archived).where(archived.c.root_id == root_id).order_by(archived.c.id))]
+        _renumber(rows, _fresh_ids(conn, [row['id'] for row in rows]))
+        conn.execute(archived.delete().where(archived.c.root_id == root_id))
+        conn.execute(archived.insert(), rows)
+    reserve_task_ids(conn)
+    return len(roots)
+
+
+def restore_tree(user_id, root_id, list_id):
+    """Move an archived tree back into tasks, in list_id, in the current transaction.
+
+    The tree keeps its ids unless one of them is taken in tasks (only
+    possible for trees moved from another database, or archived before
+    tasks.id was AUTOINCREMENT); then the whole tree gets fresh ids.
+    Returns the restored root id.
+    """
+    revision = User.bump_revision(user_id)
+    columns = [ArchivedTask.__table__.c[name] for name in COPIED_COLUMNS]
+    rows = [dict(row._mapping) for row in db.session.execute(
+        select(*columns).where(ArchivedTask.root_id == root_id).order_by(ArchivedTask.id))]
+    taken = db.session.execute(
+        select(Task.id).join(ArchivedTask, ArchivedTask.id == Task.id)
+        .where(ArchivedTask.root_id == root_id).limit(1)).first()
+
+    new_ids = {row['id']: row['id'] for row in rows}
+    if taken is not None:
+        new_ids = _fresh_ids(db.session, list(new_ids))
+    _renumber(rows, new_ids)
+    for row in rows:
+        row['list_id'] = list_id
+        row['revision'] = revision
+    # The root goes last in the list; subtasks keep their order
+    root = next(row for row in rows if row['parent_id'] is None)
+    root['position'] = key_between(last_key(db.session, list_id, None), None)
+    db.session.execute(Task.__table__.insert(), rows)
+
+    ListStats.bump(db.session, list_id, tasks=len(rows), completed=sum(bool(row['completed']) for row in rows))
+    ArchivedTask.query.filter_by(root_id=root_id).delete(synchronize_session=False)
+    return new_ids[root_id]
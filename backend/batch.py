@@ -0,0 +1,159 @@
+from datetime import datetime
+from models import db, Task, TodoList
+from task_tree import subtree_ids, delete_subtree, move_subtree
+
+DEFAULT_MAX_OPERATIONS = 500
+OPERATIONS = ('create', 'update', 'move', 'complete', 'delete')
+UPDATE_FIELDS = ('title', 'description', 'completed', 'is_expanded', 'list_id')
+
+
+class BatchError(Exception):
+    def __init__(self, index, message, status=400):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+        self.status = status
+
+
+def _task_refs(op):
+    # Task ids an operation points at: its own id, for creates the parent,
+    # for moves the new neighbours
+    return [op[key] for key in ('id', 'parent_id', 'before_id', 'after_id') if op.get(key) is not None]
+
+
+def _check_operations(operations):
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+            raise BatchError(index, f"'op' must be one of {', '.join(OPERATIONS)}")
+        if op['op'] == 'create':
+            if not op.get('title'):
+                raise BatchError(index, 'Title is required')
+            if op.get('list_id') is None and op.get('parent_id') is None:
+                raise BatchError(index, 'list_id or parent_id is required')
+        elif op.get('id') is None:
+            raise BatchError(index, 'id is required')
+        if op['op'] == 'move' and op.get('list_id') is None:
+            raise BatchError(index, 'list_id is required')
+        for ref in _task_refs(op):
+            if not isinstance(ref, (int, str)) or isinstance(ref, bool):
+                raise BatchError(index, 'Task ids must be integers or the ref of an earlier create')
+
+
+def _load_owned(user_id, operations):
+    """Fetch every existing task and list the batch touches with one query each."""
+    task_ids = {ref for op in operations for ref in _task_refs(op) if isinstance(ref, int)}
+    list_ids = {op['list_id'] for op in operations if isinstance(op.get('list_id'), int)}
+
+    owned_tasks = {}
+    if task_ids:
+        owned_tasks = {task.id: task for task in
+                       Task.query.filter(Task.user_id == user_id, Task.id.in_(task_ids))}
+    owned_lists = set()
+    if list_ids:
+        owned_lists = {row.id for row in db.session.query(TodoList.id).filter(
+            TodoList.user_id == user_id, TodoList.id.in_(list_ids))}
+
+    for index, op in enumerate(operations):
+        for ref in _task_refs(op):
+            if isinstance(ref, int) and ref not in owned_tasks:
+                raise BatchError(index, f'Task with id {ref} not found', 404)
+        if op.get('list_id') is not None and op['list_id'] not in owned_lists:
+            raise BatchError(index, f"List with id {op['list_id']} not found", 404)
+    return owned_tasks
+
+
+def apply_batch(user_id, operations):
+    """Apply a list of task operations inside the current transaction.
+
+    Ids may be integers or the `ref` string of an earlier create in the same
+    batch. Ownership of every referenced task and list is checked up front;
+    any failure raises BatchError and the caller rolls the whole batch back.
+    Returns one result dict per operation.
+    """
+    _check_operations(operations)
+    tasks_by_id = _load_owned(user_id, operations)
+    created = {}
+    deleted = set()
+
+    def resolve(index, ref):
+        task = created.get(ref) if isinstance(ref, str) else tasks_by_id.get(ref)
+        # Also catches descendants removed along with an earlier delete
+        task_id = ref if task is None else task.id
+        if task_id in deleted:
+            raise BatchError(index, f'Task {task_id} was deleted earlier in the batch')
+        if task is None:
+            raise BatchError(index, f'Unknown ref {ref!r}', 404)
+        return task
+
+    touched = []
+    for index, op in enumerate(operations):
+        kind = op['op']
+
+        if kind == 'create':
+            parent = resolve(index, op['parent_id']) if op.get('parent_id') is not None else None
+            task = Task(
+                title=op['title'],
+                description=op.get('description', ''),
+                list_id=parent.list_id if parent else op['list_id'],
+                parent_id=parent.id if parent else None,
+                user_id=user_id,
+                completed=bool(op.get('completed', False)),
+                completed_at=datetime.utcnow() if op.get('completed') else None,
+                is_expanded=True
+            )
+            db.session.add(task)
+            db.session.flush()
+            if parent:
+                Task.bump_subtask_counters(parent.id, user_id, total=1, completed=int(task.completed))
+            if op.get('ref') is not None:
+                created[str(op['ref'])] = task
+            tasks_by_id[task.id] = task
+            touched.append((index, task.id, task))
+            continue
+
+        task = resolve(index, op['id'])
+        if kind == 'delete':
+            db.session.flush()
+            ids = subtree_ids(task)
+            task_id = task.id
+            delete_subtree(task)
+            deleted.update(ids)
+            for loaded_id in deleted.intersection(tasks_by_id):
+                loaded = tasks_by_id.pop(loaded_id)
+                if loaded in db.session:
+                    db.session.expunge(loaded)
+            touched.append((index, task_id, None))
+            continue
+
+        if kind == 'update':
+            for field in UPDATE_FIELDS:
+                if field not in op:
+                    continue
+                if field == 'completed':
+                    task.set_completed(op['completed'])
+                elif field == 'list_id':
+                    move_subtree(task, op['list_id'])
+                else:
+                    setattr(task, field, op[field])
+        elif kind == 'move':
+            neighbours = [resolve(index, op[key]).id if op.get(key) is not None else None
+                          for key in ('before_id', 'after_id')]
+            try:
+                move_subtree(task, op['list_id'], *neighbours)
+            except ValueError as e:
+                raise BatchError(index, str(e))
+        elif kind == 'complete':
+            task.set_completed(op.get('completed', True))
+        touched.append((index, task.id, task))
+
+    db.session.flush()
+    results = []
+    for index, task_id, task in touched:
+        op = operations[index]
+        result = {'index': index, 'op': op['op'], 'id': task_id}
+        if op.get('ref') is not None:
+            result['ref'] = op['ref']
+        if task is not None:
+            result['task'] = task.to_dict(include_subtasks=False)
+        results.append(result)
+    return results
@@ -0,0 +1,136 @@
+"""Hot/cold tiering (archive.py): read latency before and after archival, and archival cost.
+
+Fills a scratch SQLite file with --lists lists of --tasks tasks each, laid
+out as trees of about 25 tasks, and marks --completed of the trees as
+completed long ago. Times GET /lists/<id>/tasks for every list, archives
+the old trees batch by batch while another thread keeps creating tasks
+through the API, then times the reads again. Reports the archival
+throughput, how long each batch held the write lock and what the
+concurrent writes waited. From the backend directory:
+
+    python benchmarks/archive_bench.py --lists 20 --tasks 10000 --batch-rows 1000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from common import build_app, create_user, login, insert_task_tree
+from sqlalchemy import text
+from models import db, TodoList
+from stats import rebuild_list_stats
+from task_tree import list_tasks_json
+from archive import archive_batch, DEFAULT_BATCH_ROWS
+
+TREE_SIZE = 25
+
+
+def seed(rng, user_id, lists, tasks, completed):
+    list_ids = []
+    for n in range(lists):
+        todo_list = TodoList(title=f'List {n}', user_id=user_id)
+        db.session.add(todo_list)
+        db.session.commit()
+        list_ids.append(todo_list.id)
+        roots = insert_task_tree(user_id, todo_list.id, tasks, trees=max(1, tasks // TREE_SIZE))
+        done = rng.sample(roots, int(len(roots) * completed))
+        # Whole trees completed 200 days ago, counters included
+        db.session.execute(text(
+            'UPDATE tasks SET completed = 1, completed_at = :old, subtask_completed = subtask_total '
+            "WHERE id = :root OR (path >= '/' || :root || '/' AND path < '/' || :root || '0')"),
+            [{'root': root, 'old': datetime.utcnow() - timedelta(days=200)} for root in done])
+    rebuild_list_stats(db.session)
+    db.session.commit()
+    return list_ids
+
+
+def read_latencies(user_id, list_ids, rounds):
+    latencies = []
+    for _ in range(rounds):
+        for list_id in list_ids:
+            start = time.perf_counter()
+            list_tasks_json(user_id, list_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+    db.session.rollback()
+    return sorted(latencies)
+
+
+def write_while(app, token, list_id, stop, latencies):
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    while not stop.is_set():
+        start = time.perf_counter()
+        client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'concurrent'}, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.005)
+
+
+def summary(values):
+    return (f'p50 {statistics.median(values):7.1f}  p95 {values[int(len(values) * 0.95) - 1]:7.1f}  '
+            f'max {values[-1]:7.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lists', type=int, default=20)
+    parser.add_argument('--tasks', type=int, default=10000, help='tasks per list')
+    parser.add_argument('--completed', type=float, default=0.8, help='share of trees completed long ago')
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS)
+    parser.add_argument('--pause-ms', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=3, help='reads of every list per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'archive.db')
+    # The response cache would hide the database from the reads
+    app = build_app(f'sqlite:///{database}', RESPONSE_CACHE_MAX_BYTES=0)
+    with app.app_context():
+        user_id = create_user('archive')
+        list_ids = seed(random.Random(args.seed), user_id, args.lists, args.tasks, args.completed)
+        writer_list = TodoList(title='Writer', user_id=create_user('writer'))
+        db.session.add(writer_list)
+        db.session.commit()
+        writer_list = writer_list.id
+        hot = db.session.execute(text('SELECT COUNT(*) FROM tasks')).scalar()
+        print(f'{hot} tasks in {args.lists} lists, {args.completed:.0%} of the trees completed 200 days ago')
+
+        before = read_latencies(user_id, list_ids, args.rounds)
+        print(f'GET /lists/<id>/tasks before archival: {summary(before)}')
+
+        stop, write_latencies = threading.Event(), []
+        writer = threading.Thread(target=write_while,
+                                  args=(app, login(app, 'writer'), writer_list, stop, write_latencies))
+        writer.start()
+        cutoff = datetime.utcnow() - timedelta(days=90)
+        batches, archived = [], 0
+        start = time.perf_counter()
+        while True:
+            batch_start = time.perf_counter()
+            trees, tasks = archive_batch(cutoff, args.batch_rows)
+            if not trees:
+                break
+            batches.append((time.perf_counter() - batch_start) * 1000)
+            archived += tasks
+            time.sleep(args.pause_ms / 1000)
+        seconds = time.perf_counter() - start
+        stop.set()
+        writer.join()
+        batches.sort()
+        write_latencies.sort()
+        print(f'archived {archived} tasks in {len(batches)} batches, {seconds:.1f} s '
+              f'({archived / seconds:.0f} tasks/s including pauses)')
+        print(f'batch duration (write lock held):      {summary(batches)}')
+        print(f'concurrent task creation:              {summary(write_latencies)} '
+              f'({len(write_latencies)} requests)')
+
+        after = read_latencies(user_id, list_ids, args.rounds)
+        print(f'GET /lists/<id>/tasks after archival:  {summary(after)}')
+        print(f'p50 speedup {statistics.median(before) / statistics.median(after):.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Shared setup for the benchmark scripts in this directory."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+from app import create_app
+from database import ensure_schema
+from models import db, User
+from sharding import place_user
+from positions import nth_key
+
+BENCH_PASSWORD = 'benchpass'
+
+
+def build_app(database_uri='sqlite://', **config):
+    """app.create_app() pointed at a scratch database, with the schema in place.
+
+    Extra keyword arguments override entries of config.Config.
+    """
+    app = create_app(dict(config, SQLALCHEMY_DATABASE_URI=database_uri))
+    ensure_schema(app)
+    return app
+
+
+def create_user(username):
+    user = User(username=username, password_hash=generate_password_hash(BENCH_PASSWORD))
+    db.session.add(user)
+    db.session.flush()
+    place_user(user)
+    db.session.commit()
+    return user.id
+
+
+def login(app, username):
+    return app.test_client().post('/api/auth/login', json={
+        'username': username, 'password': BENCH_PASSWORD
+    }).get_json()['token']
+
+
+def insert_task_tree(user_id, list_id, count, trees=10, fanout=4):
+    """Bulk insert `count` tasks into a list as `trees` trees with `fanout` children per node.
+
+    Each tree is laid out like a heap (node k's children are fanout*k+1 ...
+    fanout*k+fanout), which gives depth ~log_fanout(count / trees). Rows are
+    written with executemany and explicit ids, so seeding 100k tasks takes
+    seconds. Returns the ids of the root tasks.
+    """
+    first_id = (db.session.execute(text('SELECT MAX(id) FROM tasks')).scalar() or 0) + 1
+    now = datetime.utcnow()
+    revision = User.bump_revision(user_id)
+    rows, roots = [], []
+    for tree in range(trees):
+        size = count // trees + (1 if tree < count % trees else 0)
+        base = first_id + len(rows)
+        paths = []
+        for k in range(size):
+            children = max(0, min(size, fanout * k + fanout + 1) - (fanout * k + 1))
+            parent = (k - 1) // fanout if k else None
+            paths.append('/' if parent is None else f'{paths[parent]}{base + parent}/')
+            rows.append({
+                'id': base + k, 'title': f'Task {base + k}', 'description': '', 'completed': False,
+                'list_id': list_id, 'parent_id': None if parent is None else base + parent,
+                'user_id': user_id, 'created_at': now, 'is_expanded': True,
+                'subtask_total': children, 'subtask_completed': 0,
+                'path': paths[k], 'revision': revision,
+                'position': nth_key(tree if parent is None else (k - 1) % fanout)
+            })
+        if size:
+            roots.append(base)
+    db.session.execute(text(
+        'INSERT INTO tasks (id, title, description, completed, list_id, parent_id, user_id, '
+        'created_at, is_expanded, subtask_total, subtask_completed, path, revision, position) VALUES '
+        '(:id, :title, :description, :completed, :list_id, :parent_id, :user_id, '
+        ':created_at, :is_expanded, :subtask_total, :subtask_completed, :path, :revision, :position)'), rows)
+    db.session.commit()
+    return roots
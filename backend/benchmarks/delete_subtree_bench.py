@@ -0,0 +1,65 @@
+"""Time deleting large lists: set-based subtree deletion vs per-row ORM deletes.
+
+Seeds a scratch SQLite file (not instance/todo.db) with lists of N tasks and
+deletes each one through DELETE /api/tasks/lists/<id>, then repeats with the
+old approach of loading every task and calling db.session.delete on it. From
+the backend directory:
+
+    python benchmarks/delete_subtree_bench.py --tasks 10000 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import build_app, create_user, login, insert_task_tree
+from models import db, Task, TodoList
+
+
+def seed_list(user_id, count):
+    todo_list = TodoList(title=f'{count} tasks', user_id=user_id)
+    db.session.add(todo_list)
+    db.session.commit()
+    insert_task_tree(user_id, todo_list.id, count)
+    return todo_list.id
+
+
+def orm_delete(list_id):
+    for task in Task.query.filter_by(list_id=list_id).all():
+        db.session.delete(task)
+    db.session.delete(db.session.get(TodoList, list_id))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, nargs='+', default=[10000, 50000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        app = build_app(f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+        with app.app_context():
+            user_id = create_user('bench')
+        client = app.test_client()
+        headers = {'Authorization': f"Bearer {login(app, 'bench')}"}
+
+        print(f"{'tasks':>8} {'set-based (s)':>14} {'per-row ORM (s)':>16}")
+        for count in args.tasks:
+            with app.app_context():
+                list_id = seed_list(user_id, count)
+            start = time.perf_counter()
+            response = client.delete(f'/api/tasks/lists/{list_id}', headers=headers)
+            set_based = time.perf_counter() - start
+            assert response.status_code == 200, response.get_json()
+
+            with app.app_context():
+                list_id = seed_list(user_id, count)
+                start = time.perf_counter()
+                orm_delete(list_id)
+                per_row = time.perf_counter() - start
+                assert Task.query.count() == 0
+            print(f"{count:>8} {set_based:>14.3f} {per_row:>16.3f}")
+
+
+if __name__ == '__main__':
+    main()
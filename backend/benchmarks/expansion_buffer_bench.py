@@ -0,0 +1,107 @@
+"""Commits and latency of expand/collapse toggles: written through vs the write-behind buffer.
+
+Seeds --users users with a list of --tasks tasks each in a scratch SQLite
+file, then sends --toggles PUT /api/tasks/toggle/<id> requests from
+--threads threads, each toggle on a random task of a random user (a few
+tasks get most of the clicks, as in a UI). Runs once with
+EXPANSION_FLUSH_MS=0, which commits every toggle, and once with the buffer
+(expansion_buffer.py), and counts the commits each run made, including
+the buffer's final flush. From the backend directory:
+
+    python benchmarks/expansion_buffer_bench.py --toggles 5000 --threads 4
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from common import build_app, create_user, login, insert_task_tree
+from sqlalchemy import event
+from models import db, TodoList
+from expansion_buffer import expansion_buffer
+
+
+def run(args, flush_ms):
+    with tempfile.TemporaryDirectory() as scratch:
+        # One connection per request thread plus one for the flusher, as
+        # config.Config sizes the pool for gunicorn threads
+        app = build_app(f"sqlite:///{os.path.join(scratch, 'bench.db')}", DB_POOL_SIZE=args.threads + 1,
+                        EXPANSION_FLUSH_MS=flush_ms, EXPANSION_MAX_PENDING=args.max_pending)
+        users = []
+        with app.app_context():
+            for n in range(args.users):
+                user_id = create_user(f'user{n}')
+                todo_list = TodoList(title='Tree', user_id=user_id)
+                db.session.add(todo_list)
+                db.session.commit()
+                insert_task_tree(user_id, todo_list.id, args.tasks)
+                task_ids = [row[0] for row in db.session.execute(
+                    db.text('SELECT id FROM tasks WHERE user_id = :user_id'), {'user_id': user_id})]
+                users.append((login(app, f'user{n}'), task_ids))
+            engine = db.engine
+
+        commits = []
+
+        def count_commit(conn):
+            commits.append(1)
+        event.listen(engine, 'commit', count_commit)
+        latencies, errors = [], []
+
+        def toggler(seed, count):
+            rng = random.Random(seed)
+            client = app.test_client()
+            for _ in range(count):
+                token, task_ids = rng.choice(users)
+                # Zipf-like: a handful of tasks per user take most of the clicks
+                task_id = task_ids[min(int(rng.paretovariate(1.2)) - 1, len(task_ids) - 1)]
+                start = time.perf_counter()
+                response = client.put(f'/api/tasks/toggle/{task_id}',
+                                      headers={'Authorization': f'Bearer {token}'})
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        threads = [threading.Thread(target=toggler, args=(seed, args.toggles // args.threads))
+                   for seed in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+        if flush_ms:
+            expansion_buffer.flush()
+        event.remove(engine, 'commit', count_commit)
+        latencies.sort()
+        return {
+            'toggles': len(latencies),
+            'per_second': len(latencies) / seconds,
+            'p50': statistics.median(latencies),
+            'p95': latencies[int(len(latencies) * 0.95) - 1],
+            'commits': len(commits),
+            'errors': len(errors),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--tasks', type=int, default=200, help='tasks per user')
+    parser.add_argument('--toggles', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--flush-ms', type=int, default=1000)
+    parser.add_argument('--max-pending', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'mode':<14} {'toggles':>8} {'toggles/s':>10} {'p50 ms':>7} {'p95 ms':>7} {'commits':>8} {'errors':>7}")
+    for mode, flush_ms in (('write-through', 0), ('buffered', args.flush_ms)):
+        result = run(args, flush_ms)
+        print(f"{mode:<14} {result['toggles']:>8} {result['per_second']:>10.0f} {result['p50']:>7.2f} "
+              f"{result['p95']:>7.2f} {result['commits']:>8} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Print EXPLAIN QUERY PLAN for every SQL statement the API routes issue.
+
+Drives each auth and task route once through the Flask test client against
+a scratch database, captures the statements with a SQLAlchemy engine event
+and asks SQLite for their plans. Exits with status 1 if any statement does
+a full scan of one of the app's tables. From the backend directory:
+
+    python benchmarks/explain_queries.py [--verbose]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from common import build_app, create_user, login, insert_task_tree
+from sqlalchemy import event
+from models import db, TodoList
+from archive import archive_batch
+
+TABLES = ('users', 'todo_lists', 'tasks', 'tombstones', 'list_stats', 'archived_tasks')
+# "SCAN tasks" or "SCAN tasks USING COVERING INDEX ..." both read every row
+FULL_SCAN = re.compile(r'^SCAN (%s)\b' % '|'.join(TABLES))
+
+
+def route_calls(app, client, headers):
+    """Call every route once; yields (label, response) in call order.
+
+    The archival job runs once too, with no response.
+    """
+    def call(method, url, json=None):
+        response = getattr(client, method)(url, json=json, headers=headers)
+        return f'{method.upper()} {url}', response
+
+    yield call('post', '/api/auth/signup', {'username': 'explain2', 'password': 'explainpass'})
+    yield call('post', '/api/auth/login', {'username': 'explain2', 'password': 'explainpass'})
+    yield call('get', '/api/auth/me')
+
+    label, response = call('post', '/api/tasks/lists', {'title': 'Explain'})
+    yield label, response
+    list_id = response.get_json()['id']
+    label, response = call('post', f'/api/tasks/lists/{list_id}/tasks', {'title': 'Root'})
+    yield label, response
+    task_id = response.get_json()['id']
+    label, response = call('post', f'/api/tasks/add/{task_id}/subtasks/create', {'title': 'Child'})
+    yield label, response
+    subtask_id = response.get_json()['id']
+    label, response = call('post', '/api/tasks/lists', {'title': 'Other'})
+    yield label, response
+    other_list = response.get_json()['id']
+
+    yield call('get', '/api/tasks/lists')
+    yield call('get', '/api/tasks/lists?limit=2&fields=id,title&depth=1')
+    yield call('put', f'/api/tasks/lists/{list_id}', {'title': 'Renamed'})
+    yield call('get', f'/api/tasks/lists/{list_id}/tasks')
+    yield call('get', f'/api/tasks/lists/{list_id}/tasks?limit=2&depth=2')
+    yield call('get', f'/api/tasks/tasks/{task_id}')
+    yield call('get', '/api/tasks/changes?since=1')
+    yield call('get', f'/api/tasks/search?q=chi&list_id={list_id}&completed=false')
+    yield call('get', '/api/tasks/stats')
+    label, response = call('get', '/api/tasks/export')
+    yield label, response
+    exported = response.get_data()
+    yield 'POST /api/tasks/import', client.post('/api/tasks/import', data=exported, headers=headers)
+    yield call('put', f'/api/tasks/update/{task_id}', {'title': 'Updated', 'completed': False})
+    yield call('put', f'/api/tasks/toggle/{task_id}')
+    yield call('put', f'/api/tasks/update/{task_id}/subtasks/update/{subtask_id}', {'completed': True})
+    yield call('put', f'/api/tasks/complete/subtask/{subtask_id}', {'completed': False})
+    yield call('put', f'/api/tasks/complete/subtask/{subtask_id}?response=compact', {'completed': True})
+    label, response = call('post', f'/api/tasks/lists/{list_id}/tasks', {'title': 'Sibling'})
+    yield label, response
+    sibling_id = response.get_json()['id']
+    yield call('put', f'/api/tasks/reorder/{sibling_id}', {'before_id': task_id})
+    yield call('put', f'/api/tasks/reorder/{task_id}', {'after_id': sibling_id})
+    yield call('put', f'/api/tasks/reorder/{sibling_id}')
+    yield call('put', f'/api/tasks/move/{task_id}/to/{other_list}')
+    yield call('put', f'/api/tasks/move/{sibling_id}/to/{other_list}', {'before_id': task_id})
+    yield call('post', '/api/tasks/batch', {'operations': [
+        {'op': 'create', 'ref': 'a', 'list_id': list_id, 'title': 'Batch'},
+        {'op': 'update', 'id': task_id, 'title': 'Batched'},
+        {'op': 'delete', 'id': 'a'},
+    ]})
+    yield call('delete', f'/api/tasks/delete/{task_id}/subtasks/delete/{subtask_id}')
+    yield call('delete', f'/api/tasks/delete/{task_id}')
+    label, response = call('post', f'/api/tasks/lists/{list_id}/tasks', {'title': 'Done'})
+    yield label, response
+    done_id = response.get_json()['id']
+    yield call('put', f'/api/tasks/complete/subtask/{done_id}', {'completed': True})
+    with app.app_context():
+        archive_batch(datetime.utcnow() + timedelta(days=1))
+    yield 'archive_batch', None
+    yield call('get', f'/api/tasks/archive?list_id={list_id}&limit=5')
+    yield call('post', f'/api/tasks/archive/{done_id}/restore')
+    yield call('delete', f"/api/tasks/tasks/delete/{done_id}")
+    yield call('delete', f'/api/tasks/lists/{list_id}')
+    yield call('get', '/api/tasks/changes?since=1')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--verbose', action='store_true', help='print plans without full scans too')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        app = build_app(f"sqlite:///{os.path.join(scratch, 'explain.db')}")
+        with app.app_context():
+            # Enough rows that the planner has a reason to prefer indexes
+            user_id = create_user('explain')
+            for n in range(3):
+                todo_list = TodoList(title=f'Seed {n}', user_id=user_id)
+                db.session.add(todo_list)
+                db.session.commit()
+                insert_task_tree(user_id, todo_list.id, 2000)
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+            engine = db.engine
+
+        pending, captured = [], []
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and not statement.lstrip().upper().startswith(('PRAGMA', 'EXPLAIN')):
+                pending.append((statement, parameters))
+
+        client = app.test_client()
+        headers = {'Authorization': f"Bearer {login(app, 'explain')}"}
+        pending.clear()
+        for label, response in route_calls(app, client, headers):
+            if response is not None and response.status_code >= 400:
+                print(f'{label} failed with {response.status_code}: {response.get_data(as_text=True)}')
+                return 2
+            captured.extend((label, statement, parameters) for statement, parameters in pending)
+            pending.clear()
+        event.remove(engine, 'before_cursor_execute', capture)
+
+        seen, scans = set(), 0
+        with app.app_context():
+            raw = db.engine.raw_connection()
+            try:
+                cursor = raw.cursor()
+                for label, statement, parameters in captured:
+                    if statement in seen:
+                        continue
+                    seen.add(statement)
+                    plan = [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+                    full_scans = [step for step in plan if FULL_SCAN.match(step)]
+                    scans += bool(full_scans)
+                    if full_scans or args.verbose:
+                        print(f"{'FULL SCAN' if full_scans else 'ok'}  [{label}]")
+                        print('    ' + ' '.join(statement.split()))
+                        for step in plan:
+                            print('      ' + step)
+            finally:
+                raw.close()
+
+        print(f'{len(seen)} distinct statements, {scans} with full table scans')
+        return 1 if scans else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
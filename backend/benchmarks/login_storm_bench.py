@@ -0,0 +1,169 @@
+"""Task-route latency while a storm of logins hits the same server.
+
+Serves the app from a child process with a fixed pool of request threads
+(like a gunicorn gthread worker), measures GET /lists/<id>/tasks?limit=50
+from one client, then again while --storm clients log in as fast as they
+can. Runs once with hashing on the request threads (PASSWORD_HASH_WORKERS=0,
+unbounded, as before the hashing pool) and once with the pool. Uses a
+scratch SQLite file. From the backend directory:
+
+    python benchmarks/login_storm_bench.py --threads 4 --storm 16 --seconds 5
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import build_app, create_user, login, insert_task_tree, BENCH_PASSWORD
+from models import db, TodoList
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug's server with a fixed pool of request threads."""
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app, handler=QuietHandler)
+        self.executor = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve(database_uri, threads, config, port_queue):
+    app = build_app(database_uri, RESPONSE_CACHE_MAX_BYTES=0, TOKEN_CACHE_TTL=0, SLOW_REQUEST_MS=10 ** 6,
+                    **config)
+    server = PooledWSGIServer('127.0.0.1', 0, app, threads)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request(method, path, body=json.dumps(body) if body is not None else None,
+                           headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def read_latencies(port, path, headers, seconds):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status = request(port, 'GET', path, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert status == 200, status
+    return latencies
+
+
+def storm(port, stop, results, backoff):
+    body = {'username': 'stormer', 'password': BENCH_PASSWORD}
+    while not stop.is_set():
+        status = request(port, 'POST', '/api/auth/login', body)
+        results.append(status)
+        if status == 503:
+            time.sleep(backoff)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(database_uri, args, config, token, list_id):
+    port_queue = multiprocessing.Queue()
+    # Not a daemon: daemonic processes may not start the hashing pool
+    server = multiprocessing.Process(target=serve, args=(database_uri, args.threads, config, port_queue))
+    server.start()
+    port = port_queue.get(timeout=30)
+    headers = {'Authorization': f'Bearer {token}'}
+    path = f'/api/tasks/lists/{list_id}/tasks?limit=50'
+    try:
+        request(port, 'POST', '/api/auth/login', {'username': 'stormer', 'password': BENCH_PASSWORD})
+        read_latencies(port, path, headers, 0.5)  # warm up
+        quiet = read_latencies(port, path, headers, args.seconds)
+
+        stop, results = threading.Event(), []
+        clients = [threading.Thread(target=storm, args=(port, stop, results, args.backoff))
+                   for _ in range(args.storm)]
+        for client in clients:
+            client.start()
+        time.sleep(0.5)
+        busy = read_latencies(port, path, headers, args.seconds)
+        stop.set()
+        for client in clients:
+            client.join()
+    finally:
+        server.terminate()
+        server.join()
+    return quiet, busy, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4, help='request threads in the server')
+    parser.add_argument('--storm', type=int, default=16, help='concurrent login clients')
+    parser.add_argument('--seconds', type=float, default=5, help='measuring time per phase')
+    parser.add_argument('--workers', type=int, default=1, help='PASSWORD_HASH_WORKERS for the pool run')
+    parser.add_argument('--queue-depth', type=int, default=2, help='PASSWORD_HASH_QUEUE_DEPTH for the pool run')
+    parser.add_argument('--backoff', type=float, default=0.1, help='seconds a client waits after a 503')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    database_uri = f'sqlite:///{database}'
+    app = build_app(database_uri)
+    with app.app_context():
+        user_id = create_user('reader')
+        create_user('stormer')
+        todo_list = TodoList(title='Bench', user_id=user_id)
+        db.session.add(todo_list)
+        db.session.commit()
+        insert_task_tree(user_id, todo_list.id, 500)
+        list_id = todo_list.id
+    token = login(app, 'reader')
+
+    modes = [
+        ('request thread', {'PASSWORD_HASH_WORKERS': 0, 'PASSWORD_HASH_QUEUE_DEPTH': 10000}),
+        (f'pool {args.workers}+{args.queue_depth}', {'PASSWORD_HASH_WORKERS': args.workers,
+                                                     'PASSWORD_HASH_QUEUE_DEPTH': args.queue_depth}),
+    ]
+    print(f"{'hashing':<16} {'phase':<6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'logins/s':>9} {'503/s':>7}")
+    for label, config in modes:
+        quiet, busy, results = run(database_uri, args, config, token, list_id)
+        for phase, latencies in (('quiet', quiet), ('storm', busy)):
+            logins = rejected = ''
+            if phase == 'storm':
+                logins = f'{results.count(200) / args.seconds:.1f}'
+                rejected = f'{results.count(503) / args.seconds:.1f}'
+            print(f'{label:<16} {phase:<6} {statistics.median(latencies):>8.1f} '
+                  f'{percentile(latencies, 0.95):>8.1f} {percentile(latencies, 0.99):>8.1f} '
+                  f'{logins:>9} {rejected:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Per-request cost of the metrics instrumentation (metrics.init_metrics).
+
+Times the same requests against two in-memory apps, one plain and one
+instrumented, alternating rounds so drift affects both equally. GET
+/api/auth/me is close to the cheapest route there is, so it shows the
+worst-case relative overhead. From the backend directory:
+
+    python benchmarks/metrics_overhead_bench.py --requests 1000
+"""
+import argparse
+import time
+
+from common import build_app, create_user, login, insert_task_tree
+from metrics import metrics
+from models import db, TodoList
+
+
+def setup(instrumented):
+    app = build_app(RESPONSE_CACHE_MAX_BYTES=0, METRICS_ENABLED=instrumented)
+    with app.app_context():
+        user_id = create_user('bench')
+        todo_list = TodoList(title='Bench', user_id=user_id)
+        db.session.add(todo_list)
+        db.session.commit()
+        insert_task_tree(user_id, todo_list.id, 200)
+        list_id = todo_list.id
+    headers = {'Authorization': f"Bearer {login(app, 'bench')}"}
+    return app.test_client(), headers, list_id
+
+
+def time_requests(client, headers, method, url, body, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        getattr(client, method)(url, json=body, headers=headers).close()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000, help='requests per round')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    apps = {'plain': setup(False), 'instrumented': setup(True)}
+    list_id = apps['plain'][2]
+    cases = [
+        ('GET /api/auth/me', 'get', '/api/auth/me', None),
+        ('GET tasks?limit=50', 'get', f'/api/tasks/lists/{list_id}/tasks?limit=50', None),
+        ('GET /api/tasks/lists', 'get', '/api/tasks/lists', None),
+        ('PUT toggle', 'put', '/api/tasks/toggle/1', None),
+    ]
+
+    print(f"{'request':<22} {'plain us':>10} {'instrumented us':>16} {'overhead us':>12} {'overhead':>9}")
+    for label, method, url, body in cases:
+        best = {}
+        for _ in range(args.rounds):
+            for name, (client, headers, _) in apps.items():
+                elapsed = time_requests(client, headers, method, url, body, args.requests)
+                best[name] = min(best.get(name, elapsed), elapsed)
+        overhead = best['instrumented'] - best['plain']
+        print(f"{label:<22} {best['plain']:>10.1f} {best['instrumented']:>16.1f} {overhead:>12.1f} "
+              f"{overhead / best['plain'] * 100:>8.1f}%")
+    metrics.clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Cost of reordering tasks (PUT /reorder/<id>) as lists grow, and how often positions rebalance.
+
+For every --sizes list size, seeds one list of that many top-level tasks
+in a scratch SQLite file and moves --moves random tasks to random places
+through the API. Reports the request latency and the task rows each move
+wrote: one, unless the move had to renumber its siblings first
+(positions.rebalance). Then runs the worst case for the keys, --adversarial
+moves that each put a task right after the first one, so every key is
+squeezed between the same two neighbours and grows until MAX_KEY_LENGTH
+forces a rebalance. From the backend directory:
+
+    python benchmarks/reorder_bench.py --sizes 100 10000 100000 --moves 500
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from common import build_app, create_user, login, insert_task_tree
+from sqlalchemy import event, select
+from models import db, Task, TodoList
+from positions import MAX_KEY_LENGTH
+
+
+def seed(user_id, size):
+    todo_list = TodoList(title=f'{size} tasks', user_id=user_id)
+    db.session.add(todo_list)
+    db.session.commit()
+    # One task per tree: every task is a top-level sibling
+    ids = insert_task_tree(user_id, todo_list.id, size, trees=size)
+    db.session.commit()
+    return ids
+
+
+def count_writes(engine):
+    """A list that collects the task rows each UPDATE of tasks changes."""
+    written = []
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE tasks'):
+            written.append(cursor.rowcount)
+    return written
+
+
+def reorder(client, headers, task_id, body, written):
+    del written[:]
+    start = time.perf_counter()
+    response = client.put(f'/api/tasks/reorder/{task_id}', json=body, headers=headers)
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(response.get_json())
+    return elapsed, sum(written), response.get_json()['position']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--moves', type=int, default=500)
+    parser.add_argument('--adversarial', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    database = os.path.join(tempfile.mkdtemp(), 'reorder.db')
+    app = build_app(f'sqlite:///{database}')
+    client = app.test_client()
+    with app.app_context():
+        user_id = create_user('reorder')
+        headers = {'Authorization': f"Bearer {login(app, 'reorder')}"}
+        written = count_writes(db.engine)
+
+        print(f"{'siblings':>9} {'p50 ms':>7} {'p95 ms':>7} {'rows/move':>10} {'max rows':>9} {'max key':>8}")
+        for size in args.sizes:
+            ids = seed(user_id, size)
+            latencies, rows, longest = [], [], 0
+            for _ in range(args.moves):
+                task_id, neighbour = rng.sample(ids, 2)
+                body = {rng.choice(('before_id', 'after_id')): neighbour}
+                elapsed, changed, position = reorder(client, headers, task_id, body, written)
+                latencies.append(elapsed)
+                rows.append(changed)
+                longest = max(longest, len(position))
+            latencies.sort()
+            print(f'{size:>9} {statistics.median(latencies):>7.2f} {latencies[int(len(latencies) * 0.95) - 1]:>7.2f} '
+                  f'{sum(rows) / len(rows):>10.2f} {max(rows):>9} {longest:>8}')
+
+        size = args.sizes[0]
+        ids = seed(user_id, size)
+        first = db.session.execute(select(Task.id).where(Task.id.in_(ids))
+                                   .order_by(Task.position, Task.id).limit(1)).scalar()
+        db.session.rollback()
+        rebalances, longest = 0, 0
+        for task_id in (rng.choice(ids[1:]) for _ in range(args.adversarial)):
+            if task_id == first:
+                continue
+            _, changed, position = reorder(client, headers, task_id, {'after_id': first}, written)
+            rebalances += changed > 1
+            longest = max(longest, len(position))
+        print(f'{args.adversarial} moves right after the first of {size} tasks: {rebalances} rebalances '
+              f'(MAX_KEY_LENGTH {MAX_KEY_LENGTH}), longest key {longest}')
+
+
+if __name__ == '__main__':
+    main()
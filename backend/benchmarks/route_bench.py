@@ -0,0 +1,427 @@
+"""Drive every auth and task route through the Flask test client and time it.
+
+Builds a scratch SQLite database from the synthetic workload (workload.py,
+same options), then sends --requests requests to each endpoint and reports
+p50/p95/p99 latency, requests per second, SQL statements and response bytes
+per request. Results can be written as JSON and compared with an earlier
+run. From the backend directory:
+
+    python benchmarks/route_bench.py --output before.json
+    python benchmarks/route_bench.py --output after.json --compare before.json
+
+The response cache is off unless --response-cache is given, so read routes
+measure the database and serialization work rather than cache hits.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+from common import build_app, login
+from sqlalchemy import event
+from workload import add_arguments, generate, workload_options
+from models import db
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Context:
+    """What the scenarios share: the client, a seeded rng and the dataset."""
+
+    def __init__(self, client, manifest, tokens, seed):
+        self.client = client
+        self.manifest = manifest
+        self.tokens = tokens
+        self.rng = random.Random(seed)
+        for user in manifest:
+            for lst in user['lists']:
+                roots = set(lst['root_ids'])
+                lst['child_ids'] = [task_id for task_id in lst['task_ids'] if task_id not in roots]
+
+    def user(self):
+        user = self.rng.choice(self.manifest)
+        return user, {'Authorization': f"Bearer {self.tokens[user['id']]}"}
+
+    def task(self, user, parent_only=False, child_only=False):
+        lst = self.rng.choice(user['lists'])
+        ids = lst['root_ids'] if parent_only else lst['child_ids'] if child_only else lst['task_ids']
+        if not ids:
+            raise RuntimeError('The workload has no suitable tasks; raise --tasks or --depth')
+        return lst, self.rng.choice(ids)
+
+    def create_task(self, headers, list_id, parent_id=None):
+        # Untimed setup for the destructive scenarios
+        if parent_id is None:
+            response = self.client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'tmp'},
+                                        headers=headers)
+        else:
+            response = self.client.post(f'/api/tasks/add/{parent_id}/subtasks/create', json={'title': 'tmp'},
+                                        headers=headers)
+        return response.get_json()['id']
+
+
+# Each scenario yields (method, url, json, headers) forever; anything it does
+# between yields is setup and not timed.
+
+def signup(ctx):
+    n = 0
+    while True:
+        n += 1
+        yield 'post', '/api/auth/signup', {'username': f'signup{n}', 'password': 'benchpass'}, {}
+
+
+def auth_login(ctx):
+    while True:
+        user = ctx.rng.choice(ctx.manifest)
+        yield 'post', '/api/auth/login', {'username': user['username'], 'password': 'benchpass'}, {}
+
+
+def me(ctx):
+    while True:
+        _, headers = ctx.user()
+        yield 'get', '/api/auth/me', None, headers
+
+
+def get_lists(query=''):
+    def scenario(ctx):
+        while True:
+            _, headers = ctx.user()
+            yield 'get', f'/api/tasks/lists{query}', None, headers
+    return scenario
+
+
+def create_list(ctx):
+    while True:
+        _, headers = ctx.user()
+        yield 'post', '/api/tasks/lists', {'title': 'Bench list'}, headers
+
+
+def update_list(ctx):
+    while True:
+        user, headers = ctx.user()
+        lst = ctx.rng.choice(user['lists'])
+        yield 'put', f"/api/tasks/lists/{lst['id']}", {'title': f"List {lst['id']}"}, headers
+
+
+def delete_list(ctx):
+    while True:
+        user, headers = ctx.user()
+        list_id = ctx.client.post('/api/tasks/lists', json={'title': 'tmp'}, headers=headers).get_json()['id']
+        parent = ctx.create_task(headers, list_id)
+        for _ in range(10):
+            ctx.create_task(headers, list_id, parent)
+        yield 'delete', f'/api/tasks/lists/{list_id}', None, headers
+
+
+def get_tasks(query=''):
+    def scenario(ctx):
+        while True:
+            user, headers = ctx.user()
+            lst = ctx.rng.choice(user['lists'])
+            yield 'get', f"/api/tasks/lists/{lst['id']}/tasks{query}", None, headers
+    return scenario
+
+
+def create_task(ctx):
+    while True:
+        user, headers = ctx.user()
+        lst = ctx.rng.choice(user['lists'])
+        yield 'post', f"/api/tasks/lists/{lst['id']}/tasks", {'title': 'Bench task'}, headers
+
+
+def get_task(ctx):
+    while True:
+        user, headers = ctx.user()
+        _, task_id = ctx.task(user, parent_only=True)
+        yield 'get', f'/api/tasks/tasks/{task_id}', None, headers
+
+
+def update_task(ctx):
+    while True:
+        user, headers = ctx.user()
+        _, task_id = ctx.task(user)
+        yield 'put', f'/api/tasks/update/{task_id}', {'title': f'Task {task_id}'}, headers
+
+
+def delete_task(ctx):
+    while True:
+        user, headers = ctx.user()
+        task_id = ctx.create_task(headers, ctx.rng.choice(user['lists'])['id'])
+        yield 'delete', f'/api/tasks/delete/{task_id}', None, headers
+
+
+def toggle_task(ctx):
+    while True:
+        user, headers = ctx.user()
+        _, task_id = ctx.task(user)
+        yield 'put', f'/api/tasks/toggle/{task_id}', None, headers
+
+
+def create_subtask(ctx):
+    while True:
+        user, headers = ctx.user()
+        _, task_id = ctx.task(user)
+        yield 'post', f'/api/tasks/add/{task_id}/subtasks/create', {'title': 'Bench subtask'}, headers
+
+
+def update_subtask(ctx):
+    while True:
+        user, headers = ctx.user()
+        _, task_id = ctx.task(user, parent_only=True)
+        subtask_id = ctx.create_task(headers, None, task_id)
+        yield 'put', f'/api/tasks/update/{task_id}/subtasks/update/{subtask_id}', {'completed': True}, headers
+
+
+def delete_subtask(ctx):
+    while True:
+        user, headers = ctx.user()
+        _, task_id = ctx.task(user)
+        subtask_id = ctx.create_task(headers, None, task_id)
+        yield 'delete', f'/api/tasks/delete/{task_id}/subtasks/delete/{subtask_id}', None, headers
+
+
+def complete_subtask(ctx):
+    while True:
+        user, headers = ctx.user()
+        _, task_id = ctx.task(user, child_only=True)
+        yield 'put', f'/api/tasks/complete/subtask/{task_id}', {'completed': ctx.rng.random() < 0.5}, headers
+
+
+def delete_completed_task(ctx):
+    while True:
+        user, headers = ctx.user()
+        task_id = ctx.create_task(headers, ctx.rng.choice(user['lists'])['id'])
+        yield 'delete', f'/api/tasks/tasks/delete/{task_id}', None, headers
+
+
+def move_task(ctx):
+    # Moves real subtrees back and forth between a user's first two lists
+    while True:
+        user, headers = ctx.user()
+        first, second = user['lists'][0], user['lists'][-1]
+        task_id = ctx.rng.choice(first['root_ids'])
+        yield 'put', f"/api/tasks/move/{task_id}/to/{second['id']}", None, headers
+        ctx.client.put(f"/api/tasks/move/{task_id}/to/{first['id']}", headers=headers)
+
+
+def batch(ctx):
+    while True:
+        user, headers = ctx.user()
+        lst, task_id = ctx.task(user)
+        yield 'post', '/api/tasks/batch', {'operations': [
+            {'op': 'create', 'ref': 'a', 'list_id': lst['id'], 'title': 'Batch'},
+            {'op': 'create', 'ref': 'b', 'parent_id': 'a', 'title': 'Batch child'},
+            {'op': 'complete', 'id': 'b'},
+            {'op': 'update', 'id': task_id, 'title': f'Task {task_id}'},
+            {'op': 'delete', 'id': 'a'},
+        ]}, headers
+
+
+def changes(ctx):
+    while True:
+        _, headers = ctx.user()
+        # An empty delta is the cheapest way to learn the current revision
+        revision = ctx.client.get(f'/api/tasks/changes?since={2 ** 62}', headers=headers).get_json()['revision']
+        yield 'get', f'/api/tasks/changes?since={max(0, revision - 5)}', None, headers
+
+
+def stream(ctx):
+    while True:
+        _, headers = ctx.user()
+        yield 'get', '/api/tasks/stream', None, headers
+
+
+def stats(path):
+    def scenario(ctx):
+        while True:
+            _, headers = ctx.user()
+            yield 'get', path, None, headers
+    return scenario
+
+
+def test_get_task(ctx):
+    while True:
+        user, _ = ctx.user()
+        _, task_id = ctx.task(user)
+        yield 'get', f'/api/tasks/test/task/{task_id}', None, {}
+
+
+def test_get_all(ctx):
+    while True:
+        yield 'get', '/api/tasks/test/all', None, {}
+
+
+SCENARIOS = [
+    ('auth.signup', signup),
+    ('auth.login', auth_login),
+    ('auth.get_current_user', me),
+    ('tasks.get_lists', get_lists()),
+    ('tasks.get_lists?limit=20&depth=1', get_lists('?limit=20&depth=1')),
+    ('tasks.create_list', create_list),
+    ('tasks.update_list', update_list),
+    ('tasks.delete_list', delete_list),
+    ('tasks.get_tasks', get_tasks()),
+    ('tasks.get_tasks?limit=50&fields=id,title,completed', get_tasks('?limit=50&fields=id,title,completed')),
+    ('tasks.create_task', create_task),
+    ('tasks.get_task', get_task),
+    ('tasks.update_task', update_task),
+    ('tasks.delete_task', delete_task),
+    ('tasks.toggle_task', toggle_task),
+    ('tasks.create_subtask', create_subtask),
+    ('tasks.update_subtask', update_subtask),
+    ('tasks.delete_subtask', delete_subtask),
+    ('tasks.complete_subtask', complete_subtask),
+    ('tasks.delete_completed_task', delete_completed_task),
+    ('tasks.move_task', move_task),
+    ('tasks.batch_tasks', batch),
+    ('tasks.get_changes', changes),
+    ('tasks.stream_changes', stream),
+    ('tasks.get_stats', stats('/api/tasks/stats')),
+    ('tasks.get_stream_stats', stats('/api/tasks/stream/stats')),
+    ('tasks.get_cache_stats', stats('/api/tasks/cache/stats')),
+    ('tasks.test_get_task', test_get_task),
+    ('tasks.test_get_all', test_get_all),
+]
+
+
+def _body_size(response):
+    if response.mimetype == 'text/event-stream':
+        # An open stream never ends; read up to its first event
+        size = 0
+        for chunk in response.response:
+            size += len(chunk)
+            if b'event:' in chunk:
+                break
+        response.close()
+        return size
+    return len(response.get_data())
+
+
+def run_scenario(ctx, scenario, requests, warmup, statements):
+    requests_iter = scenario(ctx)
+    timings, sql_counts, sizes = [], [], []
+    elapsed = 0.0
+    for n in range(warmup + requests):
+        method, url, body, headers = next(requests_iter)
+        before = statements[0]
+        start = time.perf_counter()
+        response = getattr(ctx.client, method)(url, json=body, headers=headers, buffered=False)
+        size = _body_size(response)
+        duration = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method.upper()} {url} returned {response.status_code}: {response.get_data()!r}')
+        if n >= warmup:
+            elapsed += duration
+            timings.append(duration * 1000)
+            sql_counts.append(statements[0] - before)
+            sizes.append(size)
+    timings.sort()
+    return {
+        'requests': requests,
+        'p50_ms': round(_percentile(timings, 0.50), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'p99_ms': round(_percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'rps': round(requests / elapsed, 1),
+        'sql_per_request': round(statistics.fmean(sql_counts), 2),
+        'bytes_per_request': round(statistics.fmean(sizes)),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _change(new, old):
+    return f'{(new - old) / old * 100:+.0f}%' if old else 'n/a'
+
+
+def print_results(results, baseline=None):
+    header = f"{'endpoint':<52} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'sql':>6} {'bytes':>8}"
+    if baseline:
+        header += f" {'p50 vs base':>12} {'sql vs base':>12}"
+    print(header)
+    for label, row in results.items():
+        line = (f"{label:<52} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+                f"{row['rps']:>8.0f} {row['sql_per_request']:>6.1f} {row['bytes_per_request']:>8}")
+        old = (baseline or {}).get(label)
+        if old:
+            line += (f" {_change(row['p50_ms'], old['p50_ms']):>12}"
+                     f" {row['sql_per_request'] - old['sql_per_request']:>+12.1f}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--only', nargs='+', help='run endpoints whose label contains any of these')
+    parser.add_argument('--response-cache', action='store_true', help='leave the response cache on')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    scenarios = [(label, scenario) for label, scenario in SCENARIOS
+                 if not args.only or any(part in label for part in args.only)]
+    config = {} if args.response_cache else {'RESPONSE_CACHE_MAX_BYTES': 0}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        app = build_app(f"sqlite:///{os.path.join(scratch, 'bench.db')}", **config)
+        with app.app_context():
+            manifest = generate(**workload_options(args))
+            engine = db.engine
+        tokens = {user['id']: login(app, user['username']) for user in manifest}
+
+        statements = [0]
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements[0] += 1
+
+        for label, scenario in scenarios:
+            ctx = Context(app.test_client(), manifest, tokens, args.seed)
+            results[label] = run_scenario(ctx, scenario, args.requests, args.warmup, statements)
+        engine.dispose()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'git_revision': _git_revision(),
+                    'python': platform.python_version(),
+                    'sqlalchemy': sqlalchemy.__version__,
+                    'sqlite': sqlite3.sqlite_version,
+                    'platform': platform.platform(),
+                    'workload': workload_options(args),
+                    'requests': args.requests,
+                    'response_cache': args.response_cache,
+                },
+                'results': results,
+            }, f, indent=2)
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
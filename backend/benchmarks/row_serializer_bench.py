@@ -0,0 +1,92 @@
+"""ORM objects + to_dict + jsonify versus Core rows + task_json for the read routes.
+
+Builds each response body both ways from the same workload.py dataset,
+checks the bytes are identical, then reports the best time and peak traced
+memory of each. Runs against an in-memory SQLite database. From the backend
+directory:
+
+    python benchmarks/row_serializer_bench.py --tasks 2000 --depth 5
+"""
+import argparse
+import time
+import tracemalloc
+from collections import defaultdict
+
+from common import build_app
+from flask import jsonify
+from models import db, Task, TodoList
+from task_tree import user_lists_json, list_tasks_json
+from workload import add_arguments, generate, workload_options
+
+
+def orm_tasks(user_id, **criteria):
+    tasks = Task.query.filter_by(user_id=user_id, **criteria).order_by(Task.id).all()
+    children = defaultdict(list)
+    for task in tasks:
+        children[task.parent_id].append(task)
+    return children
+
+
+def orm_list_tasks(user_id, list_id):
+    children = orm_tasks(user_id, list_id=list_id)
+    roots = sorted(children[None], key=lambda task: (task.created_at, task.id))
+    return jsonify([task.to_dict(children=children) for task in roots]).get_data()
+
+
+def orm_user_lists(user_id):
+    children = orm_tasks(user_id)
+    lists = TodoList.query.filter_by(user_id=user_id).order_by(TodoList.id).all()
+    return jsonify([{
+        'id': lst.id,
+        'title': lst.title,
+        'tasks': [task.to_dict(children=children) for task in children[None] if task.list_id == lst.id]
+    } for lst in lists]).get_data()
+
+
+def measure(build, rounds):
+    best = None
+    for _ in range(rounds):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    db.session.expunge_all()
+    tracemalloc.start()
+    build()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.set_defaults(users=1, lists=5, tasks=2000, depth=5)
+    args = parser.parse_args()
+
+    app = build_app()
+    with app.app_context(), app.test_request_context():
+        user = generate(**workload_options(args))[0]
+        list_id = user['lists'][0]['id']
+        cases = [
+            (f"GET /lists ({len(user['lists'])} lists)",
+             lambda: orm_user_lists(user['id']), lambda: user_lists_json(user['id']).encode()),
+            (f'GET /lists/<id>/tasks ({args.tasks} tasks)',
+             lambda: orm_list_tasks(user['id'], list_id), lambda: list_tasks_json(user['id'], list_id).encode()),
+        ]
+
+        print(f"{'response':<36} {'orm ms':>8} {'rows ms':>8} {'speedup':>8} {'orm KiB':>9} {'rows KiB':>9}")
+        for label, orm_build, row_build in cases:
+            db.session.expunge_all()
+            if orm_build() != row_build():
+                raise SystemExit(f'{label}: row serializer output differs from jsonify(to_dict)')
+            orm_ms, orm_kib = measure(orm_build, args.rounds)
+            row_ms, row_kib = measure(row_build, args.rounds)
+            print(f'{label:<36} {orm_ms:>8.1f} {row_ms:>8.1f} {orm_ms / row_ms:>7.1f}x '
+                  f'{orm_kib:>9.0f} {row_kib:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
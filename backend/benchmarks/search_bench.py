@@ -0,0 +1,122 @@
+"""Latency of the full-text task search (search.search_json) on a large table.
+
+Fills a scratch SQLite file with --tasks tasks spread over --users users,
+with titles and descriptions drawn from a Zipf-distributed vocabulary so
+some words are in a large share of tasks and most are rare. The FTS index
+is filled by the insert triggers, as in production. Then times each kind
+of query for random users. From the backend directory:
+
+    python benchmarks/search_bench.py --tasks 1000000 --users 100
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+from datetime import datetime
+
+from common import build_app, BENCH_PASSWORD
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+from models import db, User
+from search import search_json
+
+VOCABULARY = 5000
+CHUNK = 50000
+
+
+def vocabulary(rng):
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))))
+    return sorted(sorted(words), key=lambda word: rng.random())
+
+
+def seed(rng, words, users, lists, tasks):
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    created_at = datetime(2024, 1, 1)
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    db.session.execute(User.__table__.insert(), [
+        {'id': user_id, 'username': f'user{user_id}', 'password_hash': password_hash,
+         'created_at': created_at, 'revision': 1} for user_id in range(1, users + 1)])
+    db.session.execute(text(
+        'INSERT INTO todo_lists (id, title, user_id, created_at, revision) '
+        'VALUES (:id, :title, :user_id, :created_at, 1)'), [
+        {'id': list_id, 'title': f'List {list_id}', 'user_id': (list_id - 1) // lists + 1,
+         'created_at': created_at} for list_id in range(1, users * lists + 1)])
+
+    statement = text(
+        'INSERT INTO tasks (id, title, description, completed, list_id, parent_id, user_id, created_at, '
+        'is_expanded, subtask_total, subtask_completed, path, revision) VALUES '
+        "(:id, :title, :description, :completed, :list_id, NULL, :user_id, :created_at, 0, 0, 0, '/', 1)")
+    for start in range(1, tasks + 1, CHUNK):
+        rows = []
+        for task_id in range(start, min(start + CHUNK, tasks + 1)):
+            list_id = rng.randint(1, users * lists)
+            rows.append({
+                'id': task_id,
+                'title': ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(2, 6))),
+                'description': ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(0, 12))),
+                'completed': rng.random() < 0.3,
+                'list_id': list_id,
+                'user_id': (list_id - 1) // lists + 1,
+                'created_at': created_at,
+            })
+        db.session.execute(statement, rows)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--lists', type=int, default=5, help='lists per user')
+    parser.add_argument('--queries', type=int, default=50, help='queries per kind')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(rng)
+    database = os.path.join(tempfile.mkdtemp(), 'search.db')
+    app = build_app(f'sqlite:///{database}')
+    with app.app_context():
+        start = time.perf_counter()
+        seed(rng, words, args.users, args.lists, args.tasks)
+        print(f'{args.tasks} tasks for {args.users} users written and indexed in '
+              f'{time.perf_counter() - start:.1f} s ({os.path.getsize(database) / 2 ** 20:.0f} MiB)')
+
+        def list_of(user_id):
+            return (user_id - 1) * args.lists + rng.randint(1, args.lists)
+
+        kinds = [
+            ('common word', lambda user_id: {'q': rng.choice(words[:10])}),
+            ('rare word', lambda user_id: {'q': rng.choice(words[1000:])}),
+            ('2-letter prefix', lambda user_id: {'q': rng.choice(words)[:2]}),
+            ('3-letter prefix', lambda user_id: {'q': rng.choice(words)[:3]}),
+            ('two words', lambda user_id: {'q': f'{rng.choice(words[:50])} {rng.choice(words[:500])}'}),
+            ('common + list', lambda user_id: {'q': rng.choice(words[:10]), 'list_id': list_of(user_id)}),
+            ('common + completed', lambda user_id: {'q': rng.choice(words[:10]), 'completed': True}),
+            ('common, page 5', lambda user_id: {'q': rng.choice(words[:10]), 'offset': 80}),
+        ]
+
+        print(f"{'query':<20} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'results':>8}")
+        for label, make in kinds:
+            latencies, results = [], []
+            for _ in range(args.queries):
+                user_id = rng.randint(1, args.users)
+                options = make(user_id)
+                start = time.perf_counter()
+                body = search_json(user_id, **options)
+                latencies.append((time.perf_counter() - start) * 1000)
+                results.append(body.count('"id":'))
+            latencies.sort()
+            print(f'{label:<20} {statistics.median(latencies):>8.2f} '
+                  f'{latencies[int(len(latencies) * 0.95) - 1]:>8.2f} {latencies[-1]:>8.2f} '
+                  f'{statistics.mean(results):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Multi-process write throughput with the users' data in 0, 1, 2 and 4 shards.
+
+--writers processes, each with its own app and connection pool, create
+tasks through the API for --seconds, each for its own user. With 0 shards
+every user lives in the one scratch SQLite file, so the writers queue for
+its write lock; with N shards (sharding.py) the users are spread over N
+more files by id and only writers on the same shard wait for each other.
+--synchronous FULL makes every commit fsync, which is where separate files
+help most. From the backend directory:
+
+    python benchmarks/shard_bench.py --writers 4 --seconds 5 --synchronous FULL
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from common import build_app, create_user, login
+from config import Config
+from models import db, User, TodoList
+from sharding import use_shard
+
+
+def _app(uri, shard_urls, pragmas):
+    return build_app(uri, SHARD_DATABASE_URLS=shard_urls, SQLITE_PRAGMAS=pragmas)
+
+
+def writer(uri, shard_urls, pragmas, token, list_id, start, stop, counts, errors):
+    client = _app(uri, shard_urls, pragmas).test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    start.wait()
+    while not stop.is_set():
+        response = client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'burst'}, headers=headers)
+        counter = counts if response.status_code == 201 else errors
+        with counter.get_lock():
+            counter.value += 1
+
+
+def seed(app, writers):
+    users = []
+    with app.app_context():
+        for n in range(writers):
+            user_id = create_user(f'writer{n}')
+            use_shard(db.session.get(User, user_id).shard)
+            todo_list = TodoList(title='Burst', user_id=user_id)
+            db.session.add(todo_list)
+            db.session.commit()
+            list_id = todo_list.id
+            # Back to the main database, which login reads
+            db.session.remove()
+            users.append((login(app, f'writer{n}'), list_id))
+    return users
+
+
+def measure(args, shards, pragmas):
+    with tempfile.TemporaryDirectory() as scratch:
+        uri = f"sqlite:///{os.path.join(scratch, 'main.db')}"
+        shard_urls = [f"sqlite:///{os.path.join(scratch, f'shard{n}.db')}" for n in range(shards)]
+        users = seed(_app(uri, shard_urls, pragmas), args.writers)
+
+        start, stop = multiprocessing.Event(), multiprocessing.Event()
+        writes, errors = multiprocessing.Value('i', 0), multiprocessing.Value('i', 0)
+        processes = [multiprocessing.Process(
+            target=writer, args=(uri, shard_urls, pragmas, token, list_id, start, stop, writes, errors))
+            for token, list_id in users]
+        for process in processes:
+            process.start()
+        time.sleep(2)  # let every process build its app before the clock starts
+        start.set()
+        time.sleep(args.seconds)
+        stop.set()
+        for process in processes:
+            process.join()
+    return writes.value / args.seconds, errors.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--synchronous', default=Config.SQLITE_PRAGMAS['synchronous'])
+    args = parser.parse_args()
+    pragmas = dict(Config.SQLITE_PRAGMAS, synchronous=args.synchronous)
+
+    print(f"{args.writers} writer processes, {os.cpu_count()} CPUs, synchronous={args.synchronous}")
+    print(f"{'shards':>6} {'writes/s':>9} {'speedup':>8} {'errors':>7}")
+    baseline = None
+    for shards in args.shards:
+        per_second, errors = measure(args, shards, pragmas)
+        baseline = baseline or per_second
+        print(f"{shards:>6} {per_second:>9.0f} {per_second / baseline:>8.2f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Multi-process read throughput during write bursts: legacy vs tuned SQLite settings.
+
+Reader processes call GET /api/tasks/lists for one user while writer
+processes create tasks for another, each process with its own app and
+connection pool, all sharing one scratch SQLite file. Every mode measures
+reads/s with no writers, then again while the writers run. The "legacy" mode
+is the old rollback journal with synchronous=FULL; "tuned" is config.Config.
+From the backend directory:
+
+    python benchmarks/sqlite_concurrency_bench.py --readers 4 --writers 2 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from common import build_app, create_user, login, insert_task_tree
+from config import Config
+from models import db, TodoList
+
+MODES = {
+    'legacy': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000},
+    'tuned': Config.SQLITE_PRAGMAS,
+}
+
+
+def _app(uri, pragmas):
+    # The response cache would hide the database from the readers
+    return build_app(uri, SQLITE_PRAGMAS=pragmas, RESPONSE_CACHE_MAX_BYTES=0)
+
+
+def reader(uri, pragmas, token, start, stop, counts, errors):
+    client = _app(uri, pragmas).test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    start.wait()
+    while not stop.is_set():
+        if client.get('/api/tasks/lists', headers=headers).status_code == 200:
+            with counts.get_lock():
+                counts.value += 1
+        else:
+            with errors.get_lock():
+                errors.value += 1
+
+
+def writer(uri, pragmas, token, list_id, start, stop, counts, errors):
+    client = _app(uri, pragmas).test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    start.wait()
+    while not stop.is_set():
+        response = client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'burst'}, headers=headers)
+        counter = counts if response.status_code == 201 else errors
+        with counter.get_lock():
+            counter.value += 1
+
+
+def seed(uri, pragmas, tasks):
+    app = _app(uri, pragmas)
+    with app.app_context():
+        lists = {}
+        for name in ('reader', 'writer'):
+            todo_list = TodoList(title=name, user_id=create_user(name))
+            db.session.add(todo_list)
+            db.session.commit()
+            lists[name] = todo_list
+        insert_task_tree(lists['reader'].user_id, lists['reader'].id, tasks)
+        writer_list = lists['writer'].id
+    return login(app, 'reader'), login(app, 'writer'), writer_list
+
+
+def measure(args, uri, pragmas, reader_token, writer_token, writer_list, with_writers):
+    start, stop = multiprocessing.Event(), multiprocessing.Event()
+    reads, writes = multiprocessing.Value('i', 0), multiprocessing.Value('i', 0)
+    errors = multiprocessing.Value('i', 0)
+    processes = [multiprocessing.Process(target=reader, args=(uri, pragmas, reader_token, start, stop, reads, errors))
+                 for _ in range(args.readers)]
+    if with_writers:
+        processes += [multiprocessing.Process(
+            target=writer, args=(uri, pragmas, writer_token, writer_list, start, stop, writes, errors))
+            for _ in range(args.writers)]
+    for process in processes:
+        process.start()
+    time.sleep(2)  # let every process build its app before the clock starts
+    start.set()
+    time.sleep(args.seconds)
+    stop.set()
+    for process in processes:
+        process.join()
+    return reads.value / args.seconds, writes.value / args.seconds, errors.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--tasks', type=int, default=200, help='tasks in the list the readers fetch')
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'reads/s idle':>13} {'reads/s burst':>14} {'ratio':>6} {'writes/s':>9} {'errors':>7}")
+    for mode, pragmas in MODES.items():
+        with tempfile.TemporaryDirectory() as scratch:
+            uri = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+            reader_token, writer_token, writer_list = seed(uri, pragmas, args.tasks)
+            idle, _, idle_errors = measure(args, uri, pragmas, reader_token, writer_token, writer_list, False)
+            burst, writes, burst_errors = measure(args, uri, pragmas, reader_token, writer_token, writer_list, True)
+        print(f"{mode:<8} {idle:>13.0f} {burst:>14.0f} {burst / idle:>6.2f} {writes:>9.0f} "
+              f"{idle_errors + burst_errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
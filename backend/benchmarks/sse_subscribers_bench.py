@@ -0,0 +1,166 @@
+"""How many /api/tasks/stream subscribers one worker process can hold.
+
+Serves the app from a threaded Werkzeug server in this process (one thread
+per open stream, like gunicorn's gthread worker), opens N event streams
+spread over several users from a single selector loop, then commits writes
+and measures how long each change event takes to reach every subscriber of
+that user. Uses a scratch SQLite file. From the backend directory:
+
+    python benchmarks/sse_subscribers_bench.py --subscribers 100 500 1000
+"""
+import argparse
+import logging
+import os
+import re
+import resource
+import selectors
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+from common import build_app, create_user, login
+from werkzeug.serving import make_server
+from change_hub import change_hub
+from models import db, TodoList
+
+EVENT_ID = re.compile(rb'id: (\d+)\n')
+
+
+def rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class Subscribers:
+    """Open event streams, all read by one thread, recording when each event id arrives."""
+
+    def __init__(self, port):
+        self.port = port
+        self.selector = selectors.DefaultSelector()
+        self.streams = []
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def open(self, user, token):
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        sock.sendall(f'GET /api/tasks/stream?token={token} HTTP/1.1\r\nHost: bench\r\n'
+                     'Accept: text/event-stream\r\n\r\n'.encode())
+        sock.setblocking(False)
+        stream = {'user': user, 'sock': sock, 'buffer': b'', 'seen': {}}
+        with self.lock:
+            self.streams.append(stream)
+            self.selector.register(sock, selectors.EVENT_READ, stream)
+
+    def _read(self):
+        while not self.stopped:
+            with self.lock:
+                ready = self.selector.select(timeout=0) if self.streams else []
+            if not ready:
+                time.sleep(0.001)
+                continue
+            now = time.perf_counter()
+            for key, _ in ready:
+                stream = key.data
+                data = stream['sock'].recv(65536)
+                # Keep a tail in case an event id is split across reads
+                stream['buffer'] = stream['buffer'][-64:] + data
+                for match in EVENT_ID.finditer(stream['buffer']):
+                    stream['seen'].setdefault(int(match.group(1)), now)
+
+    def wait_for(self, streams, revision, timeout=60):
+        deadline = time.perf_counter() + timeout
+        while any(revision not in stream['seen'] for stream in streams):
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f'revision {revision} not delivered within {timeout}s')
+            time.sleep(0.001)
+
+    def close(self):
+        self.stopped = True
+        self.thread.join()
+        for stream in self.streams:
+            stream['sock'].close()
+
+
+def run(count, args):
+    with tempfile.TemporaryDirectory() as scratch:
+        app = build_app(f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+                        SSE_MAX_SUBSCRIBERS=count, SSE_MAX_PER_USER=count, SSE_HEARTBEAT=args.heartbeat)
+        users = []
+        with app.app_context():
+            for n in range(args.users):
+                user_id = create_user(f'user{n}')
+                todo_list = TodoList(title='Stream', user_id=user_id)
+                db.session.add(todo_list)
+                db.session.commit()
+                users.append((user_id, todo_list.id))
+        tokens = [login(app, f'user{n}') for n in range(args.users)]
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        server.socket.listen(1024)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_rss = rss_mb()
+        subscribers = Subscribers(server.port)
+
+        start = time.perf_counter()
+        for n in range(count):
+            subscribers.open(n % args.users, tokens[n % args.users])
+        # Every stream starts with an event for the user's current revision (1)
+        subscribers.wait_for(subscribers.streams, 1)
+        connect_time = time.perf_counter() - start
+        held = change_hub.stats()['subscribers']
+
+        client = app.test_client()
+        latencies = []
+        for write in range(args.writes):
+            user = write % args.users
+            streams = [stream for stream in subscribers.streams if stream['user'] == user]
+            committed = time.perf_counter()
+            response = client.post(f'/api/tasks/lists/{users[user][1]}/tasks', json={'title': 'ping'},
+                                   headers={'Authorization': f'Bearer {tokens[user]}'})
+            assert response.status_code == 201, response.get_json()
+            revision = 2 + write // args.users
+            subscribers.wait_for(streams, revision)
+            latencies.extend((stream['seen'][revision] - committed) * 1000 for stream in streams)
+
+        threads = threading.active_count()
+        rss = rss_mb() - base_rss
+        subscribers.close()
+        # Server threads notice the closed sockets at their next heartbeat
+        while change_hub.stats()['subscribers']:
+            time.sleep(0.1)
+        server.shutdown()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f'{count:>11} {held:>5} {threads:>8} {rss:>9.1f} {connect_time:>10.2f} '
+          f'{statistics.median(latencies):>8.2f} {p99:>8.2f} {latencies[-1]:>8.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[100, 500, 1000])
+    parser.add_argument('--users', type=int, default=10, help='subscribers are spread over this many users')
+    parser.add_argument('--writes', type=int, default=50)
+    parser.add_argument('--heartbeat', type=float, default=2)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # Each stream costs two descriptors here: the client socket and the server's
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    print(f"{'subscribers':>11} {'held':>5} {'threads':>8} {'+RSS (MB)':>9} {'connect s':>10} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for count in args.subscribers:
+        run(count, args)
+
+
+if __name__ == '__main__':
+    main()
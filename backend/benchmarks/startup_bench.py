@@ -0,0 +1,120 @@
+"""Import time, app creation time and time to first request in a fresh interpreter.
+
+Each run starts a new Python process that imports app, calls create_app(),
+then serves one GET /api/tasks/lists, either cold or after warm_up() (what
+gunicorn.conf.py does after fork). It also checks that importing and
+creating the app print nothing and leave the database file alone. Exits
+non-zero when a side effect shows up or a median goes over its budget, so
+it can gate changes like explain_queries.py does. From the backend
+directory:
+
+    python benchmarks/startup_bench.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import build_app, create_user, login, insert_task_tree
+from models import db, TodoList
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import contextlib, io, json, os, sys, time
+start = time.perf_counter()
+output = io.StringIO()
+with contextlib.redirect_stdout(output):
+    import app
+    imported = time.perf_counter()
+    application = app.create_app()
+    created = time.perf_counter()
+side_effects = []
+if output.getvalue():
+    side_effects.append('printed %r' % output.getvalue()[:80])
+if sorted(os.listdir(os.environ['BENCH_DB_DIR'])) != ['bench.db']:
+    side_effects.append('database directory now holds %s' % os.listdir(os.environ['BENCH_DB_DIR']))
+if os.stat(os.environ['BENCH_DB']).st_mtime_ns != int(os.environ['BENCH_DB_MTIME']):
+    side_effects.append('database file modified')
+warm_up = 0.0
+if os.environ['BENCH_WARM'] == '1':
+    before = time.perf_counter()
+    app.warm_up(application)
+    warm_up = time.perf_counter() - before
+client = application.test_client()
+before = time.perf_counter()
+response = client.get('/api/tasks/lists', headers={'Authorization': 'Bearer ' + os.environ['BENCH_TOKEN']})
+first = time.perf_counter() - before
+assert response.status_code == 200, response.status_code
+print(json.dumps({'import': imported - start, 'create_app': created - imported, 'warm_up': warm_up,
+                  'first_request': first, 'side_effects': side_effects}))
+'''
+
+
+def child_run(database, token, warm):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', BENCH_DB=database,
+               BENCH_DB_DIR=os.path.dirname(database), BENCH_DB_MTIME=str(os.stat(database).st_mtime_ns),
+               BENCH_TOKEN=token, BENCH_WARM='1' if warm else '0')
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=BACKEND, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=600)
+    parser.add_argument('--max-create-app-ms', type=float, default=100)
+    parser.add_argument('--max-first-request-ms', type=float, default=150,
+                        help='budget for the first request after warm_up')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'bench.db')
+    app = build_app(f'sqlite:///{database}')
+    with app.app_context():
+        user_id = create_user('bench')
+        todo_list = TodoList(title='Bench', user_id=user_id)
+        db.session.add(todo_list)
+        db.session.commit()
+        insert_task_tree(user_id, todo_list.id, 200)
+        db.engine.dispose()
+    token = login(app, 'bench')
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+
+    failures = []
+    print(f"{'start':<6} {'import ms':>10} {'create_app ms':>14} {'warm_up ms':>11} {'first request ms':>17}")
+    for warm in (False, True):
+        runs = []
+        for _ in range(args.runs):
+            # A fresh copy each time so no run sees another's WAL or mtime
+            copy_directory = tempfile.mkdtemp()
+            copy = os.path.join(copy_directory, 'bench.db')
+            with open(database, 'rb') as source, open(copy, 'wb') as target:
+                target.write(source.read())
+            runs.append(child_run(copy, token, warm))
+        median = {key: statistics.median(run[key] for run in runs) * 1000
+                  for key in ('import', 'create_app', 'warm_up', 'first_request')}
+        print(f"{'warm' if warm else 'cold':<6} {median['import']:>10.1f} {median['create_app']:>14.1f} "
+              f"{median['warm_up']:>11.1f} {median['first_request']:>17.1f}")
+        failures += sorted({effect for run in runs for effect in run['side_effects']})
+        if median['import'] > args.max_import_ms:
+            failures.append(f"import took {median['import']:.0f} ms (budget {args.max_import_ms:.0f})")
+        if median['create_app'] > args.max_create_app_ms:
+            failures.append(f"create_app took {median['create_app']:.0f} ms (budget {args.max_create_app_ms:.0f})")
+        if warm and median['first_request'] > args.max_first_request_ms:
+            failures.append(f"first request after warm_up took {median['first_request']:.0f} ms "
+                            f"(budget {args.max_first_request_ms:.0f})")
+
+    for failure in failures:
+        print(f'FAIL  {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Subtask write routes with full and compact (?response=compact) responses on wide parents.
+
+For every --subtasks size, seeds a parent task with that many subtasks
+in a scratch SQLite file and times --requests calls of each subtask
+route in both modes: completing a subtask (full mode returns the parent
+with every sibling), updating one, and creating one. Reports p50/p95
+latency, response size and SQL statements per request. From the backend
+directory:
+
+    python benchmarks/subtask_response_bench.py --subtasks 10 100 1000 --requests 200
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from common import build_app, create_user, login
+from sqlalchemy import event
+from models import db, Task, TodoList
+
+
+def seed(user_id, size):
+    todo_list = TodoList(title=f'{size} subtasks', user_id=user_id)
+    db.session.add(todo_list)
+    db.session.commit()
+    parent = Task(title='Parent', list_id=todo_list.id, user_id=user_id)
+    db.session.add(parent)
+    db.session.flush()
+    db.session.add_all(Task(title=f'Subtask {n}', list_id=todo_list.id, parent_id=parent.id, user_id=user_id)
+                       for n in range(size))
+    parent.subtask_total = size
+    db.session.commit()
+    return parent.id, [task.id for task in parent.subtasks]
+
+
+def count_statements(engine):
+    statements = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    return statements
+
+
+def measure(client, headers, statements, calls):
+    latencies, sizes, counts = [], [], []
+    for method, url, body in calls:
+        del statements[:]
+        start = time.perf_counter()
+        response = getattr(client, method)(url, json=body, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code not in (200, 201):
+            raise RuntimeError(response.get_json())
+        sizes.append(len(response.get_data()))
+        counts.append(len(statements))
+    latencies.sort()
+    return (statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1],
+            statistics.mean(sizes), statistics.mean(counts))
+
+
+def route_calls(rng, parent_id, subtask_ids, requests, query):
+    return {
+        'complete': [('put', f'/api/tasks/complete/subtask/{rng.choice(subtask_ids)}{query}',
+                      {'completed': rng.random() < 0.5}) for _ in range(requests)],
+        'update': [('put', f'/api/tasks/update/{parent_id}/subtasks/update/{rng.choice(subtask_ids)}{query}',
+                    {'completed': rng.random() < 0.5}) for _ in range(requests)],
+        'create': [('post', f'/api/tasks/add/{parent_id}/subtasks/create{query}', {'title': 'More'})
+                   for _ in range(requests)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subtasks', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--requests', type=int, default=200, help='calls per route and mode')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    database = os.path.join(tempfile.mkdtemp(), 'subtasks.db')
+    app = build_app(f'sqlite:///{database}')
+    client = app.test_client()
+    with app.app_context():
+        user_id = create_user('subtasks')
+        headers = {'Authorization': f"Bearer {login(app, 'subtasks')}"}
+        statements = count_statements(db.engine)
+
+        print(f"{'subtasks':>8} {'route':>8} {'mode':>8} {'p50 ms':>7} {'p95 ms':>7} {'bytes':>8} {'queries':>8}")
+        for size in args.subtasks:
+            parent_id, subtask_ids = seed(user_id, size)
+            db.session.remove()
+            for mode, query in (('full', ''), ('compact', '?response=compact')):
+                for route, calls in route_calls(rng, parent_id, subtask_ids, args.requests, query).items():
+                    p50, p95, size_bytes, queries = measure(client, headers, statements, calls)
+                    print(f'{size:>8} {route:>8} {mode:>8} {p50:>7.2f} {p95:>7.2f} {size_bytes:>8.0f} {queries:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Per-request overhead of token_required with and without the token cache.
+
+Runs against an in-memory SQLite database, so it never touches
+instance/todo.db. From the backend directory:
+
+    python benchmarks/token_required_bench.py --requests 20000
+"""
+import argparse
+import time
+
+from common import build_app, create_user, login
+from flask import jsonify
+from models import db
+from routes.auth_routes import token_required
+from token_cache import token_cache
+
+
+def run(app, token, requests, ttl):
+    app.config['TOKEN_CACHE_TTL'] = ttl
+    token_cache.clear()
+    view = app.view_functions['ping']
+    headers = {'Authorization': f'Bearer {token}'}
+    with app.test_request_context('/ping', headers=headers):
+        view()  # warm up
+        start = time.perf_counter()
+        for _ in range(requests):
+            view()
+        elapsed = time.perf_counter() - start
+        db.session.remove()
+    return elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = build_app()
+
+    @app.route('/ping')
+    @token_required
+    def ping(current_user):
+        return jsonify({'id': current_user.id})
+
+    with app.app_context():
+        create_user('bench')
+    token = login(app, 'bench')
+
+    uncached = run(app, token, args.requests, ttl=0)
+    cached = run(app, token, args.requests, ttl=60)
+    print(f"token_required without cache: {uncached:8.1f} us/request")
+    print(f"token_required with cache:    {cached:8.1f} us/request")
+    print(f"speedup: {uncached / cached:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
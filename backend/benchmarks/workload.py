@@ -0,0 +1,150 @@
+"""Generate a reproducible synthetic dataset of users, lists and task trees.
+
+The same arguments and --seed always produce the same rows, so runs of the
+route benchmark (route_bench.py) against two versions of the code compare
+like with like. Writes into a scratch SQLite file, never instance/todo.db.
+From the backend directory:
+
+    python benchmarks/workload.py /tmp/workload.db --users 20 --lists 5 --tasks 500 --depth 4
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from common import build_app, BENCH_PASSWORD
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+from models import db, User
+
+DEFAULTS = {
+    'users': 5,
+    'lists': 3,
+    'tasks': 200,
+    'depth': 4,
+    'completed': 0.3,
+    'roots': 0.2,
+    'seed': 0,
+}
+
+
+def _next_id(table):
+    return (db.session.execute(text(f'SELECT MAX(id) FROM {table}')).scalar() or 0) + 1
+
+
+def _task_tree(rng, first_id, count, depth, completed, roots):
+    # Each new task is a root with probability `roots` (and always the first);
+    # otherwise it hangs under a random earlier task less than `depth` deep
+    tasks, open_parents = [], []
+    for n in range(count):
+        task_id = first_id + n
+        if open_parents and rng.random() >= roots:
+            parent = tasks[rng.choice(open_parents) - first_id]
+        else:
+            parent = None
+        level = parent['level'] + 1 if parent else 0
+        tasks.append({
+            'id': task_id,
+            'parent_id': parent['id'] if parent else None,
+            'path': f"{parent['path']}{parent['id']}/" if parent else '/',
+            'level': level,
+            'completed': rng.random() < completed,
+            'subtask_total': 0,
+            'subtask_completed': 0,
+        })
+        if parent:
+            parent['subtask_total'] += 1
+            parent['subtask_completed'] += tasks[-1]['completed']
+        if level + 1 < depth:
+            open_parents.append(task_id)
+    return tasks
+
+
+def generate(users=DEFAULTS['users'], lists=DEFAULTS['lists'], tasks=DEFAULTS['tasks'],
+             depth=DEFAULTS['depth'], completed=DEFAULTS['completed'], roots=DEFAULTS['roots'],
+             seed=DEFAULTS['seed']):
+    """Insert the dataset into the current app's database; returns its manifest.
+
+    Must run inside an app context. `tasks` is per list, `depth` the number
+    of task levels including the roots, `completed` the fraction of tasks
+    marked done. Every user's password is common.BENCH_PASSWORD. The manifest
+    is a list of {'id', 'username', 'lists': [{'id', 'task_ids', 'root_ids'}]}.
+    """
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(BENCH_PASSWORD)  # one hash, shared by all users
+    created_at = datetime(2024, 1, 1)
+    user_id, list_id, task_id = _next_id('users'), _next_id('todo_lists'), _next_id('tasks')
+    user_rows, list_rows, task_rows, manifest = [], [], [], []
+
+    for n in range(users):
+        user = {'id': user_id, 'username': f'user{user_id}', 'lists': []}
+        user_rows.append({'id': user_id, 'username': user['username'], 'password_hash': password_hash,
+                          'created_at': created_at, 'revision': 1})
+        for _ in range(lists):
+            list_rows.append({'id': list_id, 'title': f'List {list_id}', 'user_id': user_id,
+                              'created_at': created_at, 'revision': 1})
+            tree = _task_tree(rng, task_id, tasks, depth, completed, roots)
+            for offset, task in enumerate(tree):
+                task_rows.append(dict(task, title=f"Task {task['id']}", description='',
+                                      list_id=list_id, user_id=user_id, is_expanded=rng.random() < 0.5,
+                                      created_at=created_at + timedelta(seconds=offset), revision=1))
+            user['lists'].append({
+                'id': list_id,
+                'task_ids': [task['id'] for task in tree],
+                'root_ids': [task['id'] for task in tree if task['parent_id'] is None],
+            })
+            list_id += 1
+            task_id += tasks
+        manifest.append(user)
+        user_id += 1
+
+    db.session.execute(User.__table__.insert(), user_rows)
+    if list_rows:
+        db.session.execute(text(
+            'INSERT INTO todo_lists (id, title, user_id, created_at, revision) '
+            'VALUES (:id, :title, :user_id, :created_at, :revision)'), list_rows)
+    if task_rows:
+        db.session.execute(text(
+            'INSERT INTO tasks (id, title, description, completed, list_id, parent_id, user_id, '
+            'created_at, is_expanded, subtask_total, subtask_completed, path, revision) VALUES '
+            '(:id, :title, :description, :completed, :list_id, :parent_id, :user_id, '
+            ':created_at, :is_expanded, :subtask_total, :subtask_completed, :path, :revision)'), task_rows)
+    db.session.commit()
+    return manifest
+
+
+def add_arguments(parser):
+    parser.add_argument('--users', type=int, default=DEFAULTS['users'])
+    parser.add_argument('--lists', type=int, default=DEFAULTS['lists'], help='lists per user')
+    parser.add_argument('--tasks', type=int, default=DEFAULTS['tasks'], help='tasks per list')
+    parser.add_argument('--depth', type=int, default=DEFAULTS['depth'], help='task levels, roots included')
+    parser.add_argument('--completed', type=float, default=DEFAULTS['completed'],
+                        help='fraction of tasks marked completed')
+    parser.add_argument('--roots', type=float, default=DEFAULTS['roots'],
+                        help='probability that a new task is top-level')
+    parser.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+
+
+def workload_options(args):
+    return {name: getattr(args, name) for name in DEFAULTS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='scratch SQLite file to create')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        sys.exit(f'{args.database} already exists; pick a new file')
+    app = build_app(f'sqlite:///{os.path.abspath(args.database)}')
+    with app.app_context():
+        manifest = generate(**workload_options(args))
+    task_count = sum(len(lst['task_ids']) for user in manifest for lst in user['lists'])
+    print(f'{len(manifest)} users, {sum(len(user["lists"]) for user in manifest)} lists, '
+          f'{task_count} tasks written to {args.database} (password {BENCH_PASSWORD!r})')
+
+
+if __name__ == '__main__':
+    main()
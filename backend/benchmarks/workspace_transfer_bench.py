@@ -0,0 +1,96 @@
+"""Throughput and memory of the NDJSON workspace import and export (workspace.py).
+
+Writes a synthetic export of --tasks tasks (random trees up to --depth
+levels deep, spread over --lists lists) to a scratch file, imports it for
+one user of a scratch SQLite database, exports that user again, then
+re-imports the export for a second user. Reports rows per second for each
+step, then exports once more under tracemalloc to show the export's peak
+Python memory does not grow with the workspace. From the backend directory:
+
+    python benchmarks/workspace_transfer_bench.py --tasks 1000000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from common import build_app, create_user
+from models import db
+from workspace import export_lines, import_lines, DEFAULT_IMPORT_CHUNK
+
+
+def write_export(path, rng, lists, tasks, depth):
+    depths = {}
+    with open(path, 'w') as output:
+        output.write('{"export":{"version":1}}\n')
+        for list_id in range(1, lists + 1):
+            output.write(json.dumps({'list': {'id': list_id, 'title': f'List {list_id}',
+                                              'created_at': '2024-01-01T00:00:00'}}) + '\n')
+        for task_id in range(1, tasks + 1):
+            # Half the tasks are subtasks of one of the last few hundred tasks
+            parent_id = None
+            if task_id > 1 and rng.random() < 0.5:
+                candidate = rng.randint(max(1, task_id - 500), task_id - 1)
+                if depths[candidate] < depth:
+                    parent_id = candidate
+            depths[task_id] = depths[parent_id] + 1 if parent_id else 1
+            depths.pop(task_id - 500, None)
+            output.write(json.dumps({'task': {
+                'id': task_id, 'title': f'Task {task_id}', 'description': 'Imported by the benchmark',
+                'completed': rng.random() < 0.3, 'list_id': rng.randint(1, lists), 'parent_id': parent_id,
+                'is_expanded': True, 'created_at': '2024-01-01T00:00:00'}}) + '\n')
+
+
+def measured(label, records, step):
+    start = time.perf_counter()
+    result = step()
+    seconds = time.perf_counter() - start
+    print(f'{label:<10} {records:>9} {seconds:>8.1f} {records / seconds:>10.0f}')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=200000)
+    parser.add_argument('--lists', type=int, default=20)
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_IMPORT_CHUNK)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    source, exported = os.path.join(directory, 'source.ndjson'), os.path.join(directory, 'export.ndjson')
+    write_export(source, random.Random(args.seed), args.lists, args.tasks, args.depth)
+    app = build_app(f"sqlite:///{os.path.join(directory, 'transfer.db')}")
+    records = args.lists + args.tasks
+
+    with app.app_context():
+        first, second = create_user('source'), create_user('copy')
+        print(f"{'step':<10} {'records':>9} {'seconds':>8} {'records/s':>10}")
+
+        def import_file(user_id, path):
+            with open(path, 'rb') as lines:
+                return import_lines(user_id, lines, args.chunk_size)
+
+        def export_file(user_id, path):
+            with open(path, 'w') as output:
+                for chunk in export_lines(user_id):
+                    output.write(chunk)
+            db.session.rollback()
+
+        measured('import', records, lambda: import_file(first, source))
+        measured('export', records, lambda: export_file(first, exported))
+        measured('re-import', records, lambda: import_file(second, exported))
+
+        # Separate pass: tracemalloc slows allocation-heavy code down severalfold
+        tracemalloc.start()
+        export_file(second, exported)
+        print(f'export peak Python memory: {tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f} MiB')
+        tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    main()
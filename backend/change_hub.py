@@ -0,0 +1,133 @@
+import threading
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models import User
+
+DEFAULT_MAX_SUBSCRIBERS = 500
+DEFAULT_MAX_PER_USER = 10
+DEFAULT_HEARTBEAT = 15
+DEFAULT_IDLE_TIMEOUT = 300
+# Reconnect delay the stream asks EventSource clients to use, in milliseconds
+RETRY_MS = 3000
+
+
+class _Channel:
+    # Everything a user's subscribers share: the newest committed revision
+    # and a condition to wake them when it moves
+    def __init__(self):
+        self.revision = 0
+        self.subscribers = 0
+        self.condition = threading.Condition()
+
+
+class ChangeHub:
+    """In-process fan-out of committed user revisions to stream subscribers.
+
+    A subscriber only ever needs the newest revision (the changes themselves
+    come from GET /api/tasks/changes), so each user has one shared slot
+    instead of a queue per connection. A slow client skips straight to the
+    latest revision and memory stays constant however far behind it falls.
+    """
+
+    def __init__(self, max_subscribers=DEFAULT_MAX_SUBSCRIBERS, max_per_user=DEFAULT_MAX_PER_USER):
+        self.max_subscribers = max_subscribers
+        self.max_per_user = max_per_user
+        self.subscribers = 0
+        self.published = 0
+        self.rejected = 0
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Register a subscriber; returns its channel, or None when a limit is hit."""
+        with self._lock:
+            channel = self._channels.get(user_id)
+            if (self.subscribers >= self.max_subscribers
+                    or (channel is not None and channel.subscribers >= self.max_per_user)):
+                self.rejected += 1
+                return None
+            if channel is None:
+                channel = self._channels[user_id] = _Channel()
+            channel.subscribers += 1
+            self.subscribers += 1
+            return channel
+
+    def unsubscribe(self, user_id):
+        with self._lock:
+            channel = self._channels.get(user_id)
+            if channel is None:
+                return
+            channel.subscribers -= 1
+            self.subscribers -= 1
+            if not channel.subscribers:
+                del self._channels[user_id]
+
+    def publish(self, user_id, revision):
+        with self._lock:
+            channel = self._channels.get(user_id)
+        if channel is None:
+            return
+        with channel.condition:
+            if revision > channel.revision:
+                channel.revision = revision
+                self.published += 1
+                channel.condition.notify_all()
+
+    def wait(self, channel, last_seen, timeout):
+        """Block until the channel moves past last_seen; None on timeout."""
+        with channel.condition:
+            if channel.condition.wait_for(lambda: channel.revision > last_seen, timeout):
+                return channel.revision
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._channels),
+                'subscribers': self.subscribers,
+                'max_subscribers': self.max_subscribers,
+                'published': self.published,
+                'rejected': self.rejected
+            }
+
+
+change_hub = ChangeHub()
+
+
+def read_revision(engine, user_id):
+    # Its own short-lived connection, so an open stream never pins one
+    with engine.connect() as conn:
+        return conn.execute(select(User.revision).where(User.id == user_id)).scalar() or 0
+
+
+def event_stream(hub, channel, engine, user_id, last_seen, heartbeat, idle_timeout):
+    """text/event-stream body: one `change` event per revision the client has not seen.
+
+    Runs outside the request context. Between events it sends a comment line
+    every `heartbeat` seconds, which also notices clients that went away,
+    and re-reads the revision from the database to pick up writes committed
+    by other worker processes. After `idle_timeout` seconds without a change
+    the stream ends and EventSource reconnects with Last-Event-ID.
+    """
+    yield f'retry: {RETRY_MS}\n\n'
+    revision = read_revision(engine, user_id)
+    idle = 0
+    while True:
+        if revision > last_seen:
+            last_seen, idle = revision, 0
+            yield f'id: {revision}\nevent: change\ndata: {{"revision":{revision}}}\n\n'
+        revision = hub.wait(channel, last_seen, heartbeat)
+        if revision is None:
+            idle += heartbeat
+            if idle >= idle_timeout:
+                return
+            yield ': ping\n\n'
+            revision = read_revision(engine, user_id)
+
+
+# Registered ahead of models._forget_revisions, which drops the revisions
+# this transaction allocated once it commits
+@event.listens_for(Session, 'after_commit', insert=True)
+def _publish_revisions(session):
+    for user_id, revision in session.info.get('revisions', {}).items():
+        change_hub.publish(user_id, revision)
@@ -1,3 +1,83 @@
+import os
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
 class Config:
-    SECRET_KEY = 'your-secret-key-here'  # Change this to a secure random string
-    # ... other config options
\ No newline at end of file
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here')  # Change this to a secure random string
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', f"sqlite:///{os.path.join(basedir, 'instance', 'todo.db')}")
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool per worker process. A gunicorn sync worker handles one
+    # request at a time, so it needs about as many connections as threads.
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', _env_int('GUNICORN_THREADS', 1) + 1)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 2)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 10)
+
+    # Applied to every new SQLite connection (see database.py). WAL lets
+    # readers proceed while a writer holds the lock; synchronous=NORMAL is
+    # durable in WAL mode except for the last commits on power loss.
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        # Negative values are KiB rather than pages
+        'cache_size': -_env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024),
+    }
+
+    # Requests and SQL statements slower than these are logged (see metrics.py).
+    # /metrics requires METRICS_TOKEN as a bearer token and is closed (403)
+    # while it is unset; METRICS_ENABLED=0 turns the instrumentation and
+    # /metrics off. Counters live in each process: processes that share a
+    # METRICS_DIR report their combined totals on every scrape (gunicorn.conf.py
+    # makes one per server), otherwise each scrape sees one worker only.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    SLOW_REQUEST_MS = _env_int('SLOW_REQUEST_MS', 500)
+    SLOW_QUERY_MS = _env_int('SLOW_QUERY_MS', 100)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+
+    # Password hashing runs on a pool of PASSWORD_HASH_WORKERS processes
+    # (0 = on the request thread) with at most PASSWORD_HASH_QUEUE_DEPTH
+    # more waiting; past that signup/login answer 503 (see password_hasher.py).
+    # Stored hashes are upgraded to PASSWORD_HASH_METHOD on the next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = _env_int('PASSWORD_HASH_WORKERS', 1)
+    PASSWORD_HASH_QUEUE_DEPTH = _env_int('PASSWORD_HASH_QUEUE_DEPTH', 4)
+    PASSWORD_HASH_TIMEOUT = _env_int('PASSWORD_HASH_TIMEOUT', 10)
+    PASSWORD_HASH_NICE = _env_int('PASSWORD_HASH_NICE', 10)
+
+    # `flask archive-tasks` moves task trees completed more than
+    # ARCHIVE_AFTER_DAYS ago to archived_tasks, ARCHIVE_BATCH_ROWS tasks per
+    # transaction with ARCHIVE_PAUSE_MS between transactions (see archive.py).
+    ARCHIVE_AFTER_DAYS = _env_int('ARCHIVE_AFTER_DAYS', 90)
+    ARCHIVE_BATCH_ROWS = _env_int('ARCHIVE_BATCH_ROWS', 1000)
+    ARCHIVE_PAUSE_MS = _env_int('ARCHIVE_PAUSE_MS', 50)
+
+    # `flask prune-tombstones` deletes tombstones older than this; clients
+    # that last synced before them get a full resync (see sync.py).
+    TOMBSTONE_RETENTION_DAYS = _env_int('TOMBSTONE_RETENTION_DAYS', 30)
+
+    # Request threads of this worker process, set by gunicorn.conf.py after
+    # the fork. Every open /stream holds one, so the stream is refused with
+    # fewer than 2 and limited to one less; None (e.g. the Flask dev server)
+    # leaves only SSE_MAX_SUBSCRIBERS.
+    SERVER_THREADS = None
+
+    # Expand/collapse toggles are buffered in memory and written in one
+    # transaction every EXPANSION_FLUSH_MS, or once EXPANSION_MAX_PENDING
+    # tasks are waiting (see expansion_buffer.py). 0 writes each one through.
+    EXPANSION_FLUSH_MS = _env_int('EXPANSION_FLUSH_MS', 1000)
+    EXPANSION_MAX_PENDING = _env_int('EXPANSION_MAX_PENDING', 1000)
+
+    # Optional sharding: comma-separated URLs of SQLite databases that hold
+    # users' lists and tasks, placed by user id. The main database keeps the
+    # accounts (and the data of users not moved yet; see sharding.py).
+    SHARD_DATABASE_URLS = [url for url in os.environ.get('SHARD_DATABASE_URLS', '').split(',') if url]
@@ -0,0 +1,87 @@
+import os
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from models import db
+from migrations import upgrade
+from sharding import bind_key
+
+MEMORY_DATABASES = (None, '', ':memory:')
+
+_schema_lock = threading.Lock()
+
+
+def _is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in MEMORY_DATABASES
+
+
+def engine_options(config, uri=None):
+    """SQLAlchemy engine options for the configured database (or the one at uri).
+
+    Pool sizing only applies to file-backed SQLite (and other servers);
+    in-memory SQLite uses a single shared connection.
+    """
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+    if make_url(uri).get_backend_name() == 'sqlite' and not _is_file_sqlite(uri):
+        return {}
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 2),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+    }
+
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+    return on_connect
+
+
+def init_db(app):
+    """db.init_app plus pool sizing, shard binds and per-connection SQLite pragmas."""
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    # Binds given as dicts do not inherit SQLALCHEMY_ENGINE_OPTIONS
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for shard, url in enumerate(app.config.get('SHARD_DATABASE_URLS') or ()):
+        binds[bind_key(shard)] = dict(engine_options(app.config, url), url=url)
+    db.init_app(app)
+
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if pragmas:
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.url.get_backend_name() == 'sqlite':
+                    event.listen(engine, 'connect', _apply_pragmas(pragmas))
+
+
+def ensure_schema(app):
+    """Create missing tables and apply pending migrations, once per app.
+
+    Covers the main database and every shard, creating SQLite files (and
+    their directories) if needed. Cheap after the first call, so it can run
+    before every request. Returns the names of the migrations this call
+    applied, prefixed with the shard's bind key for shards.
+    """
+    if app.extensions.get('schema_ready'):
+        return []
+    with _schema_lock, app.app_context():
+        if app.extensions.get('schema_ready'):
+            return []
+        applied = []
+        for key, engine in db.engines.items():
+            db_path = engine.url.database if _is_file_sqlite(engine.url) else None
+            is_new_file = db_path is not None and not os.path.exists(db_path)
+            if is_new_file:
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), mode=0o777, exist_ok=True)
+            db.metadata.create_all(engine)
+            if is_new_file:
+                os.chmod(db_path, 0o666)
+            applied += [name if key is None else f'{key}: {name}' for name in upgrade(engine)]
+        app.extensions['schema_ready'] = True
+        return applied
@@ -0,0 +1,206 @@
+import atexit
+import itertools
+import os
+import threading
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import bindparam, event
+from sqlalchemy.orm.attributes import set_committed_value
+from models import db, Task, User
+
+DEFAULT_FLUSH_MS = 1000
+DEFAULT_MAX_PENDING = 1000
+
+
+class ExpansionBuffer:
+    """Write-behind buffer for Task.is_expanded, the expand/collapse state of the UI.
+
+    Toggles are recorded in memory instead of committed one by one. Repeated
+    toggles of a task collapse into its latest value, and a background
+    thread writes everything pending in one transaction every `flush_ms`
+    milliseconds, sooner once `max_pending` tasks are waiting, and at exit.
+    Until then this process reads its own writes: task_json and loaded Task
+    objects show the buffered values, and version() moves the user's
+    response cache key. Other worker processes see a toggle once it is
+    flushed, which bumps the user's revision like any other write.
+    """
+
+    def __init__(self, flush_ms=DEFAULT_FLUSH_MS, max_pending=DEFAULT_MAX_PENDING):
+        self.flush_ms = flush_ms
+        self.max_pending = max_pending
+        # (user id, task id) -> buffered is_expanded, read by task_json for
+        # every row; mutated in place, never rebound. Task ids are only unique
+        # within one database, and shards are separate databases, so the owner
+        # is part of the key.
+        self.values = {}
+        self.buffered = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        # (user id, task id) -> (sequence number of its latest toggle, shard
+        # engine the toggle was routed to or None; see sharding.py)
+        self._entries = {}
+        # user id -> [pending tasks, sequence number of the latest toggle]
+        self._users = {}
+        self._sequence = itertools.count(1)
+        self._app = None
+        self._flusher_pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def configure(self, flush_ms, max_pending):
+        self.flush_ms = flush_ms
+        self.max_pending = max_pending
+
+    @property
+    def enabled(self):
+        return self.flush_ms > 0
+
+    def buffer(self, task, expanded):
+        """Record a new is_expanded for a loaded task without writing it."""
+        set_committed_value(task, 'is_expanded', expanded)
+        key = (task.user_id, task.id)
+        with self._lock:
+            sequence = next(self._sequence)
+            if key not in self._entries:
+                self._users.setdefault(task.user_id, [0, 0])[0] += 1
+            else:
+                self.coalesced += 1
+            self._entries[key] = (sequence, db.session.info.get('shard'))
+            self.values[key] = expanded
+            self._users[task.user_id][1] = sequence
+            self.buffered += 1
+            self._start_flusher()
+            full = len(self._entries) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def discard(self, user_id, task_id):
+        """Forget a buffered value that a direct write is replacing."""
+        with self._lock:
+            self._forget((user_id, task_id))
+
+    def version(self, user_id):
+        """Part of the response cache key: changes with every buffered toggle of the user."""
+        user = self._users.get(user_id)
+        return (os.getpid(), user[1]) if user else 0
+
+    def flush(self):
+        """Write every buffered value in one transaction; returns the number of tasks."""
+        with self._lock:
+            batch = dict(self._entries)
+            values = {key: self.values[key] for key in batch}
+            app = self._app
+        if not batch:
+            return 0
+        by_database = defaultdict(lambda: defaultdict(list))
+        for (user_id, task_id), (_, shard) in batch.items():
+            by_database[shard][user_id].append({'task_id': task_id, 'expanded': values[user_id, task_id]})
+
+        tasks = Task.__table__
+        # Keys written, and keys dropped because they can never be written
+        written, dropped = [], []
+        with app.app_context():
+            try:
+                # One transaction per database
+                for shard, by_user in by_database.items():
+                    db.session.info['shard'] = shard
+                    stamped = []
+                    for user_id, rows in by_user.items():
+                        keys = [(user_id, row['task_id']) for row in rows]
+                        try:
+                            revision = User.bump_revision(user_id)
+                        except LookupError:
+                            app.logger.warning('Dropping %d buffered is_expanded values of user %s, '
+                                               'whose tasks moved to another database', len(rows), user_id)
+                            dropped += keys
+                            continue
+                        db.session.execute(
+                            tasks.update().where(tasks.c.id == bindparam('task_id'), tasks.c.user_id == user_id)
+                            .values(is_expanded=bindparam('expanded'), revision=revision),
+                            rows)
+                        stamped += keys
+                    db.session.commit()
+                    written += stamped
+            except Exception as e:
+                db.session.rollback()
+                self.failed_flushes += 1
+                app.logger.warning('Flushing %d buffered is_expanded values failed: %s',
+                                   len(batch) - len(written) - len(dropped), e)
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            # Toggles that arrived during the write stay for the next flush
+            for key in written + dropped:
+                if self._entries.get(key, (None, None))[0] == batch[key][0]:
+                    self._forget(key)
+            if len(written) + len(dropped) == len(batch):
+                self.flushes += 1
+            self.flushed_rows += len(written)
+        return len(written)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._entries),
+                'buffered': self.buffered,
+                'coalesced': self.coalesced,
+                'flushes': self.flushes,
+                'flushed_rows': self.flushed_rows,
+                'failed_flushes': self.failed_flushes,
+                'flush_ms': self.flush_ms,
+                'max_pending': self.max_pending
+            }
+
+    def _forget(self, key):
+        # Called with the lock held
+        if self._entries.pop(key, None) is None:
+            return
+        self.values.pop(key, None)
+        user_id = key[0]
+        user = self._users[user_id]
+        user[0] -= 1
+        if not user[0]:
+            del self._users[user_id]
+
+    def _start_flusher(self):
+        # Called with the lock held. Threads do not survive a fork, so each
+        # gunicorn worker starts its own on its first toggle.
+        if self._flusher_pid == os.getpid():
+            return
+        if self._flusher_pid is None:
+            atexit.register(self.flush)
+        self._app = current_app._get_current_object()
+        self._flusher_pid = os.getpid()
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name='expansion-buffer', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_ms / 1000)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Keep the thread alive; the entries stay for the next flush
+                self._app.logger.warning('Expansion buffer flush failed: %s', e)
+
+
+expansion_buffer = ExpansionBuffer()
+
+
+@event.listens_for(Task, 'load')
+@event.listens_for(Task, 'refresh')
+def _show_buffered_value(target, *args):
+    key = (target.user_id, target.id)
+    if key in expansion_buffer.values:
+        set_committed_value(target, 'is_expanded', expansion_buffer.values[key])
+
+
+@event.listens_for(Task.is_expanded, 'set')
+def _drop_buffered_value(target, value, oldvalue, initiator):
+    # A direct write wins over an older buffered toggle
+    if target.id is not None:
+        expansion_buffer.discard(target.user_id, target.id)
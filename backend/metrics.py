@@ -0,0 +1,319 @@
+import atexit
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import request, current_app, jsonify
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from models import db
+
+DEFAULT_SLOW_REQUEST_MS = 500
+DEFAULT_SLOW_QUERY_MS = 100
+# How often each process writes its totals to METRICS_DIR
+SHARE_INTERVAL = 5
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# (name, help, buckets, Sample attribute) for each per-endpoint histogram
+HISTOGRAMS = (
+    ('http_request_duration_seconds', 'Wall time from the start of the request until the body is sent.',
+     SECONDS_BUCKETS, 'duration'),
+    ('http_request_sql_statements', 'SQL statements executed per request.', COUNT_BUCKETS, 'statements'),
+    ('http_request_sql_duration_seconds', 'Time spent executing SQL per request.', SECONDS_BUCKETS, 'sql_time'),
+    ('http_request_serialize_duration_seconds', 'Time spent encoding JSON per request.',
+     SECONDS_BUCKETS, 'serialize_time'),
+    ('http_response_size_bytes', 'Response body size.', BYTES_BUCKETS, 'size'),
+)
+
+# The request being handled on this thread, if any
+_current = threading.local()
+
+
+class Sample:
+    __slots__ = ('start', 'duration', 'statements', 'sql_time', 'serialize_time', 'size')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.statements = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.size = 0
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Request histograms and counters, keyed by (endpoint, method).
+
+    Counted per process. After share(directory) each process also writes
+    its totals to a file there every SHARE_INTERVAL seconds (and at exit),
+    and render() adds up the files of every process, so a scrape that lands
+    on any one gunicorn worker reports all of them.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.requests = {}
+        self.slow_requests = {}
+        self.slow_queries = 0
+        self.directory = None
+        self._path = None
+        self._writer_pid = None
+        self._lock = threading.Lock()
+
+    def share(self, directory):
+        self.directory = directory
+
+    def record(self, endpoint, method, status, sample, slow, streaming=False):
+        key = (endpoint, method)
+        with self._lock:
+            self._start_writer()
+            status_key = key + (status,)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if slow:
+                self.slow_requests[key] = self.slow_requests.get(key, 0) + 1
+            # An event stream lasts as long as the client stays connected,
+            # which would swamp the latency histograms
+            if streaming:
+                return
+            histograms = self.histograms.get(key)
+            if histograms is None:
+                histograms = self.histograms[key] = [Histogram(buckets) for _, _, buckets, _ in HISTOGRAMS]
+            for histogram, (_, _, _, attribute) in zip(histograms, HISTOGRAMS):
+                histogram.observe(getattr(sample, attribute))
+
+    def slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.requests.clear()
+            self.slow_requests.clear()
+            self.slow_queries = 0
+
+    def snapshot(self):
+        """This process's totals as JSON-friendly lists."""
+        with self._lock:
+            return {
+                'histograms': [[endpoint, method, [[list(h.counts), h.sum, h.count] for h in value]]
+                               for (endpoint, method), value in self.histograms.items()],
+                'requests': [list(key) + [count] for key, count in self.requests.items()],
+                'slow_requests': [list(key) + [count] for key, count in self.slow_requests.items()],
+                'slow_queries': self.slow_queries
+            }
+
+    def write_snapshot(self):
+        """Write snapshot() to this process's file in the shared directory, if it has one."""
+        path = self._path
+        if path is None or self._writer_pid != os.getpid():
+            return
+        try:
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f'{path}.tmp', path)
+        except OSError:
+            # The directory went away (the server is shutting down)
+            pass
+
+    def render(self):
+        """The totals, of every sharing process when shared, in the Prometheus text format."""
+        snapshots = [self.snapshot()]
+        if self.directory is not None:
+            for name in sorted(os.listdir(self.directory)):
+                path = os.path.join(self.directory, name)
+                if name.endswith('.json') and path != self._path:
+                    try:
+                        with open(path) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        # Replaced or removed while listing
+                        continue
+
+        histograms, requests, slow_requests, slow_queries = {}, {}, {}, 0
+        for snapshot in snapshots:
+            for endpoint, method, values in snapshot['histograms']:
+                totals = histograms.setdefault((endpoint, method), [
+                    [[0] * (len(buckets) + 1), 0, 0] for _, _, buckets, _ in HISTOGRAMS])
+                for total, (counts, value_sum, count) in zip(totals, values):
+                    total[0] = [a + b for a, b in zip(total[0], counts)]
+                    total[1] += value_sum
+                    total[2] += count
+            for *key, count in snapshot['requests']:
+                requests[tuple(key)] = requests.get(tuple(key), 0) + count
+            for *key, count in snapshot['slow_requests']:
+                slow_requests[tuple(key)] = slow_requests.get(tuple(key), 0) + count
+            slow_queries += snapshot['slow_queries']
+
+        lines = []
+        for index, (name, help_text, buckets, _) in enumerate(HISTOGRAMS):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (endpoint, method), values in sorted(histograms.items()):
+                counts, total, count = values[index]
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{labels}}} {total}')
+                lines.append(f'{name}_count{{{labels}}} {count}')
+
+        lines += ['# HELP http_requests_total Requests handled, by response status.',
+                  '# TYPE http_requests_total counter']
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+        lines += ['# HELP http_slow_requests_total Requests slower than SLOW_REQUEST_MS.',
+                  '# TYPE http_slow_requests_total counter']
+        for (endpoint, method), count in sorted(slow_requests.items()):
+            lines.append(f'http_slow_requests_total{{endpoint="{endpoint}",method="{method}"}} {count}')
+        lines += ['# HELP db_slow_queries_total SQL statements slower than SLOW_QUERY_MS.',
+                  '# TYPE db_slow_queries_total counter',
+                  f'db_slow_queries_total {slow_queries}']
+        return '\n'.join(lines) + '\n'
+
+    def _start_writer(self):
+        # Called with the lock held. Threads do not survive a fork, so each
+        # gunicorn worker starts its own on its first request. The file name
+        # carries the start time too, so a later process that gets the same
+        # pid does not overwrite (and seem to reset) this one's counters.
+        if self.directory is None or self._writer_pid == os.getpid():
+            return
+        if self._writer_pid is None:
+            atexit.register(self.write_snapshot)
+        self._writer_pid = os.getpid()
+        self._path = os.path.join(self.directory, f'metrics-{os.getpid()}-{time.time_ns()}.json')
+        threading.Thread(target=self._run, name='metrics-writer', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(SHARE_INTERVAL)
+            self.write_snapshot()
+
+
+metrics = MetricsRegistry()
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, adding encode time to the current request's sample."""
+
+    def dumps(self, obj, **kwargs):
+        sample = getattr(_current, 'sample', None)
+        if sample is None:
+            return super().dumps(obj, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            sample.serialize_time += time.perf_counter() - start
+
+
+def _counted(chunks, sample):
+    # Streamed bodies have no Content-Length; count them as they are sent
+    try:
+        for chunk in chunks:
+            sample.size += len(chunk)
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _before_request():
+    _current.sample = Sample()
+
+
+def _finish(sample, endpoint, method, status, path, slow_ms, logger, streaming=False):
+    if getattr(_current, 'sample', None) is sample:
+        _current.sample = None
+    sample.duration = time.perf_counter() - sample.start
+    slow = not streaming and sample.duration * 1000 >= slow_ms
+    metrics.record(endpoint, method, status, sample, slow, streaming)
+    if slow:
+        logger.warning('Slow request %s %s: %.0f ms, %d SQL statements in %.0f ms, '
+                       'JSON %.0f ms, %d bytes', method, path, sample.duration * 1000,
+                       sample.statements, sample.sql_time * 1000, sample.serialize_time * 1000,
+                       sample.size)
+
+
+def _after_request(response):
+    sample = getattr(_current, 'sample', None)
+    if sample is None:
+        return response
+    args = (sample, request.endpoint or 'unmatched', request.method, response.status_code, request.path,
+            current_app.config.get('SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS), current_app.logger)
+    if response.is_streamed:
+        # The body is produced while it is sent, after this hook; finish once
+        # the server closes the response
+        response.response = _counted(response.response, sample)
+        streaming = response.mimetype == 'text/event-stream'
+        response.call_on_close(lambda: _finish(*args, streaming=streaming))
+    else:
+        sample.size = response.content_length or 0
+        _finish(*args)
+    return response
+
+
+def _instrument_engine(engine, slow_query_ms, logger):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        sample = getattr(_current, 'sample', None)
+        if sample is not None:
+            sample.statements += 1
+            sample.sql_time += elapsed
+        if elapsed * 1000 >= slow_query_ms:
+            metrics.slow_query()
+            logger.warning('Slow query (%.0f ms): %s', elapsed * 1000, ' '.join(statement.split()))
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return jsonify({'message': 'Set METRICS_TOKEN to read /metrics'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'message': 'Invalid token'}), 401
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """Record every request of `app` and serve the totals at /metrics.
+
+    Call after init_db. /metrics requires METRICS_TOKEN as a bearer token
+    and answers 403 while it is unset. Metrics are counted per process;
+    with METRICS_DIR set the processes share their totals there (see
+    MetricsRegistry).
+    """
+    if app.config.get('METRICS_DIR'):
+        metrics.share(app.config['METRICS_DIR'])
+    app.json = TimedJSONProvider(app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    with app.app_context():
+        for engine in db.engines.values():
+            _instrument_engine(engine, app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS), app.logger)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,178 @@
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+from models import Task
+from task_tree import rebuild_subtask_counters, rebuild_paths
+from search import rebuild_search_index, INSERT_TRIGGER
+from stats import rebuild_list_stats
+from positions import rebuild_positions
+from archive import renumber_reused_archive
+
+# Schema changes for databases created by an older version of the app.
+# PRAGMA user_version records how many of MIGRATIONS have been applied; every
+# step must also be safe to run on a database freshly built by create_all().
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(text(f'PRAGMA table_info({table})'))}
+
+
+def _add_column(conn, table, name, ddl):
+    if name not in _columns(conn, table):
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+
+
+def add_subtask_counters(conn):
+    _add_column(conn, 'tasks', 'subtask_total', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'tasks', 'subtask_completed', 'INTEGER NOT NULL DEFAULT 0')
+    rebuild_subtask_counters(conn)
+
+
+def add_user_revision(conn):
+    _add_column(conn, 'users', 'revision', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def add_task_paths(conn):
+    _add_column(conn, 'tasks', 'path', "VARCHAR NOT NULL DEFAULT '/'")
+    rebuild_paths(conn)
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tasks_path ON tasks (path)'))
+
+
+def add_hot_path_indexes(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_todo_lists_user_id ON todo_lists (user_id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tasks_user_id ON tasks (user_id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tasks_list_parent_created '
+                      'ON tasks (list_id, parent_id, created_at)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tasks_parent_id ON tasks (parent_id)'))
+
+
+def add_row_revisions(conn):
+    # The tombstones table itself comes from create_all()
+    for table in ('tasks', 'todo_lists'):
+        if 'revision' not in _columns(conn, table):
+            _add_column(conn, table, 'revision', 'INTEGER NOT NULL DEFAULT 0')
+            # Existing rows count as written at revision 1, so a first sync
+            # with since=0 returns them; bump users past it to match
+            conn.execute(text(f'UPDATE {table} SET revision = 1'))
+    conn.execute(text('UPDATE users SET revision = revision + 1'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tasks_user_revision ON tasks (user_id, revision)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_todo_lists_user_revision '
+                      'ON todo_lists (user_id, revision)'))
+
+
+def add_task_search(conn):
+    # Contentless FTS5 index of task titles and descriptions (the text stays
+    # in tasks only). owner holds one token per user ('u42') so a search can
+    # be limited to one user's tasks inside the index itself.
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+        "title, description, owner, content='', prefix='2 3', "
+        "tokenize='unicode61 remove_diacritics 2')"))
+    # Deleting from a contentless table means handing back the old values
+    conn.execute(text(INSERT_TRIGGER))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+        "INSERT INTO tasks_fts (tasks_fts, rowid, title, description, owner) "
+        "VALUES ('delete', old.id, old.title, old.description, 'u' || old.user_id); END"))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description, user_id ON tasks BEGIN "
+        "INSERT INTO tasks_fts (tasks_fts, rowid, title, description, owner) "
+        "VALUES ('delete', old.id, old.title, old.description, 'u' || old.user_id); "
+        "INSERT INTO tasks_fts (rowid, title, description, owner) "
+        "VALUES (new.id, new.title, new.description, 'u' || new.user_id); END"))
+    rebuild_search_index(conn)
+
+
+def add_list_stats(conn):
+    # The list_stats table itself comes from create_all()
+    rebuild_list_stats(conn)
+
+
+def add_task_archive(conn):
+    # The archived_tasks table itself comes from create_all(). Completion
+    # times were not recorded before, so the archival clock for tasks that
+    # are already completed starts now.
+    if 'completed_at' not in _columns(conn, 'tasks'):
+        _add_column(conn, 'tasks', 'completed_at', 'DATETIME')
+        conn.execute(text('UPDATE tasks SET completed_at = :now WHERE completed'),
+                     {'now': datetime.utcnow().isoformat(' ', 'microseconds')})
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tasks_archivable ON tasks (parent_id, completed_at) '
+                      'WHERE completed'))
+
+
+def add_user_shard(conn):
+    _add_column(conn, 'users', 'shard', 'INTEGER')
+
+
+def add_task_positions(conn):
+    # Existing tasks keep the order they were shown in
+    if 'position' not in _columns(conn, 'tasks'):
+        _add_column(conn, 'tasks', 'position', "VARCHAR NOT NULL DEFAULT 'a0'")
+        rebuild_positions(conn)
+    _add_column(conn, 'archived_tasks', 'position', "VARCHAR NOT NULL DEFAULT 'a0'")
+    conn.execute(text('DROP INDEX IF EXISTS ix_tasks_list_parent_created'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tasks_list_parent_position '
+                      'ON tasks (list_id, parent_id, position)'))
+
+
+def add_task_id_autoincrement(conn):
+    # Without AUTOINCREMENT SQLite gives the ids of deleted (archived) tasks
+    # to new ones. SQLite cannot add it to a table, so tasks is copied into
+    # a new one; its indexes and triggers are created again from their SQL.
+    table_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'tasks'")).scalar()
+    if 'AUTOINCREMENT' not in table_sql.upper():
+        extras = conn.execute(text("SELECT sql FROM sqlite_master WHERE tbl_name = 'tasks' "
+                                   "AND type IN ('index', 'trigger') AND sql IS NOT NULL")).scalars().all()
+        create = str(CreateTable(Task.__table__).compile(dialect=conn.dialect))
+        conn.execute(text(create.replace('CREATE TABLE tasks (', 'CREATE TABLE tasks_rebuilt (', 1)))
+        existing = _columns(conn, 'tasks')
+        columns = ', '.join(column.name for column in Task.__table__.columns if column.name in existing)
+        conn.execute(text(f'INSERT INTO tasks_rebuilt ({columns}) SELECT {columns} FROM tasks'))
+        conn.execute(text('DROP TABLE tasks'))
+        conn.execute(text('ALTER TABLE tasks_rebuilt RENAME TO tasks'))
+        for sql in extras:
+            conn.execute(text(sql))
+    # Archived trees whose ids were reused already get new ones
+    renumber_reused_archive(conn)
+
+
+def add_tombstone_row_index(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tombstones_kind_row_id ON tombstones (kind, row_id)'))
+
+
+def add_tombstone_retention(conn):
+    _add_column(conn, 'users', 'pruned_revision', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'tombstones', 'deleted_at', 'DATETIME')
+    # Deletion times were not recorded before, so the retention period of
+    # existing tombstones starts now
+    conn.execute(text('UPDATE tombstones SET deleted_at = :now WHERE deleted_at IS NULL'),
+                 {'now': datetime.utcnow().isoformat(' ', 'microseconds')})
+
+
+MIGRATIONS = [
+    add_subtask_counters,
+    add_user_revision,
+    add_task_paths,
+    add_hot_path_indexes,
+    add_row_revisions,
+    add_task_search,
+    add_list_stats,
+    add_task_archive,
+    add_user_shard,
+    add_task_positions,
+    add_task_id_autoincrement,
+    add_tombstone_row_index,
+    add_tombstone_retention,
+]
+
+
+def upgrade(engine):
+    """Apply pending migrations; returns the names of the ones that ran."""
+    applied = []
+    with engine.begin() as conn:
+        version = conn.execute(text('PRAGMA user_version')).scalar()
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(text(f'PRAGMA user_version = {number}'))
+            applied.append(migration.__name__)
+    return applied
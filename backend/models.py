@@ -1,8 +1,26 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import relationship
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import and_, event, or_, select, text, update
+from sqlalchemy.orm import Session, relationship
 
-db = SQLAlchemy()
+
+class RoutingSession(FlaskSession):
+    """Session that sends everything to the engine in info['shard'] once one is set.
+
+    token_required sets it to the database holding the current user's lists
+    and tasks (see sharding.py). Until then, and when sharding is off,
+    statements go to the main database.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = self.info.get('shard')
+        if shard is not None and bind is None:
+            return shard
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -11,23 +29,78 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(120), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped once by every transaction that writes the user's lists or tasks;
+    # keys the response cache and stamps the rows written (see _stamp_revisions)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Shard database holding the user's lists and tasks; None: this database.
+    # Set in the main database only, see sharding.py
+    shard = db.Column(db.Integer, nullable=True)
+    # Highest revision whose tombstones were pruned; /changes answers an older
+    # `since` with a full resync (see sync.py)
+    pruned_revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     lists = relationship('TodoList', backref='user', lazy=True)
 
+    @staticmethod
+    def bump_revision(user_id, session=None):
+        """Return the revision for user_id's writes in the current transaction.
+
+        The first call in a transaction increments users.revision; later calls
+        return the same number, so every row written together shares it.
+        """
+        session = session or db.session
+        revisions = session.info.setdefault('revisions', {})
+        if user_id not in revisions:
+            # Core statements, so this is safe to call while the session flushes
+            users = User.__table__
+            conn = session.connection()
+            here = and_(users.c.id == user_id, users.c.shard.is_(None))
+            conn.execute(users.update().where(here).values(revision=users.c.revision + 1))
+            revision = conn.execute(select(users.c.revision).where(here)).scalar()
+            if revision is None:
+                # The user's data was moved to a shard (sharding.move_user)
+                raise LookupError(f'User {user_id} is not in this database')
+            revisions[user_id] = revision
+        return revisions[user_id]
+
 class TodoList(db.Model):
     __tablename__ = 'todo_lists'
+    __table_args__ = (
+        # SQLite appends the rowid to every index, so this also serves ORDER BY id
+        db.Index('ix_todo_lists_user_id', 'user_id'),
+        db.Index('ix_todo_lists_user_revision', 'user_id', 'revision'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # User.revision of the last transaction that wrote this row
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     tasks = relationship('Task', backref='todo_list', 
                         primaryjoin="and_(TodoList.id==Task.list_id, Task.parent_id==None)",
+                        order_by='[Task.position, Task.id]',
                         lazy=True)
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # Tree loads by owner, ordered by id (rowid is implicitly the last column)
+        db.Index('ix_tasks_user_id', 'user_id'),
+        # Siblings in order: top-level tasks of a list are walked in
+        # (position, id) keyset order, and moves read their neighbours here
+        db.Index('ix_tasks_list_parent_position', 'list_id', 'parent_id', 'position'),
+        # Children of a task: lazy loads, counter rebuilds, recursive CTEs
+        db.Index('ix_tasks_parent_id', 'parent_id'),
+        # Delta sync: rows changed since a client's last revision
+        db.Index('ix_tasks_user_revision', 'user_id', 'revision'),
+        # Top-level trees the archival job may move out (see archive.py)
+        db.Index('ix_tasks_archivable', 'parent_id', 'completed_at', sqlite_where=text('completed')),
+        # Ids of deleted tasks are never handed out again: archived and
+        # tombstoned tasks keep theirs (see archive.py)
+        {'sqlite_autoincrement': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -38,12 +111,70 @@ class Task(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_expanded = db.Column(db.Boolean, default=True)
+    # Denormalized counts of direct subtasks, kept in step by the write routes
+    # so completion_fraction never has to load the children
+    subtask_total = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    subtask_completed = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Materialized path of ancestor ids, root first: '/' for a top-level task,
+    # '/1/5/' for a child of task 5 under root 1. Set on insert (see
+    # _set_task_path); the whole subtree of a task is one range scan on it.
+    path = db.Column(db.String, nullable=False, default='/', server_default='/', index=True)
+    # User.revision of the last transaction that wrote this row
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # When the task was last marked completed (None while it is open)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    # Fractional index ordering the task among its siblings (see positions.py).
+    # Set on insert to sort after the last sibling
+    position = db.Column(db.String, nullable=False, server_default='a0')
     
     subtasks = relationship('Task', 
                           backref=db.backref('parent', remote_side=[id]),
+                          order_by='[Task.position, Task.id]',
                           cascade='all, delete-orphan')
-    
-    def to_dict(self, include_subtasks=True):
+
+    @staticmethod
+    def bump_subtask_counters(parent_id, user_id, total=0, completed=0):
+        # Applied as an UPDATE ... SET x = x + delta in the caller's transaction
+        if parent_id is None or not (total or completed):
+            return
+        Task.query.filter_by(id=parent_id).update({
+            Task.subtask_total: Task.subtask_total + total,
+            Task.subtask_completed: Task.subtask_completed + completed,
+            Task.revision: User.bump_revision(user_id)
+        })
+
+    def descendant_prefix(self):
+        return f'{self.path}{self.id}/'
+
+    def descendants_filter(self):
+        return Task.path_range(self.descendant_prefix())
+
+    def subtree_filter(self):
+        # The task and its descendants. The unary + keeps the owner check off
+        # ix_tasks_user_id: without ANALYZE statistics SQLite prefers that
+        # index to the id and path lookups and reads every task of the user.
+        return and_(text('+tasks.user_id = :subtree_user_id').bindparams(subtree_user_id=self.user_id),
+                    or_(Task.id == self.id, self.descendants_filter()))
+
+    @staticmethod
+    def path_range(prefix):
+        # '0' sorts right after '/', so [prefix, prefix[:-1] + '0') is exactly
+        # the set of paths starting with prefix
+        return and_(Task.path >= prefix, Task.path < prefix[:-1] + '0')
+
+    def set_completed(self, completed):
+        delta = int(bool(completed)) - int(bool(self.completed))
+        self.completed = completed
+        if delta:
+            self.completed_at = datetime.utcnow() if completed else None
+        Task.bump_subtask_counters(self.parent_id, self.user_id, completed=delta)
+        if delta:
+            ListStats.bump(db.session, self.list_id, completed=delta)
+
+    def to_dict(self, include_subtasks=True, children=None, depth=None):
+        # children maps parent_id -> [Task] when the tree was preloaded
+        # (see task_tree.load_subtree); otherwise subtasks are lazy loaded.
+        # depth limits how many levels of subtasks are nested (None = all).
         result = {
             'id': self.id,
             'title': self.title,
@@ -52,15 +183,169 @@ class Task(db.Model):
             'list_id': self.list_id,
             'parent_id': self.parent_id,
             'is_expanded': self.is_expanded,
+            'position': self.position,
             'subtasks': [],
             'created_at': self.created_at.isoformat()
         }
         if include_subtasks:
-            result['subtasks'] = [subtask.to_dict() for subtask in self.subtasks]
-            if self.subtasks:
-                completed_count = sum(1 for st in self.subtasks if st.completed)
-                total_count = len(self.subtasks)
-                result['completion_fraction'] = f"{completed_count}/{total_count}"
+            if depth == 0:
+                subtasks = []
+            elif children is None:
+                subtasks = self.subtasks
             else:
-                result['completion_fraction'] = None
-        return result
\ No newline at end of file
+                subtasks = children.get(self.id, [])
+            child_depth = None if depth is None else depth - 1
+            result['subtasks'] = [subtask.to_dict(children=children, depth=child_depth)
+                                  for subtask in subtasks]
+            result['completion_fraction'] = self.completion_fraction()
+        return result
+
+    def completion_fraction(self):
+        if self.subtask_total:
+            return f"{self.subtask_completed}/{self.subtask_total}"
+        return None
+
+    def counters_dict(self):
+        # What a parent shows for its subtasks, read from the stored counters
+        return {
+            'id': self.id,
+            'completed': self.completed,
+            'subtask_total': self.subtask_total,
+            'subtask_completed': self.subtask_completed,
+            'completion_fraction': self.completion_fraction()
+        }
+
+
+@event.listens_for(Task, 'before_insert')
+def _set_task_path(mapper, connection, target):
+    if target.parent_id is None:
+        target.path = '/'
+    else:
+        parent_path = connection.execute(
+            select(Task.path).where(Task.id == target.parent_id)).scalar()
+        target.path = f'{parent_path}{target.parent_id}/'
+
+
+class ListStats(db.Model):
+    """Running task counts of one list, so GET /stats never reads task rows.
+
+    Kept in step by the write paths (ListStats.bump) in the same transaction;
+    `flask rebuild-stats` recomputes them from the tasks table.
+    """
+    __tablename__ = 'list_stats'
+    __table_args__ = (
+        db.Index('ix_list_stats_user_id', 'user_id'),
+    )
+
+    list_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    # Tasks at any depth, and how many of them are completed
+    task_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Last time a task was added, removed, moved or (un)completed
+    last_activity_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def bump(executor, list_id, tasks=0, completed=0):
+        # executor is the session, or the connection inside a flush event
+        stats = ListStats.__table__
+        executor.execute(update(stats).where(stats.c.list_id == list_id).values(
+            task_count=stats.c.task_count + tasks,
+            completed_count=stats.c.completed_count + completed,
+            last_activity_at=datetime.utcnow()))
+
+
+@event.listens_for(TodoList, 'after_insert')
+def _create_list_stats(mapper, connection, target):
+    connection.execute(ListStats.__table__.insert().values(
+        list_id=target.id, user_id=target.user_id, last_activity_at=datetime.utcnow()))
+
+
+@event.listens_for(TodoList, 'after_delete')
+def _drop_list_stats(mapper, connection, target):
+    connection.execute(ListStats.__table__.delete().where(ListStats.list_id == target.id))
+
+
+@event.listens_for(Task, 'after_insert')
+def _count_new_task(mapper, connection, target):
+    ListStats.bump(connection, target.list_id, tasks=1, completed=int(bool(target.completed)))
+
+
+@event.listens_for(Task, 'after_delete')
+def _count_deleted_task(mapper, connection, target):
+    ListStats.bump(connection, target.list_id, tasks=-1, completed=-int(bool(target.completed)))
+
+
+class ArchivedTask(db.Model):
+    """A task moved out of the tasks table by the archival job (see archive.py).
+
+    Same columns as Task, plus root_id, the top-level task of the tree that
+    was archived with it, and archived_at. Ids are kept; tasks.id is
+    AUTOINCREMENT, so no new task takes them and a restored tree gets them
+    back.
+    """
+    __tablename__ = 'archived_tasks'
+    __table_args__ = (
+        # Archived trees of a user, newest root first
+        db.Index('ix_archived_tasks_user_parent', 'user_id', 'parent_id'),
+        db.Index('ix_archived_tasks_root_id', 'root_id'),
+        db.Index('ix_archived_tasks_list_id', 'list_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    completed = db.Column(db.Boolean, default=False)
+    list_id = db.Column(db.Integer, nullable=False)
+    parent_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime)
+    is_expanded = db.Column(db.Boolean, default=True)
+    subtask_total = db.Column(db.Integer, nullable=False, default=0)
+    subtask_completed = db.Column(db.Integer, nullable=False, default=0)
+    path = db.Column(db.String, nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    position = db.Column(db.String, nullable=False, server_default='a0')
+    root_id = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+
+class Tombstone(db.Model):
+    """Marks a deleted task or list so delta sync can report the deletion."""
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        db.Index('ix_tombstones_user_revision', 'user_id', 'revision'),
+        # Highest deleted task id, which no new task may take (see archive.reserve_task_ids)
+        db.Index('ix_tombstones_kind_row_id', 'kind', 'row_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # 'task' or 'list'
+    row_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+
+    KINDS = {'tasks': 'task', 'todo_lists': 'list'}
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_revisions(session, flush_context, instances):
+    # Bulk UPDATE/DELETE statements bypass this and stamp rows themselves
+    # (see Task.bump_subtask_counters and task_tree)
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, (Task, TodoList)) and (
+                obj in session.new or session.is_modified(obj, include_collections=False)):
+            obj.revision = User.bump_revision(obj.user_id, session)
+    for obj in list(session.deleted):
+        if isinstance(obj, (Task, TodoList)):
+            session.add(Tombstone(user_id=obj.user_id, kind=Tombstone.KINDS[obj.__tablename__],
+                                  row_id=obj.id, revision=User.bump_revision(obj.user_id, session)))
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_revisions(session, *args):
+    session.info.pop('revisions', None)
+    session.info.pop('positions', None)
@@ -0,0 +1,160 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+# Before Python 3.11 this is not the builtin TimeoutError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# Any method werkzeug.security accepts, e.g. 'scrypt' or 'pbkdf2:sha256:600000'
+DEFAULT_METHOD = 'scrypt'
+DEFAULT_WORKERS = 1
+DEFAULT_QUEUE_DEPTH = 4
+DEFAULT_TIMEOUT = 10
+# Added to the niceness of the hashing processes so request handling wins the CPU
+DEFAULT_NICE = 10
+
+
+class HasherBusy(Exception):
+    """Raised instead of queueing a hash when the queue is already full."""
+
+
+def _lower_priority(nice):
+    os.nice(nice)
+
+
+def _parameters(password_hash):
+    # 'scrypt:32768:8:1$salt$hash' -> 'scrypt:32768:8:1'
+    return password_hash.split('$', 1)[0]
+
+
+def _stored_parameters(method):
+    """The parameters werkzeug stores in a hash made with `method`, spelled out.
+
+    'scrypt' is stored as 'scrypt:32768:8:1' and 'pbkdf2' as
+    'pbkdf2:sha256:<werkzeug's default iterations>'; other methods as given.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return 'scrypt:' + ':'.join(str(int(arg)) for arg in args or (2 ** 15, 8, 1))
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+class PasswordHasher:
+    """Password hashing and checking on a bounded pool of worker processes.
+
+    A key derivation takes tens of milliseconds of CPU; on the request thread
+    a burst of logins would starve every other route. Here at most `workers`
+    hashes run at a time and at most `queue_depth` more wait for a worker.
+    Past that a call raises HasherBusy at once, so no more than workers +
+    queue_depth request threads are ever parked on hashing. With workers=0
+    hashing runs on the calling thread, still subject to the same bound.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, workers=DEFAULT_WORKERS, queue_depth=DEFAULT_QUEUE_DEPTH,
+                 timeout=DEFAULT_TIMEOUT, nice=DEFAULT_NICE):
+        self.method = method
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.nice = nice
+        self.pending = 0
+        self.rejected = 0
+        self._pool = None
+        self._pool_key = None
+        self._lock = threading.Lock()
+
+    def configure(self, method, workers, queue_depth, timeout, nice):
+        with self._lock:
+            self.method = method
+            self.workers = workers
+            self.queue_depth = queue_depth
+            self.timeout = timeout
+            self.nice = nice
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with other than the current method and parameters."""
+        return _stored_parameters(self.method) != _parameters(password_hash)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_depth': self.queue_depth,
+                'pending': self.pending,
+                'rejected': self.rejected
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool, self._pool_key = self._pool, None, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _executor(self):
+        # Called with the lock held. A pool is tied to the process that made
+        # it, so a forked worker (gunicorn --preload) starts its own.
+        key = (os.getpid(), self.workers, self.nice)
+        if self._pool_key != key:
+            if self._pool is not None and self._pool_key[0] == key[0]:
+                self._pool.shutdown(wait=False)
+            self._pool = None
+            if self.workers > 0:
+                self._pool = ProcessPoolExecutor(self.workers, initializer=_lower_priority,
+                                                 initargs=(self.nice,))
+            self._pool_key = key
+        return self._pool
+
+    def _release(self, future=None):
+        with self._lock:
+            self.pending -= 1
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self.pending >= max(self.workers, 1) + self.queue_depth:
+                self.rejected += 1
+                raise HasherBusy('Too many password checks in progress, try again shortly')
+            self.pending += 1
+            pool = self._executor()
+
+        if pool is None:
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+        try:
+            future = pool.submit(fn, *args)
+        except Exception:
+            self._release()
+            self._discard(pool)
+            raise
+        # Released when the job finishes, not when we stop waiting, so jobs
+        # that outlive the timeout still count against the bound
+        future.add_done_callback(self._release)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusy('Password check timed out, try again shortly')
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+
+    def _discard(self, pool):
+        # A worker died (e.g. OOM killed); start a fresh pool on the next call
+        with self._lock:
+            if self._pool is pool:
+                self._pool, self._pool_key = None, None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,226 @@
+from sqlalchemy import event, select, text, tuple_
+from sqlalchemy.orm import object_session
+from models import db, Task, User
+
+# Sibling order. Task.position is a fractional index: a string key that
+# sorts (bytewise, as SQLite compares TEXT) between its neighbours, so a
+# task moves by rewriting its own key and nothing else. Keys are an integer
+# part ('a0'..'az', then 'b00'..'bzz', ...; the head letter gives the
+# length) followed by base-62 fraction digits that never end in '0'.
+# Siblings are the tasks with the same list_id and parent_id; ties are
+# broken by id.
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+FIRST_KEY = 'a0'
+# Past this length a move renumbers its siblings first; repeated inserts at
+# one spot grow a key by about one character per six moves
+MAX_KEY_LENGTH = 48
+
+
+def _midpoint(lower, upper):
+    # Fraction digits strictly between lower and upper ('' and None: the ends)
+    if upper is not None:
+        common = 0
+        while (lower[common] if common < len(lower) else '0') == upper[common]:
+            common += 1
+        if common:
+            return upper[:common] + _midpoint(lower[common:], upper[common:])
+    low = DIGITS.index(lower[0]) if lower else 0
+    high = DIGITS.index(upper[0]) if upper is not None else len(DIGITS)
+    if high - low > 1:
+        return DIGITS[(low + high + 1) // 2]
+    if upper is not None and len(upper) > 1:
+        return upper[:1]
+    return DIGITS[low] + _midpoint(lower[1:], None)
+
+
+def _integer_length(head):
+    if 'a' <= head <= 'z':
+        return ord(head) - ord('a') + 2
+    if 'A' <= head <= 'Z':
+        return ord('Z') - ord(head) + 2
+    raise ValueError(f'Invalid position head {head!r}')
+
+
+def _split(key):
+    length = _integer_length(key[0])
+    if len(key) < length or key[length:].endswith('0') or any(char not in DIGITS for char in key):
+        raise ValueError(f'Invalid position {key!r}')
+    return key[:length], key[length:]
+
+
+def _increment(integer):
+    head, digits = integer[0], list(integer[1:])
+    for index in reversed(range(len(digits))):
+        if digits[index] != DIGITS[-1]:
+            digits[index] = DIGITS[DIGITS.index(digits[index]) + 1]
+            return head + ''.join(digits)
+        digits[index] = '0'
+    if head == 'Z':
+        return FIRST_KEY
+    if head == 'z':
+        return None
+    head = chr(ord(head) + 1)
+    return head + ''.join(digits + ['0'] if head > 'a' else digits[:-1])
+
+
+def _decrement(integer):
+    head, digits = integer[0], list(integer[1:])
+    for index in reversed(range(len(digits))):
+        if digits[index] != '0':
+            digits[index] = DIGITS[DIGITS.index(digits[index]) - 1]
+            return head + ''.join(digits)
+        digits[index] = DIGITS[-1]
+    if head == 'a':
+        return 'Z' + DIGITS[-1]
+    if head == 'A':
+        return None
+    head = chr(ord(head) - 1)
+    return head + ''.join(digits + [DIGITS[-1]] if head < 'Z' else digits[:-1])
+
+
+def key_between(lower, upper):
+    """A key sorting strictly between lower and upper; None stands for either end."""
+    if lower is not None and upper is not None and lower >= upper:
+        raise ValueError(f'{lower!r} does not sort before {upper!r}')
+    if lower is None:
+        if upper is None:
+            return FIRST_KEY
+        integer, fraction = _split(upper)
+        if fraction:
+            return integer
+        below = _decrement(integer)
+        if below is None:
+            raise ValueError('No position sorts before the smallest integer key')
+        return below
+    integer, fraction = _split(lower)
+    if upper is not None:
+        upper_integer, upper_fraction = _split(upper)
+        if integer == upper_integer:
+            return integer + _midpoint(fraction, upper_fraction)
+    above = _increment(integer)
+    if above is not None and (upper is None or above < upper):
+        return above
+    return integer + _midpoint(fraction, None)
+
+
+def nth_key(n):
+    """The n-th key (from 0) of the sequence key_between(previous, None) produces from FIRST_KEY."""
+    length = 1
+    while n >= len(DIGITS) ** length:
+        n -= len(DIGITS) ** length
+        length += 1
+    digits = []
+    for _ in range(length):
+        n, digit = divmod(n, len(DIGITS))
+        digits.append(DIGITS[digit])
+    return chr(ord('a') + length - 1) + ''.join(reversed(digits))
+
+
+def is_valid_key(key):
+    try:
+        return isinstance(key, str) and bool(key) and bool(_split(key))
+    except ValueError:
+        return False
+
+
+def siblings_filter(list_id, parent_id):
+    # Spelled so SQLite can use ix_tasks_list_parent_position
+    return (Task.list_id == list_id,
+            Task.parent_id.is_(None) if parent_id is None else Task.parent_id == parent_id)
+
+
+def last_key(executor, list_id, parent_id, exclude_id=None):
+    """Position of the last of the siblings (one index lookup), or None."""
+    # ORDER BY ... LIMIT 1 rather than MAX(), which would read every sibling
+    # once the id condition is added
+    stmt = select(Task.position).where(*siblings_filter(list_id, parent_id))
+    if exclude_id is not None:
+        stmt = stmt.where(Task.id != exclude_id)
+    return executor.execute(stmt.order_by(Task.position.desc(), Task.id.desc()).limit(1)).scalar()
+
+
+def rebalance(user_id, list_id, parent_id):
+    """Give the siblings evenly spaced short keys again, in their current order."""
+    ids = db.session.execute(select(Task.id).where(*siblings_filter(list_id, parent_id))
+                             .order_by(Task.position, Task.id)).scalars().all()
+    tasks = Task.__table__
+    db.session.execute(
+        tasks.update().where(tasks.c.id == db.bindparam('task_id'))
+        .values(position=db.bindparam('key'), revision=User.bump_revision(user_id)),
+        [{'task_id': task_id, 'key': nth_key(n)} for n, task_id in enumerate(ids)])
+    db.session.expire_all()
+    return len(ids)
+
+
+def _neighbour(task, list_id, parent_id, neighbour_id, name):
+    row = db.session.execute(select(Task.position).where(
+        Task.id == neighbour_id, Task.user_id == task.user_id, *siblings_filter(list_id, parent_id))).first()
+    if row is None or neighbour_id == task.id:
+        raise ValueError(f'{name} {neighbour_id} is not a sibling of the task')
+    return row.position
+
+
+def _bounds(task, list_id, parent_id, before_id, after_id):
+    siblings = select(Task.position).where(*siblings_filter(list_id, parent_id), Task.id != task.id)
+    lower = upper = None
+    if after_id is not None:
+        lower = _neighbour(task, list_id, parent_id, after_id, 'after_id')
+    if before_id is not None:
+        upper = _neighbour(task, list_id, parent_id, before_id, 'before_id')
+    if after_id is not None and before_id is None:
+        upper = db.session.execute(siblings.where(tuple_(Task.position, Task.id) > (lower, after_id))
+                                   .order_by(Task.position, Task.id).limit(1)).scalar()
+    elif before_id is not None and after_id is None:
+        lower = db.session.execute(siblings.where(tuple_(Task.position, Task.id) < (upper, before_id))
+                                   .order_by(Task.position.desc(), Task.id.desc()).limit(1)).scalar()
+    elif after_id is None:
+        lower = last_key(db.session, list_id, parent_id, exclude_id=task.id)
+    return lower, upper
+
+
+def place(task, list_id, parent_id, before_id=None, after_id=None):
+    """Key for `task` among the siblings in (list_id, parent_id), after after_id and before before_id.
+
+    With neither it goes last. Reads at most three keys through
+    ix_tasks_list_parent_position; only when the neighbours share a key or
+    the new key would be longer than MAX_KEY_LENGTH are the siblings
+    renumbered (rebalance) first. Raises ValueError if a neighbour is not a
+    sibling or the two are in the wrong order.
+    """
+    lower, upper = _bounds(task, list_id, parent_id, before_id, after_id)
+    if lower is not None and upper is not None and lower > upper:
+        raise ValueError('after_id must come before before_id')
+    if lower is None or upper is None or lower < upper:
+        key = key_between(lower, upper)
+        if len(key) <= MAX_KEY_LENGTH:
+            return key
+    rebalance(task.user_id, list_id, parent_id)
+    return key_between(*_bounds(task, list_id, parent_id, before_id, after_id))
+
+
+@event.listens_for(Task, 'before_insert')
+def _append_position(mapper, connection, target):
+    if target.position is None:
+        # Siblings added earlier in the same transaction, possibly in this flush
+        pending = object_session(target).info.setdefault('positions', {})
+        group = (target.list_id, target.parent_id)
+        last = max(filter(None, (last_key(connection, *group), pending.get(group))), default=None)
+        target.position = pending[group] = key_between(last, None)
+
+
+def rebuild_positions(conn):
+    """Number every sibling group from FIRST_KEY in display order.
+
+    Top-level tasks were shown in (created_at, id) order and subtasks in id
+    order before positions existed.
+    """
+    conn.connection.driver_connection.create_function('nth_key', 1, nth_key, deterministic=True)
+    conn.execute(text(
+        'CREATE TEMP TABLE task_ranks AS SELECT id, ROW_NUMBER() OVER ('
+        'PARTITION BY list_id, parent_id '
+        'ORDER BY CASE WHEN parent_id IS NULL THEN created_at END, id) - 1 AS rank FROM tasks'))
+    conn.execute(text('CREATE UNIQUE INDEX temp.ix_task_ranks_id ON task_ranks (id)'))
+    conn.execute(text('UPDATE tasks SET position = nth_key((SELECT rank FROM task_ranks '
+                      'WHERE task_ranks.id = tasks.id))'))
+    conn.execute(text('DROP TABLE task_ranks'))
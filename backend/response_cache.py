@@ -0,0 +1,122 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+from sqlalchemy import select
+from models import db, User
+from expansion_buffer import expansion_buffer
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# Rough per-entry bookkeeping cost on top of the body itself
+ENTRY_OVERHEAD = 256
+
+
+class ResponseCache:
+    """LRU cache of serialized read responses, bounded by total body size.
+
+    Entries are keyed by (user_id, revision, buffered version, path). Writes
+    bump the user's revision, and toggles held in the expansion buffer its
+    version, so stale entries are never looked up again and age out of the
+    LRU order.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype):
+        cost = len(body) + len(key[-1]) + ENTRY_OVERHEAD
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self._entries[key] = (body, mimetype, cost)
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, (_, _, evicted_cost) = self._entries.popitem(last=False)
+                self.size -= evicted_cost
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions
+            }
+
+
+response_cache = ResponseCache()
+
+
+def current_revision(user_id):
+    return db.session.execute(select(User.revision).where(User.id == user_id)).scalar()
+
+
+def make_etag(key):
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def cached_response(f):
+    """Serve a token_required read route from the per-user response cache.
+
+    Must be applied below @token_required. The ETag is derived from the
+    cache key, so a matching If-None-Match is answered with 304 after a
+    single revision lookup, even if the body was evicted or built by another
+    worker.
+    """
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        response_cache.max_bytes = current_app.config.get('RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+        key = (current_user.id, current_revision(current_user.id), expansion_buffer.version(current_user.id),
+               request.full_path)
+        etag = make_etag(key)
+
+        if request.if_none_match.contains(etag):
+            response_cache.not_modified += 1
+            response = current_app.response_class(status=304)
+        else:
+            entry = response_cache.get(key)
+            if entry is None:
+                response = current_app.make_response(f(current_user, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                # Streamed bodies are not buffered, but still get the ETag
+                if not response.is_streamed:
+                    response_cache.put(key, response.get_data(), response.mimetype)
+            else:
+                body, mimetype, _ = entry
+                response = current_app.response_class(body, mimetype=mimetype)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated
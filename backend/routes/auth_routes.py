@@ -1,6 +1,9 @@
-from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, request, jsonify, current_app
 from models import db, User
+from token_cache import token_cache, UserSnapshot, DEFAULT_TTL, DEFAULT_MAX_ENTRIES
+from sharding import place_user, route_user
+from password_hasher import (password_hasher, HasherBusy, DEFAULT_METHOD, DEFAULT_WORKERS,
+                             DEFAULT_QUEUE_DEPTH, DEFAULT_TIMEOUT, DEFAULT_NICE)
 from functools import wraps
 import jwt
 import datetime
@@ -15,21 +18,60 @@ def token_required(f):
 
         if auth_header and auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
+        elif request.accept_mimetypes.best == 'text/event-stream':
+            # EventSource cannot set headers, so event streams take ?token=
+            token = request.args.get('token')
 
         if not token:
             return jsonify({'message': 'Token is missing'}), 401
 
-        try:
-            data = jwt.decode(token, 'your-secret-key-here', algorithms=["HS256"])
-            current_user = User.query.get(data['user_id'])
-            if not current_user:
+        # A cache hit skips both the signature check and the user lookup
+        current_user = token_cache.get(token)
+        if current_user is None:
+            try:
+                data = jwt.decode(token, 'your-secret-key-here', algorithms=["HS256"])
+                user = User.query.get(data['user_id'])
+                if not user:
+                    return jsonify({'message': 'Invalid token'}), 401
+            except:
                 return jsonify({'message': 'Invalid token'}), 401
-        except:
-            return jsonify({'message': 'Invalid token'}), 401
+
+            current_user = UserSnapshot(user.id, user.username, user.shard)
+            token_cache.ttl = current_app.config.get('TOKEN_CACHE_TTL', DEFAULT_TTL)
+            token_cache.max_entries = current_app.config.get('TOKEN_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+            token_cache.put(token, current_user, data.get('exp'))
+
+        if current_app.config.get('SHARD_DATABASE_URLS'):
+            routed = route_user(current_user)
+            if routed.shard != current_user.shard:
+                # Moved by another process since it was cached
+                token_cache.invalidate_user(current_user.id)
+            current_user = routed
 
         return f(current_user, *args, **kwargs)
     return decorated
 
+def _hasher():
+    config = current_app.config
+    password_hasher.configure(config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+                              config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS),
+                              config.get('PASSWORD_HASH_QUEUE_DEPTH', DEFAULT_QUEUE_DEPTH),
+                              config.get('PASSWORD_HASH_TIMEOUT', DEFAULT_TIMEOUT),
+                              config.get('PASSWORD_HASH_NICE', DEFAULT_NICE))
+    return password_hasher
+
+def _upgrade_hash(hasher, user, password):
+    # Best effort: if the pool is busy or the write fails the old hash stays
+    # valid and is upgraded on a later login
+    try:
+        user.password_hash = hasher.hash(password)
+        db.session.commit()
+    except HasherBusy:
+        pass
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning('Could not upgrade password hash of user %s: %s', user.id, e)
+
 @auth_blueprint.route('/signup', methods=['POST'])
 def signup():
     try:
@@ -54,10 +96,12 @@ def signup():
 
         new_user = User(
             username=username,
-            password_hash=generate_password_hash(password)
+            password_hash=_hasher().hash(password)
         )
         
         db.session.add(new_user)
+        db.session.flush()
+        place_user(new_user)
         db.session.commit()
 
         return jsonify({
@@ -65,6 +109,9 @@ def signup():
             'username': username
         }), 201
 
+    except HasherBusy as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
@@ -84,9 +131,13 @@ def login():
 
         user = User.query.filter_by(username=username).first()
 
-        if not user or not check_password_hash(user.password_hash, password):
+        hasher = _hasher()
+        if not user or not hasher.verify(user.password_hash, password):
             return jsonify({'message': 'Invalid username or password'}), 401
 
+        if hasher.needs_rehash(user.password_hash):
+            _upgrade_hash(hasher, user, password)
+
         token = jwt.encode({
             'user_id': user.id,
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
@@ -101,6 +152,8 @@ def login():
             }
         }), 200
 
+    except HasherBusy as e:
+        return jsonify({'message': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
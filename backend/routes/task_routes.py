@@ -1,20 +1,109 @@
-from flask import Blueprint, request, jsonify
-from models import db, Task, TodoList
+from flask import Blueprint, request, jsonify, current_app, stream_with_context, abort
+from sqlalchemy import select
+from models import db, Task, TodoList, User
 from flask_cors import cross_origin
 from .auth_routes import token_required
+from task_json import TASK_COLUMNS
+from task_tree import (user_lists_json, list_tasks_json, subtree_json, load_subtree, move_subtree,
+                       delete_subtree, delete_list_tree, iter_list_tasks, stream_json_array, stream_lists,
+                       keyset_page, iter_keyset_pages, encode_cursor, decode_cursor, TASK_FIELDS)
+from response_cache import cached_response, response_cache
+from batch import apply_batch, BatchError, DEFAULT_MAX_OPERATIONS
+from sync import changes_json
+from search import search_json, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from stats import user_stats
+from archive import archived_json, archived_root, restore_tree, DEFAULT_BROWSE_LIMIT
+from workspace import export_lines, import_lines, ImportFormatError, DEFAULT_IMPORT_CHUNK
+from expansion_buffer import expansion_buffer, DEFAULT_FLUSH_MS, DEFAULT_MAX_PENDING
+from positions import place
+from change_hub import (change_hub, event_stream, DEFAULT_MAX_SUBSCRIBERS, DEFAULT_MAX_PER_USER,
+                        DEFAULT_HEARTBEAT, DEFAULT_IDLE_TIMEOUT)
 
 tasks = Blueprint('tasks', __name__)
 
+# Query parameters that switch the read routes to paginated, streamed output
+STREAM_ARGS = ('limit', 'cursor', 'fields', 'depth')
+MAX_PAGE_LIMIT = 1000
+MAX_QUERY_LENGTH = 200
+RESPONSE_MODES = ('full', 'compact')
+
+def _read_options(model):
+    args = request.args
+    options = {'limit': None, 'after': None, 'fields': None, 'depth': None}
+    if 'limit' in args:
+        if not args['limit'].isdigit() or not 1 <= int(args['limit']) <= MAX_PAGE_LIMIT:
+            raise ValueError(f'limit must be an integer between 1 and {MAX_PAGE_LIMIT}')
+        options['limit'] = int(args['limit'])
+    if 'cursor' in args:
+        try:
+            options['after'] = decode_cursor(args['cursor'], model)
+        except ValueError:
+            raise ValueError('Invalid cursor')
+    if 'fields' in args:
+        fields = [field for field in args['fields'].split(',') if field]
+        unknown = sorted(set(fields) - set(TASK_FIELDS))
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        options['fields'] = fields
+    if 'depth' in args:
+        if not args['depth'].isdigit():
+            raise ValueError('depth must be a non-negative integer')
+        options['depth'] = int(args['depth'])
+    return options
+
+def _compact_response():
+    # ?response=compact: the subtask write routes answer with the changed task
+    # alone and its parent's counters instead of re-serializing the tree
+    mode = request.args.get('response', 'full')
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"response must be one of {', '.join(RESPONSE_MODES)}")
+    return mode == 'compact'
+
+def _compact(task, parent):
+    return {'task': task.to_dict(include_subtasks=False),
+            'parent': parent.counters_dict() if parent else None}
+
+def _json_body(body):
+    # For bodies the row serializer (task_json) has already encoded
+    return current_app.response_class(body, mimetype='application/json')
+
+def _page(stmt, model, options):
+    # Fetch one extra row to learn whether there is a next page
+    rows = keyset_page(stmt, model, options['after'], options['limit'] + 1)
+    if len(rows) > options['limit']:
+        return rows[:options['limit']], encode_cursor(rows[options['limit'] - 1], model)
+    return rows, None
+
+def _expansion_buffer():
+    # The write-behind buffer for is_expanded, or None when EXPANSION_FLUSH_MS is 0
+    config = current_app.config
+    expansion_buffer.configure(config.get('EXPANSION_FLUSH_MS', DEFAULT_FLUSH_MS),
+                               config.get('EXPANSION_MAX_PENDING', DEFAULT_MAX_PENDING))
+    return expansion_buffer if expansion_buffer.enabled else None
+
+def _streamed(chunks, next_cursor=None):
+    response = current_app.response_class(stream_with_context(chunks), mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 @tasks.route('/lists', methods=['GET'])
 @token_required
+@cached_response
 def get_lists(current_user):
     try:
-        lists = TodoList.query.filter_by(user_id=current_user.id).all()
-        return jsonify([{
-            'id': lst.id,
-            'title': lst.title,
-            'tasks': [task.to_dict() for task in lst.tasks]
-        } for lst in lists])
+        if not any(arg in request.args for arg in STREAM_ARGS):
+            return _json_body(user_lists_json(current_user.id))
+
+        options = _read_options(TodoList)
+        stmt = select(TodoList.id, TodoList.title, TodoList.created_at).where(TodoList.user_id == current_user.id)
+        next_cursor = None
+        if options['limit'] is not None:
+            lists, next_cursor = _page(stmt, TodoList, options)
+        else:
+            lists = (lst for page in iter_keyset_pages(stmt, TodoList, options['after']) for lst in page)
+        return _streamed(stream_lists(current_user.id, lists,
+                                      fields=options['fields'], depth=options['depth']), next_cursor)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -28,6 +117,7 @@ def create_list(current_user):
             user_id=current_user.id
         )
         db.session.add(new_list)
+        User.bump_revision(current_user.id)
         db.session.commit()
         return jsonify({
             'id': new_list.id,
@@ -48,6 +138,7 @@ def update_list(current_user, list_id):
         if 'title' in data:
             todo_list.title = data['title']
             
+        User.bump_revision(current_user.id)
         db.session.commit()
         return jsonify({
             'id': todo_list.id,
@@ -63,7 +154,8 @@ def update_list(current_user, list_id):
 def delete_list(current_user, list_id):
     try:
         todo_list = TodoList.query.filter_by(id=list_id, user_id=current_user.id).first_or_404()
-        db.session.delete(todo_list)
+        delete_list_tree(todo_list)
+        User.bump_revision(current_user.id)
         db.session.commit()
         return jsonify({'message': 'List deleted successfully'})
     except Exception as e:
@@ -72,10 +164,22 @@ def delete_list(current_user, list_id):
 
 @tasks.route('/lists/<int:list_id>/tasks', methods=['GET'])
 @token_required
+@cached_response
 def get_tasks(current_user, list_id):
     try:
         todo_list = TodoList.query.filter_by(id=list_id, user_id=current_user.id).first_or_404()
-        return jsonify([task.to_dict() for task in todo_list.tasks])
+        if not any(arg in request.args for arg in STREAM_ARGS):
+            return _json_body(list_tasks_json(current_user.id, todo_list.id))
+
+        options = _read_options(Task)
+        roots, next_cursor = None, None
+        if options['limit'] is not None:
+            stmt = select(*TASK_COLUMNS).where(Task.user_id == current_user.id, Task.list_id == list_id,
+                                               Task.parent_id.is_(None))
+            roots, next_cursor = _page(stmt, Task, options)
+        pages = iter_list_tasks(current_user.id, list_id, after=options['after'], roots=roots,
+                                fields=options['fields'], depth=options['depth'])
+        return _streamed(stream_json_array(pages), next_cursor)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -101,6 +205,7 @@ def create_task(current_user, list_id):
         )
         
         db.session.add(new_task)
+        User.bump_revision(current_user.id)
         db.session.commit()
         
         # Return the created task
@@ -113,10 +218,13 @@ def create_task(current_user, list_id):
 
 @tasks.route('/tasks/<int:task_id>', methods=['GET'])
 @token_required
+@cached_response
 def get_task(current_user, task_id):
     try:
-        task = Task.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
-        return jsonify(task.to_dict())
+        body = subtree_json(current_user.id, task_id)
+        if body is None:
+            abort(404)
+        return _json_body(body)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -126,20 +234,27 @@ def update_task(current_user, task_id):
     try:
         task = Task.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
         data = request.get_json()
-        
+
+        # Expanding or collapsing alone is UI state: buffered, not committed
+        buffer = _expansion_buffer()
+        if buffer and set(data) == {'is_expanded'}:
+            buffer.buffer(task, bool(data['is_expanded']))
+            return jsonify(task.to_dict())
+
         if 'title' in data:
             task.title = data['title']
         if 'description' in data:
             task.description = data['description']
         if 'completed' in data:
-            task.completed = data['completed']
+            task.set_completed(data['completed'])
         if 'is_expanded' in data:
             task.is_expanded = data['is_expanded']
         if 'list_id' in data:
             # Verify the new list belongs to the user
             new_list = TodoList.query.filter_by(id=data['list_id'], user_id=current_user.id).first_or_404()
-            task.list_id = new_list.id
+            move_subtree(task, new_list.id)
             
+        User.bump_revision(current_user.id)
         db.session.commit()
         return jsonify(task.to_dict())
         
@@ -163,20 +278,17 @@ def delete_task(current_user, task_id):
         if not todo_list:
             return jsonify({'error': 'Associated list not found'}), 404
 
-        # Delete any subtasks first
-        if hasattr(task, 'subtasks'):
-            for subtask in task.subtasks:
-                db.session.delete(subtask)
-
-        # Delete the task
-        db.session.delete(task)
+        # Delete the task together with all of its subtasks
+        list_id = task.list_id
+        delete_subtree(task)
+        User.bump_revision(current_user.id)
         db.session.commit()
         
         # Return success response
         return jsonify({
             'message': 'Task deleted successfully',
             'id': task_id,
-            'list_id': task.list_id
+            'list_id': list_id
         }), 200
         
     except Exception as e:
@@ -189,7 +301,12 @@ def delete_task(current_user, task_id):
 def toggle_task(current_user, task_id):
     try:
         task = Task.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
+        buffer = _expansion_buffer()
+        if buffer:
+            buffer.buffer(task, not task.is_expanded)
+            return jsonify(task.to_dict())
         task.is_expanded = not task.is_expanded
+        User.bump_revision(current_user.id)
         db.session.commit()
         return jsonify(task.to_dict())
     except Exception as e:
@@ -201,6 +318,7 @@ def toggle_task(current_user, task_id):
 @token_required
 def create_subtask(current_user, task_id):
     try:
+        compact = _compact_response()
         parent_task = Task.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
         data = request.get_json()
         
@@ -217,8 +335,12 @@ def create_subtask(current_user, task_id):
         )
         
         db.session.add(subtask)
+        Task.bump_subtask_counters(task_id, current_user.id, total=1)
+        User.bump_revision(current_user.id)
         db.session.commit()
         
+        if compact:
+            return jsonify(_compact(subtask, parent_task)), 201
         return jsonify(subtask.to_dict()), 201
         
     except Exception as e:
@@ -230,6 +352,7 @@ def create_subtask(current_user, task_id):
 @token_required
 def update_subtask(current_user, task_id, subtask_id):
     try:
+        compact = _compact_response()
         # Verify parent task exists and belongs to user
         parent_task = Task.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
         
@@ -244,9 +367,12 @@ def update_subtask(current_user, task_id, subtask_id):
         if 'title' in data:
             subtask.title = data['title']
         if 'completed' in data:
-            subtask.completed = data['completed']
+            subtask.set_completed(data['completed'])
             
+        User.bump_revision(current_user.id)
         db.session.commit()
+        if compact:
+            return jsonify(_compact(subtask, parent_task))
         return jsonify(subtask.to_dict())
     except Exception as e:
         db.session.rollback()
@@ -257,6 +383,7 @@ def update_subtask(current_user, task_id, subtask_id):
 @token_required
 def delete_subtask(current_user, task_id, subtask_id):
     try:
+        compact = _compact_response()
         # Verify parent task exists and belongs to user
         parent_task = Task.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
         
@@ -267,9 +394,12 @@ def delete_subtask(current_user, task_id, subtask_id):
             parent_id=task_id
         ).first_or_404()
 
-        db.session.delete(subtask)
+        delete_subtree(subtask)
+        User.bump_revision(current_user.id)
         db.session.commit()
         
+        if compact:
+            return jsonify({'id': subtask_id, 'parent': parent_task.counters_dict()}), 200
         return jsonify({
             'message': 'Subtask deleted successfully',
             'id': subtask_id
@@ -282,6 +412,7 @@ def delete_subtask(current_user, task_id, subtask_id):
 @token_required
 def complete_subtask(current_user, subtask_id):
     try:
+        compact = _compact_response()
         # Find the subtask and verify ownership
         subtask = Task.query.filter_by(id=subtask_id, user_id=current_user.id).first()
         
@@ -293,21 +424,30 @@ def complete_subtask(current_user, subtask_id):
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
 
-        subtask.completed = data.get('completed', True)
+        subtask.set_completed(data.get('completed', True))
+        User.bump_revision(current_user.id)
         db.session.commit()
 
+        if compact:
+            # One primary key read for the parent's counters, no siblings
+            parent_task = db.session.get(Task, subtask.parent_id) if subtask.parent_id else None
+            return jsonify(_compact(subtask, parent_task)), 200
+
         # Update parent task's completion fraction
         parent_task = None
         if subtask.parent_id:
             parent_task = Task.query.filter_by(id=subtask.parent_id, user_id=current_user.id).first()
             if parent_task:
-                # No need to store completion_fraction in DB; calculate on the fly
-                # Return the updated parent task with subtasks
-                return jsonify(parent_task.to_dict(include_subtasks=True)), 200
+                # completion_fraction comes from the parent's stored counters
+                # Return the updated parent task with subtasks, loaded in one query
+                return jsonify(parent_task.to_dict(children=load_subtree(parent_task))), 200
 
         # If no parent task, return the updated subtask
         return jsonify(subtask.to_dict()), 200
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         print(f"Error updating subtask completion: {str(e)}")
@@ -323,13 +463,9 @@ def delete_completed_task(current_user, task_id):
         if not task:
             return jsonify({'error': 'Task not found'}), 404
 
-        # Find and delete all subtasks first
-        subtasks = Task.query.filter_by(parent_id=task_id).all()
-        for subtask in subtasks:
-            db.session.delete(subtask)
-
-        # Delete the main task
-        db.session.delete(task)
+        # Delete the task and its whole subtree in one statement
+        delete_subtree(task)
+        User.bump_revision(current_user.id)
         db.session.commit()
 
         return jsonify({
@@ -350,17 +486,247 @@ def move_task(current_user, task_id, list_id):
         if not task:
             return jsonify({'error': 'Task not found'}), 404
 
-        # Update the task's list_id
-        task.list_id = list_id
+        if not TodoList.query.filter_by(id=list_id, user_id=current_user.id).first():
+            return jsonify({'error': 'List not found'}), 404
+
+        # Move the task and its whole subtree in one statement, between the
+        # optional before_id/after_id neighbours in the new list
+        data = request.get_json(silent=True) or {}
+        move_subtree(task, list_id, data.get('before_id'), data.get('after_id'))
+        User.bump_revision(current_user.id)
         db.session.commit()
 
-        return jsonify(task.to_dict()), 200
+        return jsonify(task.to_dict(children=load_subtree(task))), 200
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         print(f"Error moving task: {str(e)}")
         return jsonify({'error': 'Failed to move task'}), 500
 
 
+@tasks.route('/reorder/<int:task_id>', methods=['PUT'])
+@token_required
+def reorder_task(current_user, task_id):
+    try:
+        task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+        if not task:
+            return jsonify({'error': 'Task not found'}), 404
+
+        # Between after_id and before_id among its siblings, last with neither;
+        # only this task's row is written (see positions.py)
+        data = request.get_json(silent=True) or {}
+        task.position = place(task, task.list_id, task.parent_id, data.get('before_id'), data.get('after_id'))
+        User.bump_revision(current_user.id)
+        db.session.commit()
+        return jsonify(task.to_dict(include_subtasks=False)), 200
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@tasks.route('/batch', methods=['POST'])
+@token_required
+def batch_tasks(current_user):
+    try:
+        data = request.get_json()
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'A non-empty operations list is required'}), 400
+
+        max_operations = current_app.config.get('BATCH_MAX_OPERATIONS', DEFAULT_MAX_OPERATIONS)
+        if len(operations) > max_operations:
+            return jsonify({'error': f'At most {max_operations} operations per batch'}), 400
+
+        # Everything below runs in one transaction: all operations or none
+        results = apply_batch(current_user.id, operations)
+        User.bump_revision(current_user.id)
+        db.session.commit()
+        return jsonify({'results': results}), 200
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message, 'index': e.index}), e.status
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error applying batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@tasks.route('/changes', methods=['GET'])
+@token_required
+@cached_response
+def get_changes(current_user):
+    since = request.args.get('since', '0')
+    if not since.isdigit():
+        return jsonify({'error': 'since must be a non-negative integer'}), 400
+    try:
+        return _json_body(changes_json(current_user.id, int(since)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@tasks.route('/search', methods=['GET'])
+@token_required
+@cached_response
+def search_tasks(current_user):
+    args = request.args
+    q = args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    if len(q) > MAX_QUERY_LENGTH:
+        return jsonify({'error': f'q must be at most {MAX_QUERY_LENGTH} characters'}), 400
+    for name in ('list_id', 'limit', 'offset'):
+        if name in args and not args[name].isdigit():
+            return jsonify({'error': f'{name} must be a non-negative integer'}), 400
+    if args.get('completed', 'true') not in ('true', 'false'):
+        return jsonify({'error': 'completed must be true or false'}), 400
+    limit = int(args.get('limit', DEFAULT_SEARCH_LIMIT))
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        return jsonify({'error': f'limit must be an integer between 1 and {MAX_SEARCH_LIMIT}'}), 400
+
+    try:
+        return _json_body(search_json(
+            current_user.id, q,
+            list_id=int(args['list_id']) if 'list_id' in args else None,
+            completed=args['completed'] == 'true' if 'completed' in args else None,
+            limit=limit,
+            offset=int(args.get('offset', 0))))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@tasks.route('/stats', methods=['GET'])
+@token_required
+@cached_response
+def get_stats(current_user):
+    try:
+        return jsonify(user_stats(current_user.id))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@tasks.route('/export', methods=['GET'])
+@token_required
+def export_workspace(current_user):
+    # NDJSON, written while the rows are read (format in workspace.py)
+    response = current_app.response_class(stream_with_context(export_lines(current_user.id)),
+                                          mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="{current_user.username}.ndjson"'
+    return response
+
+@tasks.route('/import', methods=['POST'])
+@token_required
+def import_workspace(current_user):
+    # The body is read line by line, so a large upload is never held in memory
+    try:
+        counts = import_lines(current_user.id, request.stream,
+                              current_app.config.get('IMPORT_CHUNK_SIZE', DEFAULT_IMPORT_CHUNK))
+        return jsonify(counts), 201
+    except ImportFormatError as e:
+        return jsonify({'error': str(e), 'line': e.line_number}), 400
+    except Exception as e:
+        print(f"Error importing workspace: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@tasks.route('/archive', methods=['GET'])
+@token_required
+@cached_response
+def get_archive(current_user):
+    args = request.args
+    for name in ('list_id', 'limit', 'cursor'):
+        if name in args and not args[name].isdigit():
+            return jsonify({'error': f'{name} must be a non-negative integer'}), 400
+    limit = int(args.get('limit', DEFAULT_BROWSE_LIMIT))
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        return jsonify({'error': f'limit must be an integer between 1 and {MAX_PAGE_LIMIT}'}), 400
+    try:
+        body, next_cursor = archived_json(current_user.id,
+                                          list_id=int(args['list_id']) if 'list_id' in args else None,
+                                          before=int(args['cursor']) if 'cursor' in args else None,
+                                          limit=limit)
+        response = _json_body(body)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@tasks.route('/archive/<int:task_id>/restore', methods=['POST'])
+@token_required
+def restore_archived_task(current_user, task_id):
+    try:
+        archived = archived_root(current_user.id, task_id)
+        if archived is None:
+            return jsonify({'error': 'Archived task not found'}), 404
+        root_id, list_id = archived
+        data = request.get_json(silent=True) or {}
+        list_id = data.get('list_id', list_id)
+        if not isinstance(list_id, int):
+            return jsonify({'error': 'list_id must be an integer'}), 400
+        if not TodoList.query.filter_by(id=list_id, user_id=current_user.id).first():
+            return jsonify({'error': 'List not found'}), 404
+
+        # The whole tree comes back, whichever of its tasks was asked for
+        root_id = restore_tree(current_user.id, root_id, list_id)
+        User.bump_revision(current_user.id)
+        db.session.commit()
+        return _json_body(subtree_json(current_user.id, root_id)), 201
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error restoring task: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@tasks.route('/stream', methods=['GET'])
+@token_required
+def stream_changes(current_user):
+    # Last-Event-ID is sent by EventSource on reconnect; since= on first connect
+    last_seen = request.headers.get('Last-Event-ID') or request.args.get('since', '')
+    if last_seen and not last_seen.isdigit():
+        return jsonify({'error': 'since must be a non-negative integer'}), 400
+
+    config = current_app.config
+    # Each open stream holds a request thread for up to SSE_IDLE_TIMEOUT; a
+    # sync worker would be taken over (and killed by gunicorn's timeout), and
+    # a threaded one keeps a thread for other requests
+    threads = config.get('SERVER_THREADS')
+    if threads is not None and threads < 2:
+        return jsonify({'error': 'Streams need a threaded worker (gunicorn -k gthread --threads N)'}), 503
+    max_subscribers = config.get('SSE_MAX_SUBSCRIBERS', DEFAULT_MAX_SUBSCRIBERS)
+    change_hub.max_subscribers = max_subscribers if threads is None else min(max_subscribers, threads - 1)
+    change_hub.max_per_user = config.get('SSE_MAX_PER_USER', DEFAULT_MAX_PER_USER)
+    channel = change_hub.subscribe(current_user.id)
+    if channel is None:
+        return jsonify({'error': 'Too many open streams'}), 503, {'Retry-After': '30'}
+
+    # The stream can stay open for minutes; don't hold a pooled connection.
+    # The user's shard engine (see sharding.py) outlives the session.
+    engine = db.session.get_bind()
+    db.session.remove()
+    chunks = event_stream(change_hub, channel, engine, current_user.id,
+                          int(last_seen) if last_seen else 0,
+                          config.get('SSE_HEARTBEAT', DEFAULT_HEARTBEAT),
+                          config.get('SSE_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT))
+    response = current_app.response_class(chunks, mimetype='text/event-stream')
+    response.call_on_close(lambda: change_hub.unsubscribe(current_user.id))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@tasks.route('/stream/stats', methods=['GET'])
+@token_required
+def get_stream_stats(current_user):
+    return jsonify(change_hub.stats())
+
+@tasks.route('/expansion/stats', methods=['GET'])
+@token_required
+def get_expansion_stats(current_user):
+    return jsonify(expansion_buffer.stats())
+
+@tasks.route('/cache/stats', methods=['GET'])
+@token_required
+def get_cache_stats(current_user):
+    return jsonify(response_cache.stats())
+
 # Error handlers
 @tasks.errorhandler(404)
 def not_found_error(error):
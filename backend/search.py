@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+from sqlalchemy import column, select, table, text
+from models import db, Task
+from task_json import TASK_COLUMNS, task_layout
+
+# Full-text search over task titles and descriptions. The tasks_fts index
+# and the triggers keeping it in step with tasks are created by the
+# add_task_search migration.
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+tasks_fts = table('tasks_fts', column('rowid'))
+
+# A title hit counts ten times a description hit; owner is only a filter
+RANK = text('bm25(tasks_fts, 10.0, 1.0, 0.0)')
+
+INSERT_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+    "INSERT INTO tasks_fts (rowid, title, description, owner) "
+    "VALUES (new.id, new.title, new.description, 'u' || new.user_id); END")
+
+INDEX_TASKS = (
+    "INSERT INTO tasks_fts (rowid, title, description, owner) "
+    "SELECT id, title, description, 'u' || user_id FROM tasks")
+
+
+def match_expression(user_id, q):
+    """FTS5 query for the search box text `q`, or None if it has no words.
+
+    Every word has to appear in the title or description. Words are quoted,
+    so FTS5 syntax typed by a user is searched for as text. A word ending in
+    * is a prefix, and so is the last word, so results follow typing.
+    """
+    words = [word for word in q.split() if any(char.isalnum() for char in word)]
+    if not words:
+        return None
+    terms = []
+    for index, word in enumerate(words):
+        prefix = word.endswith('*') or index == len(words) - 1
+        terms.append('"%s"%s' % (word.rstrip('*').replace('"', '""'), '*' if prefix else ''))
+    return f'owner:u{user_id} AND {{title description}}: ({" ".join(terms)})'
+
+
+def search_json(user_id, q, list_id=None, completed=None, limit=DEFAULT_SEARCH_LIMIT, offset=0):
+    """JSON body of GET /search: a user's tasks matching `q`, best match first.
+
+    Tasks are flat (subtasks is always empty), in the format of to_dict.
+    """
+    match = match_expression(user_id, q)
+    if match is None:
+        return '[]\n'
+    stmt = (select(*TASK_COLUMNS)
+            .select_from(tasks_fts)
+            .join(Task, Task.id == tasks_fts.c.rowid)
+            .where(text('tasks_fts MATCH :match').bindparams(match=match), Task.user_id == user_id))
+    if list_id is not None:
+        stmt = stmt.where(Task.list_id == list_id)
+    if completed is not None:
+        stmt = stmt.where(Task.completed == completed)
+    rows = db.session.execute(stmt.order_by(RANK, Task.id).limit(limit).offset(offset))
+    layout = task_layout()
+    return '[' + ','.join([layout.encode(row, {}, depth=0) for row in rows]) + ']\n'
+
+
+def rebuild_search_index(conn):
+    """Refill tasks_fts from the tasks table."""
+    conn.execute(text("INSERT INTO tasks_fts (tasks_fts) VALUES ('delete-all')"))
+    conn.execute(text(INDEX_TASKS))
+
+
+@contextmanager
+def indexed_in_bulk(executor, first_id):
+    """Index the tasks inserted inside the block with one statement at the end.
+
+    For bulk inserts: FTS5 writes out its pending terms every time the
+    insert trigger runs, which makes a trigger per row several times slower
+    than one INSERT ... SELECT. The trigger is dropped and recreated within
+    the caller's transaction, so no other connection ever runs without it.
+    Tasks with ids from `first_id` up are indexed.
+    """
+    executor.execute(text('DROP TRIGGER tasks_fts_insert'))
+    yield
+    executor.execute(text(INDEX_TASKS + ' WHERE id >= :first_id'), {'first_id': first_id})
+    executor.execute(text(INSERT_TRIGGER))
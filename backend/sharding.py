@@ -0,0 +1,231 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from models import db, User, TodoList, Task, ArchivedTask, ListStats, Tombstone
+from archive import reserve_task_ids
+
+# Optional sharding: SHARD_DATABASE_URLS names SQLite databases that each
+# hold the lists and tasks of some of the users, so one user's write burst
+# only takes the write lock of its own shard. The main database keeps every
+# account and records in users.shard where each user's data lives; users
+# with shard None (everyone, until sharding is turned on and `flask
+# rebalance-shards` runs) stay in the main database.
+#
+# Every database has the full schema. A shard also has a users row for each
+# of its users, which carries the user's revision, so a write touches one
+# database only. When a user moves away, the old shard drops that row (the
+# main database keeps its own, with shard set), so writes routed there by a
+# stale token cache fail in User.bump_revision and route_user sends the next
+# request the right way.
+
+# Tables whose rows belong to one user (and carry user_id)
+USER_TABLES = (TodoList.__table__, Task.__table__, ArchivedTask.__table__, ListStats.__table__,
+               Tombstone.__table__)
+
+
+def bind_key(shard):
+    return f'shard{shard}'
+
+
+def shard_count():
+    return len(current_app.config.get('SHARD_DATABASE_URLS') or ())
+
+
+def engine_for(shard):
+    return db.engines[None if shard is None else bind_key(shard)]
+
+
+def databases():
+    """(shard, engine) for the main database (shard None) and every shard."""
+    return [(None, db.engines[None])] + [(shard, engine_for(shard)) for shard in range(shard_count())]
+
+
+def use_shard(shard, session=None):
+    """Send the session's statements to a shard (None: the main database)."""
+    (session or db.session).info['shard'] = None if shard is None else engine_for(shard)
+
+
+def home_shard(user_id):
+    """Where a user's data belongs with the configured shards."""
+    count = shard_count()
+    return user_id % count if count else None
+
+
+def place_user(user):
+    """Give a new user (flushed, so it has an id) its shard and the shard's users row.
+
+    Call before committing the main database; a no-op without sharding. The
+    two databases cannot commit together, so the shard row is committed
+    first and deleted again if the session rolls back instead of
+    committing. A row left over from a process that died in between is
+    replaced when its id is given out again.
+    """
+    user.shard = home_shard(user.id)
+    if user.shard is not None:
+        with engine_for(user.shard).begin() as conn:
+            conn.execute(User.__table__.insert().prefix_with('OR REPLACE').values(
+                id=user.id, username=user.username, password_hash='', created_at=user.created_at))
+        db.session.info.setdefault('placed_users', []).append((user.shard, user.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _keep_placed_users(session):
+    session.info.pop('placed_users', None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _remove_placed_users(session, previous_transaction):
+    for shard, user_id in session.info.pop('placed_users', ()):
+        with engine_for(shard).begin() as conn:
+            conn.execute(User.__table__.delete().where(User.__table__.c.id == user_id))
+
+
+def route_user(user):
+    """Route the session to the database holding the user's data; returns the user.
+
+    `user` is the UserSnapshot of token_required, possibly from the token
+    cache. Its shard is checked against the users row of that database
+    (one primary key read) and, if the user has moved since, looked up
+    again in the main database; the returned snapshot has the current shard.
+    """
+    use_shard(user.shard)
+    users = User.__table__
+    row = db.session.execute(select(users.c.id, users.c.shard).where(users.c.id == user.id)).first()
+    if row is not None and row.shard is None:
+        return user
+    use_shard(None)
+    user = user._replace(shard=db.session.execute(select(users.c.shard).where(users.c.id == user.id)).scalar())
+    use_shard(user.shard)
+    return user
+
+
+def _sqlite_path(engine):
+    url = make_url(engine.url)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        raise ValueError('Users can only be moved between SQLite database files')
+    return url.database
+
+
+def _shift_path(path, offset):
+    # '/12/40/' -> '/112/140/' for offset 100
+    return '/' + ''.join(f'{int(part) + offset}/' for part in path.strip('/').split('/') if part)
+
+
+def _copy_columns(table, exprs):
+    columns = [column.name for column in table.columns if not (table is Tombstone.__table__ and column.name == 'id')]
+    return ', '.join(columns), ', '.join(exprs.get(column, column) for column in columns)
+
+
+def _offset(conn, user_id, tables):
+    # 0 if none of the user's ids in `tables` is taken in the target database;
+    # otherwise what to add to them so they all land above the target's ids
+    for table in tables:
+        for other in tables:
+            if conn.exec_driver_sql(
+                    f'SELECT 1 FROM source.{table} AS moved WHERE moved.user_id = ? '
+                    f'AND EXISTS (SELECT 1 FROM main.{other} AS taken WHERE taken.id = moved.id) LIMIT 1',
+                    (user_id,)).first():
+                break
+        else:
+            continue
+        highest = max(conn.exec_driver_sql(f'SELECT COALESCE(MAX(id), 0) FROM main.{other}').scalar()
+                      for other in tables)
+        lowest = min(conn.exec_driver_sql(f'SELECT COALESCE(MIN(id), 0) FROM source.{table} WHERE user_id = ?',
+                                          (user_id,)).scalar() for table in tables)
+        return highest - lowest + 1
+    return 0
+
+
+def move_user(user_id, target):
+    """Move a user's lists, tasks, archive, stats and tombstones to another database.
+
+    target is a shard number or None for the main database. The source
+    database's write lock is held from the first copied row until its rows
+    are deleted, so no write of the user (or anyone else on that shard) can
+    slip in between. Ids are kept unless one of them is taken in the target;
+    then all of the user's lists, or tasks, get new ids above the target's,
+    with tombstones for the old ones so synced clients reload them. Returns
+    {table: rows moved}.
+    """
+    users = User.__table__
+    use_shard(None)
+    source = db.session.execute(select(users.c.shard).where(users.c.id == user_id)).scalar()
+    db.session.rollback()
+    if source == target:
+        return {}
+    main, source_engine, target_engine = engine_for(None), engine_for(source), engine_for(target)
+    moved = {}
+    with source_engine.connect() as src, target_engine.connect() as dst:
+        dst.exec_driver_sql('ATTACH DATABASE ? AS source', (_sqlite_path(source_engine),))
+        dst.connection.driver_connection.create_function('shift_path', 2, _shift_path, deterministic=True)
+        try:
+            src.exec_driver_sql('BEGIN IMMEDIATE')
+            # Not IMMEDIATE: that would try to lock the attached source too
+            dst.exec_driver_sql('BEGIN')
+            task_offset = _offset(dst, user_id, ('tasks', 'archived_tasks'))
+            list_offset = _offset(dst, user_id, ('todo_lists',))
+            renumbered = bool(task_offset or list_offset)
+            revision = dst.exec_driver_sql('SELECT revision FROM source.users WHERE id = ?', (user_id,)).scalar() + 1
+            pruned = dst.exec_driver_sql('SELECT pruned_revision FROM source.users WHERE id = ?', (user_id,)).scalar()
+            params = {'user_id': user_id, 'tasks': task_offset, 'lists': list_offset, 'revision': revision,
+                      'now': datetime.utcnow().isoformat(' ', 'microseconds')}
+
+            stamped = ':revision' if renumbered else 'revision'
+            exprs = {
+                'todo_lists': {'id': 'id + :lists', 'revision': stamped},
+                'tasks': {'id': 'id + :tasks', 'parent_id': 'parent_id + :tasks', 'list_id': 'list_id + :lists',
+                          'path': 'shift_path(path, :tasks)', 'revision': stamped},
+                'archived_tasks': {'id': 'id + :tasks', 'parent_id': 'parent_id + :tasks',
+                                   'root_id': 'root_id + :tasks', 'list_id': 'list_id + :lists',
+                                   'path': 'shift_path(path, :tasks)'},
+                'list_stats': {'list_id': 'list_id + :lists'},
+                'tombstones': {},
+            }
+            for table in USER_TABLES:
+                columns, values = _copy_columns(table, exprs[table.name])
+                result = dst.execute(db.text(
+                    f'INSERT INTO main.{table.name} ({columns}) '
+                    f'SELECT {values} FROM source.{table.name} WHERE user_id = :user_id'), params)
+                moved[table.name] = result.rowcount
+            for kind, table, offset in (('list', 'todo_lists', list_offset), ('task', 'tasks', task_offset)):
+                if offset:
+                    dst.execute(db.text(
+                        'INSERT INTO main.tombstones (user_id, kind, row_id, revision, deleted_at) '
+                        f"SELECT user_id, '{kind}', id, :revision, :now FROM source.{table} WHERE user_id = :user_id"),
+                        params)
+
+            if target is None:
+                dst.execute(users.update().where(users.c.id == user_id).values(
+                    shard=None, revision=revision, pruned_revision=pruned))
+            else:
+                dst.exec_driver_sql(
+                    'INSERT OR REPLACE INTO main.users '
+                    '(id, username, password_hash, created_at, revision, shard, pruned_revision) '
+                    "SELECT id, username, '', created_at, ?, NULL, ? FROM source.users WHERE id = ?",
+                    (revision, pruned, user_id))
+            # New tasks in the target must not take the ids of the moved
+            # archive or tombstones
+            reserve_task_ids(dst)
+            dst.commit()
+
+            # Record where the user is in the main database before the source
+            # lets go of the data; a shard forgets the user altogether
+            if source is None:
+                src.execute(users.update().where(users.c.id == user_id).values(shard=target))
+            else:
+                if target is not None:
+                    with main.begin() as conn:
+                        conn.execute(users.update().where(users.c.id == user_id).values(shard=target))
+                src.execute(users.delete().where(users.c.id == user_id))
+            for table in USER_TABLES:
+                src.execute(table.delete().where(table.c.user_id == user_id))
+            src.commit()
+        except Exception:
+            dst.rollback()
+            src.rollback()
+            raise
+        finally:
+            dst.exec_driver_sql('DETACH DATABASE source')
+    return moved
@@ -0,0 +1,69 @@
+from sqlalchemy import select, text
+from models import db, ListStats, TodoList
+
+# Task counts per list and per user for dashboards, read from the list_stats
+# summary table (see models.ListStats) instead of the tasks themselves.
+
+# What list_stats should hold, computed from the tasks table
+ACTUAL_STATS = (
+    'SELECT todo_lists.id AS list_id, todo_lists.user_id AS user_id, '
+    'COUNT(tasks.id) AS task_count, COALESCE(SUM(tasks.completed), 0) AS completed_count, '
+    'COALESCE(MAX(tasks.created_at), todo_lists.created_at) AS last_activity_at '
+    'FROM todo_lists LEFT JOIN tasks ON tasks.list_id = todo_lists.id '
+    'GROUP BY todo_lists.id'
+)
+
+
+def _summary(tasks, completed, last_activity_at):
+    return {
+        'tasks': tasks,
+        'completed': completed,
+        'completion_ratio': round(completed / tasks, 4) if tasks else None,
+        'last_activity_at': last_activity_at.isoformat() if last_activity_at else None,
+    }
+
+
+def user_stats(user_id):
+    """Body of GET /stats: counts for each of a user's lists and for the user.
+
+    One indexed read of the user's list_stats rows; the user's totals are
+    summed from them.
+    """
+    rows = db.session.execute(
+        select(ListStats.list_id, TodoList.title, ListStats.task_count,
+               ListStats.completed_count, ListStats.last_activity_at)
+        .join(TodoList, TodoList.id == ListStats.list_id)
+        .where(ListStats.user_id == user_id)
+        .order_by(ListStats.list_id)).all()
+    lists = [dict(_summary(tasks, completed, last_activity_at), list_id=list_id, title=title)
+             for list_id, title, tasks, completed, last_activity_at in rows]
+    user = _summary(sum(row.task_count for row in rows), sum(row.completed_count for row in rows),
+                    max((row.last_activity_at for row in rows if row.last_activity_at), default=None))
+    user['lists'] = len(rows)
+    return {'user': user, 'lists': lists}
+
+
+def stale_list_stats(conn):
+    """Ids of lists whose list_stats row is missing or disagrees with the tasks table."""
+    return [row[0] for row in conn.execute(text(
+        f'SELECT actual.list_id FROM ({ACTUAL_STATS}) AS actual '
+        'LEFT JOIN list_stats ON list_stats.list_id = actual.list_id '
+        'WHERE list_stats.list_id IS NULL OR list_stats.user_id != actual.user_id '
+        'OR list_stats.task_count != actual.task_count '
+        'OR list_stats.completed_count != actual.completed_count '
+        'UNION ALL '
+        'SELECT list_id FROM list_stats WHERE list_id NOT IN (SELECT id FROM todo_lists)'))]
+
+
+def rebuild_list_stats(conn):
+    """Recompute list_stats from the tasks table.
+
+    Keeps the recorded last_activity_at of lists that already have a row;
+    new rows take the creation time of the list's newest task.
+    """
+    conn.execute(text('DELETE FROM list_stats WHERE list_id NOT IN (SELECT id FROM todo_lists)'))
+    conn.execute(text(
+        'INSERT INTO list_stats (list_id, user_id, task_count, completed_count, last_activity_at) '
+        f'SELECT list_id, user_id, task_count, completed_count, last_activity_at FROM ({ACTUAL_STATS}) WHERE true '
+        'ON CONFLICT (list_id) DO UPDATE SET user_id = excluded.user_id, '
+        'task_count = excluded.task_count, completed_count = excluded.completed_count'))
@@ -0,0 +1,60 @@
+import json
+from sqlalchemy import select, text
+from models import db, Task, TodoList, Tombstone, User
+from task_json import TASK_COLUMNS, task_layout
+
+
+def _compact(obj):
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True)
+
+
+def changes_json(user_id, since):
+    """JSON body of GET /changes: everything that changed for a user after revision `since`.
+
+    Holds the lists and tasks written after `since` (tasks flat, without
+    nested subtasks) plus the ids deleted since then, each read with one range
+    scan over its (user_id, revision) index. Rows are bounded by the revision
+    read first, so a write committing mid-request is left for the next call
+    instead of being half reported.
+
+    Tombstones older than the retention period are pruned. When `since` is
+    above 0 but below the user's highest pruned revision, the deletions in between are
+    lost, so the body has "reset": true and every live list and task, as for
+    since=0; the client drops whatever else it holds.
+    """
+    user = db.session.execute(select(User.revision, User.pruned_revision).where(User.id == user_id)).first()
+    revision, pruned = (user.revision, user.pruned_revision) if user else (0, 0)
+    reset = 0 < since < pruned
+    if reset:
+        since = 0
+
+    def changed(model, *columns):
+        return db.session.execute(
+            select(*columns).where(model.user_id == user_id, model.revision > since, model.revision <= revision)
+            .order_by(model.revision, model.id))
+
+    deleted = {'lists': [], 'tasks': []}
+    if not reset:
+        for kind, row_id in changed(Tombstone, Tombstone.kind, Tombstone.row_id):
+            deleted[f'{kind}s'].append(row_id)
+
+    lists = [{'id': lst.id, 'title': lst.title} for lst in changed(TodoList, TodoList.id, TodoList.title)]
+    layout = task_layout()
+    tasks = ','.join([layout.encode(row, {}, depth=0) for row in changed(Task, *TASK_COLUMNS)])
+    return (f'{{"deleted":{_compact(deleted)},"lists":{_compact(lists)},"reset":{_compact(reset)},'
+            f'"revision":{revision},"tasks":[{tasks}]}}\n')
+
+
+def prune_tombstones(conn, cutoff):
+    """Delete tombstones written before `cutoff`; returns how many.
+
+    Records the highest pruned revision of each user it touches (see
+    changes_json) and bumps their revision, so cached /changes responses
+    are not served again.
+    """
+    params = {'cutoff': cutoff.isoformat(' ', 'microseconds')}
+    conn.execute(text(
+        'UPDATE users SET revision = revision + 1, pruned_revision = MAX(pruned_revision, '
+        '(SELECT MAX(revision) FROM tombstones WHERE user_id = users.id AND deleted_at < :cutoff)) '
+        'WHERE id IN (SELECT user_id FROM tombstones WHERE deleted_at < :cutoff)'), params)
+    return conn.execute(text('DELETE FROM tombstones WHERE deleted_at < :cutoff'), params).rowcount
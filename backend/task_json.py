@@ -0,0 +1,113 @@
+import json.encoder
+from functools import lru_cache
+from models import Task
+from expansion_buffer import expansion_buffer
+
+# JSON for plain Core task rows, byte-for-byte what jsonify(task.to_dict())
+# produces (sorted keys, compact separators, ASCII escapes) without building
+# ORM objects or dicts. The read routes select TASK_COLUMNS and encode the
+# rows with a layout built once per set of requested fields.
+
+# The C string encoder json.dumps itself uses, when the interpreter has it
+encode_string = json.encoder.c_encode_basestring_ascii or json.encoder.py_encode_basestring_ascii
+
+TASK_COLUMNS = (Task.id, Task.title, Task.description, Task.completed, Task.list_id, Task.parent_id,
+                Task.is_expanded, Task.created_at, Task.subtask_total, Task.subtask_completed, Task.position,
+                Task.user_id)
+
+_LITERALS = {True: 'true', False: 'false', None: 'null'}
+# Toggles not yet flushed to the database, by (user_id, id) since task ids
+# repeat across shards (see expansion_buffer.py)
+_BUFFERED = expansion_buffer.values
+
+# Rows are read by position: name lookups on a Row cost more than the
+# rest of the encoding put together
+_INDEX = {column.key: position for position, column in enumerate(TASK_COLUMNS)}
+_ID = _INDEX['id']
+_USER_ID = _INDEX['user_id']
+_IS_EXPANDED = _INDEX['is_expanded']
+_SUBTASK_TOTAL = _INDEX['subtask_total']
+_SUBTASK_COMPLETED = _INDEX['subtask_completed']
+_CREATED_AT = _INDEX['created_at']
+
+
+def _literal(key):
+    index = _INDEX[key]
+    return lambda row: _LITERALS[row[index]]
+
+
+def _integer(key):
+    index = _INDEX[key]
+    return lambda row: str(row[index])
+
+
+def _string(key):
+    index = _INDEX[key]
+    return lambda row: encode_string(row[index])
+
+
+def _nullable(key, encode):
+    index = _INDEX[key]
+    return lambda row: 'null' if row[index] is None else encode(row[index])
+
+
+def _created_at(row):
+    return f'"{row[_CREATED_AT].isoformat()}"'
+
+
+def _is_expanded(row):
+    expanded = row[_IS_EXPANDED]
+    if _BUFFERED:
+        expanded = _BUFFERED.get((row[_USER_ID], row[_ID]), expanded)
+    return _LITERALS[expanded]
+
+
+def _completion_fraction(row):
+    total = row[_SUBTASK_TOTAL]
+    return f'"{row[_SUBTASK_COMPLETED]}/{total}"' if total else 'null'
+
+
+# How each key of Task.to_dict is encoded from a row; subtasks (None here)
+# arrive encoded. to_dict defines the set of keys, json.dumps their order.
+_ENCODERS = {
+    'completed': _literal('completed'),
+    'completion_fraction': _completion_fraction,
+    'created_at': _created_at,
+    'description': _nullable('description', encode_string),
+    'id': _integer('id'),
+    'is_expanded': _is_expanded,
+    'list_id': _integer('list_id'),
+    'parent_id': _nullable('parent_id', str),
+    'position': _string('position'),
+    'subtasks': None,
+    'title': _string('title'),
+}
+
+
+class TaskLayout:
+    """The keys of one set of fields, in output order, each with its encoder."""
+
+    def __init__(self, fields):
+        keys = sorted(set(fields))
+        self.nested = 'subtasks' in keys
+        self.members = [(f'"{key}":', _ENCODERS[key]) for key in keys]
+
+    def encode(self, row, children, depth=None):
+        """JSON for `row` and, down to `depth` levels, the rows under it in `children`."""
+        subtasks = ''
+        if self.nested and depth != 0:
+            child_depth = None if depth is None else depth - 1
+            subtasks = ','.join([self.encode(child, children, child_depth)
+                                 for child in children.get(row[_ID], ())])
+        return '{' + ','.join([name + (f'[{subtasks}]' if encoder is None else encoder(row))
+                               for name, encoder in self.members]) + '}'
+
+
+@lru_cache(maxsize=64)
+def _layout(fields):
+    return TaskLayout(fields)
+
+
+def task_layout(fields=None):
+    """Layout for ?fields= (None means every key of Task.to_dict)."""
+    return _layout(tuple(sorted(set(_ENCODERS if fields is None else fields))))
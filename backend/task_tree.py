@@ -0,0 +1,326 @@
+import base64
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import Integer, func, insert, literal, select, text, tuple_
+from models import db, Task, TodoList, Tombstone, User, ListStats, ArchivedTask
+from task_json import TASK_COLUMNS, encode_string, task_layout
+from positions import place
+
+# Keys a client may ask for with ?fields=
+TASK_FIELDS = ('id', 'title', 'description', 'completed', 'list_id', 'parent_id',
+               'is_expanded', 'position', 'subtasks', 'created_at', 'completion_fraction')
+# Rows fetched per query when walking a list in keyset order
+PAGE_SIZE = 500
+
+# Every task under the rows matched by {roots}, found by walking parent_id
+SUBTREE_CTE = (
+    'WITH RECURSIVE subtree(id) AS ('
+    'SELECT id FROM tasks WHERE {roots} '
+    'UNION ALL '
+    'SELECT tasks.id FROM tasks JOIN subtree ON tasks.parent_id = subtree.id) '
+)
+
+
+def _children_map(rows):
+    children = defaultdict(list)
+    for row in rows:
+        children[row.parent_id].append(row)
+    return children
+
+
+def _task_rows(*criteria):
+    # Siblings in order, so every children list of _children_map is too
+    return db.session.execute(select(*TASK_COLUMNS).where(*criteria).order_by(Task.position, Task.id)).all()
+
+
+def _list_json(list_id, title, tasks_json):
+    return f'{{"id":{list_id},"tasks":[{tasks_json}],"title":{encode_string(title)}}}'
+
+
+def user_lists_json(user_id):
+    """JSON body of GET /lists: every list of a user together with its task tree.
+
+    Lists and tasks are fetched with one query each and the parent/child
+    structure is rebuilt in memory, so the number of queries does not depend
+    on how many lists, tasks or nesting levels the user has.
+    """
+    lists = db.session.execute(select(TodoList.id, TodoList.title)
+                               .where(TodoList.user_id == user_id).order_by(TodoList.id)).all()
+    children = _children_map(_task_rows(Task.user_id == user_id))
+
+    roots = defaultdict(list)
+    for row in children[None]:
+        roots[row.list_id].append(row)
+
+    layout = task_layout()
+    return '[' + ','.join([
+        _list_json(lst.id, lst.title, ','.join([layout.encode(row, children) for row in roots[lst.id]]))
+        for lst in lists]) + ']\n'
+
+
+def list_tasks_json(user_id, list_id):
+    """JSON body of GET /lists/<id>/tasks: the list's top-level tasks with their trees."""
+    children = _children_map(_task_rows(Task.user_id == user_id, Task.list_id == list_id))
+    layout = task_layout()
+    return '[' + ','.join([layout.encode(row, children) for row in children[None]]) + ']\n'
+
+
+def subtree_json(user_id, task_id):
+    """JSON body of GET /tasks/<id>: one task and everything under it, or None."""
+    root = db.session.execute(select(*TASK_COLUMNS, Task.path)
+                              .where(Task.id == task_id, Task.user_id == user_id)).first()
+    if root is None:
+        return None
+    children = _children_map(_task_rows(Task.user_id == user_id, Task.path_range(f'{root.path}{root.id}/')))
+    return task_layout().encode(root, children) + '\n'
+
+
+def keyset_order(model):
+    # Lists are walked in creation order, top-level tasks in sibling order
+    return (model.position, model.id) if model is Task else (model.created_at, model.id)
+
+
+def encode_cursor(row, model):
+    key, row_id = (getattr(row, column.key) for column in keyset_order(model))
+    raw = f'{key if model is Task else key.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    key, row_id = raw.rsplit('|', 1)
+    return key if model is Task else datetime.fromisoformat(key), int(row_id)
+
+
+def keyset_page(stmt, model, after=None, limit=PAGE_SIZE):
+    """One page of the rows of select `stmt` in keyset_order, after a cursor position."""
+    order = keyset_order(model)
+    if after is not None:
+        stmt = stmt.where(tuple_(*order) > after)
+    return db.session.execute(stmt.order_by(*order).limit(limit)).all()
+
+
+def iter_keyset_pages(stmt, model, after=None, page_size=PAGE_SIZE):
+    while True:
+        page = keyset_page(stmt, model, after, page_size)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after = tuple(getattr(page[-1], column.key) for column in keyset_order(model))
+
+
+def load_descendants(user_id, roots, depth=None):
+    """children map (parent_id -> [row]) for `roots`, one query per level."""
+    children = defaultdict(list)
+    level = [row.id for row in roots]
+    while level and (depth is None or depth > 0):
+        next_level = []
+        for start in range(0, len(level), PAGE_SIZE):
+            for row in _task_rows(Task.user_id == user_id, Task.parent_id.in_(level[start:start + PAGE_SIZE])):
+                children[row.parent_id].append(row)
+                next_level.append(row.id)
+        level = next_level
+        if depth is not None:
+            depth -= 1
+    return children
+
+
+def serialize_roots(user_id, roots, fields=None, depth=None):
+    """Encoded tasks for a page of root rows, nested down to `depth` levels."""
+    layout = task_layout(fields)
+    if not layout.nested:
+        depth = 0
+    children = load_descendants(user_id, roots, depth)
+    return [layout.encode(row, children, depth) for row in roots]
+
+
+def iter_list_tasks(user_id, list_id, after=None, roots=None, fields=None, depth=None):
+    """Yield encoded top-level tasks of a list a page at a time.
+
+    With `roots` given only those rows are serialized; otherwise the list is
+    walked from `after` with keyset pagination so memory stays bounded by the
+    page size rather than the list size.
+    """
+    if roots is None:
+        stmt = select(*TASK_COLUMNS).where(Task.user_id == user_id, Task.list_id == list_id,
+                                           Task.parent_id.is_(None))
+        pages = iter_keyset_pages(stmt, Task, after)
+    else:
+        pages = (roots[start:start + PAGE_SIZE] for start in range(0, len(roots), PAGE_SIZE))
+    for page in pages:
+        yield serialize_roots(user_id, page, fields, depth)
+
+
+def stream_json_array(chunks, end=']\n'):
+    """Join an iterable of lists of encoded items into one JSON array, one piece per chunk."""
+    yield '['
+    first = True
+    for items in chunks:
+        if items:
+            yield ('' if first else ',') + ','.join(items)
+            first = False
+    yield end
+
+
+def stream_lists(user_id, lists, fields=None, depth=None):
+    """Stream lists in the get_lists format, each with its tasks streamed in pages."""
+    yield '['
+    for index, lst in enumerate(lists):
+        yield f'{"," if index else ""}{{"id":{lst.id},"tasks":'
+        yield from stream_json_array(iter_list_tasks(user_id, lst.id, fields=fields, depth=depth), end=']')
+        yield f',"title":{encode_string(lst.title)}}}'
+    yield ']\n'
+
+
+def _changes(executor):
+    # pysqlite reports rowcount -1 for statements that start with WITH
+    return executor.execute(text('SELECT changes()')).scalar()
+
+
+def _subtree(task):
+    # The task itself plus one range scan over Task.path for its descendants
+    return Task.query.filter(task.subtree_filter())
+
+
+def _uncount_subtree(task):
+    # Take the subtree off the ListStats of the lists its tasks are in (a tree
+    # moved before moves detached subtasks can span lists); returns the
+    # (tasks, completed tasks) taken off
+    rows = _subtree(task).with_entities(Task.list_id, func.count(Task.id), func.sum(Task.completed, type_=Integer)) \
+        .group_by(Task.list_id).all()
+    for list_id, total, completed in rows:
+        ListStats.bump(db.session, list_id, tasks=-total, completed=-(completed or 0))
+    return sum(row[1] for row in rows), sum(row[2] or 0 for row in rows)
+
+
+def subtree_ids(task):
+    return [row.id for row in _subtree(task).with_entities(Task.id)]
+
+
+def load_subtree(task):
+    """children map (parent_id -> [Task]) for everything under `task`, in one query."""
+    children = defaultdict(list)
+    for descendant in Task.query.filter(Task.user_id == task.user_id,
+                                        task.descendants_filter()).order_by(Task.position, Task.id):
+        children[descendant.parent_id].append(descendant)
+    return children
+
+
+def move_subtree(task, list_id, before_id=None, after_id=None):
+    """Move a task and all of its descendants to another list with one UPDATE.
+
+    The task goes between its new siblings after_id and before_id, or last
+    if the list changes and neither is given (see positions.place); only
+    its own position changes. A subtask moved to another list leaves its
+    parent, which stays behind, and becomes a top-level task there.
+    """
+    detach = list_id != task.list_id and task.parent_id is not None
+    parent_id = None if detach else task.parent_id
+    position = task.position
+    if list_id != task.list_id or before_id is not None or after_id is not None:
+        position = place(task, list_id, parent_id, before_id, after_id)
+    values = {Task.list_id: list_id, Task.revision: User.bump_revision(task.user_id)}
+    if list_id != task.list_id:
+        total, completed = _uncount_subtree(task)
+        ListStats.bump(db.session, list_id, tasks=total, completed=completed)
+    if detach:
+        Task.bump_subtask_counters(task.parent_id, task.user_id,
+                                   total=-1, completed=-int(bool(task.completed)))
+        # The task's path becomes '/' and its descendants lose the same prefix
+        values[Task.path] = literal('/') + func.substr(Task.path, len(task.path) + 1)
+    # The default 'evaluate' sync also updates the already-loaded task objects
+    _subtree(task).update(values)
+    if detach:
+        task.parent_id = None
+    task.position = position
+
+
+def _bury(user_id, kind, ids):
+    # Tombstones for rows about to be deleted; ids is a select of their ids
+    revision = User.bump_revision(user_id)
+    db.session.execute(insert(Tombstone).from_select(
+        ['user_id', 'kind', 'row_id', 'revision', 'deleted_at'],
+        select(literal(user_id), literal(kind), ids.c.id, literal(revision), literal(datetime.utcnow()))))
+
+
+def delete_subtree(task):
+    """Delete a task and all of its descendants without loading them.
+
+    Runs as one DELETE in the caller's transaction and detaches `task` from
+    the session. Returns the number of deleted rows.
+    """
+    Task.bump_subtask_counters(task.parent_id, task.user_id,
+                               total=-1, completed=-int(bool(task.completed)))
+    _uncount_subtree(task)
+    _bury(task.user_id, 'task', _subtree(task).with_entities(Task.id).subquery())
+    deleted = _subtree(task).delete(synchronize_session=False)
+    db.session.expunge(task)
+    return deleted
+
+
+def delete_list_tree(todo_list):
+    """Delete a list, every task tree rooted in it (archived ones too), and the list row itself."""
+    revision = User.bump_revision(todo_list.user_id)
+    db.session.execute(
+        text(SUBTREE_CTE.format(roots='list_id = :list_id AND parent_id IS NULL')
+             + 'INSERT INTO tombstones (user_id, kind, row_id, revision, deleted_at) '
+             "SELECT :user_id, 'task', id, :revision, :deleted_at FROM subtree"),
+        {'list_id': todo_list.id, 'user_id': todo_list.user_id, 'revision': revision,
+         'deleted_at': datetime.utcnow().isoformat(' ', 'microseconds')})
+    db.session.add(Tombstone(user_id=todo_list.user_id, kind='list',
+                             row_id=todo_list.id, revision=revision))
+    db.session.execute(
+        text(SUBTREE_CTE.format(roots='list_id = :list_id AND parent_id IS NULL')
+             + 'DELETE FROM tasks WHERE id IN (SELECT id FROM subtree)'),
+        {'list_id': todo_list.id})
+    deleted = _changes(db.session)
+    TodoList.query.filter_by(id=todo_list.id).delete(synchronize_session=False)
+    ListStats.query.filter_by(list_id=todo_list.id).delete(synchronize_session=False)
+    ArchivedTask.query.filter_by(list_id=todo_list.id).delete(synchronize_session=False)
+    db.session.expunge(todo_list)
+    return deleted
+
+
+def delete_orphans(conn):
+    """Remove task trees whose parent task or (for roots) whose list no longer exists."""
+    conn.execute(text(SUBTREE_CTE.format(
+        roots='(parent_id IS NULL AND list_id NOT IN (SELECT id FROM todo_lists)) '
+              'OR (parent_id IS NOT NULL AND parent_id NOT IN (SELECT id FROM tasks))')
+        + 'DELETE FROM tasks WHERE id IN (SELECT id FROM subtree)'))
+    return _changes(conn)
+
+
+def rebuild_paths(conn):
+    """Recompute Task.path for every task from parent_id.
+
+    Descendants also take their root's list_id, which older versions did not
+    update when a task was moved to another list. Tasks that cannot be
+    reached from a root (orphans) are left as they are.
+    """
+    conn.execute(text('CREATE TEMP TABLE task_paths (id INTEGER PRIMARY KEY, path TEXT, list_id INTEGER)'))
+    conn.execute(text(
+        'INSERT INTO task_paths (id, path, list_id) '
+        'WITH RECURSIVE walk(id, path, list_id) AS ('
+        "SELECT id, '/', list_id FROM tasks WHERE parent_id IS NULL "
+        'UNION ALL '
+        "SELECT tasks.id, walk.path || tasks.parent_id || '/', walk.list_id "
+        'FROM tasks JOIN walk ON tasks.parent_id = walk.id) '
+        'SELECT id, path, list_id FROM walk'))
+    conn.execute(text(
+        'UPDATE tasks SET '
+        'path = (SELECT path FROM task_paths WHERE task_paths.id = tasks.id), '
+        'list_id = (SELECT list_id FROM task_paths WHERE task_paths.id = tasks.id) '
+        'WHERE id IN (SELECT id FROM task_paths)'))
+    conn.execute(text('DROP TABLE task_paths'))
+
+
+def rebuild_subtask_counters(conn):
+    """Recompute Task.subtask_total/subtask_completed for every task from scratch."""
+    conn.execute(text(
+        'UPDATE tasks SET '
+        'subtask_total = (SELECT COUNT(*) FROM tasks AS child WHERE child.parent_id = tasks.id), '
+        'subtask_completed = (SELECT COUNT(*) FROM tasks AS child '
+        'WHERE child.parent_id = tasks.id AND child.completed)'
+    ))
@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from app import create_app
+from response_cache import response_cache
+from token_cache import token_cache
+
+PASSWORD = 'secret1'
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    # Process-wide caches keyed by user id, which repeats across test databases
+    response_cache.clear()
+    token_cache.clear()
+    yield
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """create_app on a scratch SQLite file in tmp_path; keyword arguments override the config."""
+    def make(**config):
+        config.setdefault('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'todo.db'}")
+        config.setdefault('PASSWORD_HASH_WORKERS', 0)
+        return create_app(config)
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+def login(client, username):
+    """Sign up and log in through the API; returns the Authorization headers."""
+    client.post('/api/auth/signup', json={'username': username, 'password': PASSWORD})
+    response = client.post('/api/auth/login', json={'username': username, 'password': PASSWORD})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+from conftest import login
+from archive import archive_batch
+from models import db
+
+
+def _complete_long_ago(app, task_id):
+    with app.app_context():
+        db.session.execute(db.text('UPDATE tasks SET completed = 1, completed_at = :old WHERE id = :id'),
+                           {'old': datetime.utcnow() - timedelta(days=200), 'id': task_id})
+        db.session.commit()
+
+
+def _archive(app):
+    with app.app_context():
+        return archive_batch(datetime.utcnow() - timedelta(days=90))
+
+
+def test_archive_again_after_deleting_the_newest_tasks(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+
+    first = client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'First'}, headers=headers).get_json()['id']
+    _complete_long_ago(app, first)
+    assert _archive(app) == (1, 1)
+
+    # Without AUTOINCREMENT SQLite would hand the archived (highest) id out again
+    second = client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'Second'}, headers=headers).get_json()['id']
+    assert second != first
+    _complete_long_ago(app, second)
+    assert _archive(app) == (1, 1)
+
+    archived = client.get('/api/tasks/archive', headers=headers).get_json()
+    assert [entry['task']['id'] for entry in archived] == [second, first]
+    for task_id in (first, second):
+        response = client.post(f'/api/tasks/archive/{task_id}/restore', headers=headers)
+        assert response.status_code == 201 and response.get_json()['id'] == task_id
+    assert client.get('/api/tasks/archive', headers=headers).get_json() == []
@@ -0,0 +1,129 @@
+import pytest
+from conftest import login
+from models import db
+
+
+def _seed(client, headers):
+    lists = [client.post('/api/tasks/lists', json={'title': title}, headers=headers).get_json()['id']
+             for title in ('Home', 'Work')]
+    tasks = [client.post(f'/api/tasks/lists/{lists[0]}/tasks', json={'title': title}, headers=headers).get_json()['id']
+             for title in ('One', 'Two', 'Three')]
+    child = client.post(f'/api/tasks/add/{tasks[0]}/subtasks/create', json={'title': 'Child'},
+                        headers=headers).get_json()['id']
+    return lists, tasks, child
+
+
+def _state(app):
+    # Everything a batch can write, to compare before and after
+    with app.app_context():
+        return [db.session.execute(db.text(sql)).all() for sql in (
+            'SELECT * FROM tasks ORDER BY id', 'SELECT * FROM list_stats ORDER BY list_id',
+            'SELECT id, revision FROM users ORDER BY id', "SELECT * FROM tombstones ORDER BY id")]
+
+
+def _batch(client, headers, operations):
+    return client.post('/api/tasks/batch', json={'operations': operations}, headers=headers)
+
+
+def _titles(client, headers, list_id):
+    return [task['title'] for task in
+            client.get(f'/api/tasks/lists/{list_id}/tasks', headers=headers).get_json()]
+
+
+def test_failing_operation_rolls_back_the_batch(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    lists, tasks, child = _seed(client, headers)
+    before = _state(app)
+
+    # Every kind of operation succeeds before the fifth fails while running
+    response = _batch(client, headers, [
+        {'op': 'create', 'ref': 'new', 'list_id': lists[0], 'title': 'New'},
+        {'op': 'create', 'parent_id': 'new', 'title': 'New child', 'completed': True},
+        {'op': 'update', 'id': tasks[1], 'title': 'Renamed', 'list_id': lists[1]},
+        {'op': 'complete', 'id': child},
+        {'op': 'move', 'id': tasks[2], 'list_id': lists[0], 'before_id': child},
+        {'op': 'delete', 'id': tasks[0]},
+    ])
+    assert response.status_code == 400
+    assert response.get_json() == {'error': f'before_id {child} is not a sibling of the task', 'index': 4}
+    assert _state(app) == before
+
+    # After a delete, later operations on the subtree fail and take it back too
+    response = _batch(client, headers, [
+        {'op': 'delete', 'id': tasks[0]},
+        {'op': 'update', 'id': child, 'title': 'Gone'},
+    ])
+    assert response.status_code == 400 and response.get_json()['index'] == 1
+    assert _state(app) == before
+
+
+@pytest.mark.parametrize('operation, status', [
+    ({'op': 'rename', 'id': 'task'}, 400),
+    ({'op': 'create', 'list_id': 'list'}, 400),
+    ({'op': 'create', 'title': 'No list'}, 400),
+    ({'op': 'update', 'title': 'No id'}, 400),
+    ({'op': 'move', 'id': 'task'}, 400),
+    ({'op': 'update', 'id': True}, 400),
+    ({'op': 'update', 'id': 'other', 'title': 'Not mine'}, 404),
+    ({'op': 'create', 'list_id': 'other_list', 'title': 'Not my list'}, 404),
+    ({'op': 'complete', 'id': 'missing'}, 404),
+])
+def test_errors_carry_the_index_of_the_failing_operation(app, operation, status):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    lists, tasks, child = _seed(client, headers)
+    other_headers = login(client, 'bob')
+    other_list = client.post('/api/tasks/lists', json={'title': 'Bob'}, headers=other_headers).get_json()['id']
+    other = client.post(f'/api/tasks/lists/{other_list}/tasks', json={'title': 'Bob'},
+                        headers=other_headers).get_json()['id']
+    values = {'task': child, 'list': lists[0], 'other': other, 'other_list': other_list, 'missing': 'no-such-ref'}
+    operation = {key: values.get(value, value) if isinstance(value, str) and key != 'op' else value
+                 for key, value in operation.items()}
+    before = _state(app)
+
+    for index in (0, 2):
+        valid = [{'op': 'update', 'id': tasks[1], 'title': 'Renamed'}, {'op': 'delete', 'id': child}]
+        operations = valid[:index] + [operation] + valid[index:]
+        response = _batch(client, headers, operations)
+        assert response.status_code == status
+        assert response.get_json()['index'] == index
+        assert _state(app) == before
+
+
+def test_moves_inside_a_batch(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    lists, tasks, child = _seed(client, headers)
+
+    response = _batch(client, headers, [
+        {'op': 'create', 'ref': 'a', 'list_id': lists[1], 'title': 'A'},
+        {'op': 'create', 'ref': 'b', 'list_id': lists[1], 'title': 'B'},
+        {'op': 'create', 'ref': 'a1', 'parent_id': 'a', 'title': 'A1', 'completed': True},
+        # Existing and new tasks, into the gaps of the new ones
+        {'op': 'move', 'id': tasks[1], 'list_id': lists[1], 'after_id': 'a', 'before_id': 'b'},
+        {'op': 'move', 'id': tasks[2], 'list_id': lists[1], 'before_id': 'a'},
+        {'op': 'move', 'id': 'b', 'list_id': lists[1], 'before_id': tasks[2]},
+        # A subtask leaves its parent, and a new tree changes list
+        {'op': 'move', 'id': child, 'list_id': lists[1]},
+        {'op': 'move', 'id': 'a', 'list_id': lists[0]},
+    ])
+    assert response.status_code == 200, response.get_json()
+    results = response.get_json()['results']
+    assert [result['index'] for result in results] == list(range(8))
+    assert [result['ref'] for result in results[:3]] == ['a', 'b', 'a1']
+
+    assert _titles(client, headers, lists[1]) == ['B', 'Three', 'Two', 'Child']
+    assert _titles(client, headers, lists[0]) == ['One', 'A']
+    one, new = client.get(f'/api/tasks/lists/{lists[0]}/tasks', headers=headers).get_json()
+    assert one['subtasks'] == [] and one['completion_fraction'] is None
+    assert [subtask['title'] for subtask in new['subtasks']] == ['A1'] and new['completion_fraction'] == '1/1'
+
+    with app.app_context():
+        stats = dict(db.session.execute(db.text('SELECT list_id, task_count FROM list_stats')).all())
+        counters = {row.title: tuple(row[1:]) for row in db.session.execute(db.text(
+            'SELECT title, subtask_total, subtask_completed FROM tasks'))}
+        paths = dict(db.session.execute(db.text('SELECT title, path FROM tasks')).all())
+    assert stats == {lists[0]: 3, lists[1]: 4}
+    assert counters['One'] == (0, 0) and counters['A'] == (1, 1)
+    assert paths['Child'] == '/' and paths['A1'] == f"/{results[0]['id']}/"
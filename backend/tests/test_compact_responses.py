@@ -0,0 +1,85 @@
+from conftest import login
+
+
+def _find(tasks, task_id):
+    for task in tasks:
+        if task['id'] == task_id:
+            return task
+        found = _find(task['subtasks'], task_id)
+        if found:
+            return found
+    return None
+
+
+def _assert_matches_reread(client, headers, list_id, body):
+    """Assert a compact body agrees with a full read of the list."""
+    tree = client.get(f'/api/tasks/lists/{list_id}/tasks', headers=headers).get_json()
+    if 'task' in body:
+        # Flat, as to_dict(include_subtasks=False), which has no completion_fraction
+        task = _find(tree, body['task']['id'])
+        assert body['task'] == {key: [] if key == 'subtasks' else task[key] for key in body['task']}
+    parent = body['parent']
+    if parent is None:
+        return
+    full = _find(tree, parent['id'])
+    total = len(full['subtasks'])
+    completed = sum(subtask['completed'] for subtask in full['subtasks'])
+    assert parent == {
+        'id': full['id'],
+        'completed': full['completed'],
+        'subtask_total': total,
+        'subtask_completed': completed,
+        'completion_fraction': f'{completed}/{total}' if total else None,
+    }
+    assert full['completion_fraction'] == parent['completion_fraction']
+
+
+def test_compact_responses_match_a_full_reread(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+    root = client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'Root'}, headers=headers).get_json()['id']
+    compact = {'response': 'compact'}
+
+    def create(parent_id, title):
+        response = client.post(f'/api/tasks/add/{parent_id}/subtasks/create', json={'title': title},
+                               query_string=compact, headers=headers)
+        assert response.status_code == 201
+        _assert_matches_reread(client, headers, list_id, response.get_json())
+        return response.get_json()['task']['id']
+
+    def complete(task_id, completed=True):
+        response = client.put(f'/api/tasks/complete/subtask/{task_id}', json={'completed': completed},
+                              query_string=compact, headers=headers)
+        assert response.status_code == 200
+        _assert_matches_reread(client, headers, list_id, response.get_json())
+
+    def update(parent_id, task_id, **fields):
+        response = client.put(f'/api/tasks/update/{parent_id}/subtasks/update/{task_id}', json=fields,
+                              query_string=compact, headers=headers)
+        assert response.status_code == 200
+        _assert_matches_reread(client, headers, list_id, response.get_json())
+
+    def delete(parent_id, task_id):
+        response = client.delete(f'/api/tasks/delete/{parent_id}/subtasks/delete/{task_id}',
+                                 query_string=compact, headers=headers)
+        assert response.status_code == 200 and response.get_json()['id'] == task_id
+        _assert_matches_reread(client, headers, list_id, response.get_json())
+
+    first, second, third = create(root, 'First'), create(root, 'Second'), create(root, 'Third')
+    nested = create(first, 'Nested')
+    complete(first)
+    complete(second)
+    complete(nested)
+    # Completing twice changes nothing
+    complete(second)
+    complete(second, completed=False)
+    update(root, third, title='Renamed', completed=True)
+    update(root, third, completed=False)
+    update(first, nested, completed=False)
+    # Deleting a completed subtask with subtasks of its own
+    delete(root, first)
+    delete(root, third)
+    # A top-level task has no parent
+    complete(root)
+    delete(root, second)
@@ -0,0 +1,42 @@
+from conftest import login
+from expansion_buffer import expansion_buffer
+from models import db
+from sharding import engine_for
+
+
+def test_overlapping_task_ids_on_two_shards(make_app, tmp_path):
+    app = make_app(EXPANSION_FLUSH_MS=60000,
+                   SHARD_DATABASE_URLS=[f"sqlite:///{tmp_path / f'shard{n}.db'}" for n in range(2)])
+    client = app.test_client()
+    alice, bob = login(client, 'alice'), login(client, 'bob')
+
+    task_ids = []
+    for headers in (alice, bob):
+        list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+        response = client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'Task'}, headers=headers)
+        task_ids.append(response.get_json()['id'])
+    # Each shard numbers its tasks from 1
+    assert task_ids[0] == task_ids[1]
+    task_id = task_ids[0]
+
+    assert client.put(f'/api/tasks/toggle/{task_id}', headers=alice).get_json()['is_expanded'] is False
+    # Bob's task with the same id is untouched, on every read path
+    assert client.get(f'/api/tasks/tasks/{task_id}', headers=bob).get_json()['is_expanded'] is True
+    assert client.get('/api/tasks/lists', headers=bob).get_json()[0]['tasks'][0]['is_expanded'] is True
+
+    response = client.put(f'/api/tasks/toggle/{task_id}', headers=bob)
+    assert response.status_code == 200 and response.get_json()['is_expanded'] is False
+    assert client.put(f'/api/tasks/toggle/{task_id}', headers=alice).get_json()['is_expanded'] is True
+    assert expansion_buffer.stats()['pending'] == 2
+
+    assert expansion_buffer.flush() == 2
+    assert expansion_buffer.stats()['pending'] == 0
+    with app.app_context():
+        stored = {}
+        for shard in (0, 1):
+            with engine_for(shard).connect() as conn:
+                stored.update(conn.execute(db.text(
+                    'SELECT user_id, is_expanded FROM tasks WHERE id = :id'), {'id': task_id}).all())
+    users = {username: client.get('/api/auth/me', headers=headers).get_json()['id']
+             for username, headers in (('alice', alice), ('bob', bob))}
+    assert stored == {users['alice']: 1, users['bob']: 0}
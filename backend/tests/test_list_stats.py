@@ -0,0 +1,129 @@
+import random
+from datetime import datetime, timedelta
+from conftest import login
+from archive import archive_batch
+from models import db
+
+
+def _stats_match_counts(app):
+    """Assert list_stats equals COUNT(*) over the tasks table for every list."""
+    with app.app_context():
+        stored = {row[0]: tuple(row[1:]) for row in db.session.execute(db.text(
+            'SELECT list_id, task_count, completed_count FROM list_stats'))}
+        actual = {row[0]: tuple(row[1:]) for row in db.session.execute(db.text(
+            'SELECT todo_lists.id, COUNT(tasks.id), COALESCE(SUM(tasks.completed), 0) '
+            'FROM todo_lists LEFT JOIN tasks ON tasks.list_id = todo_lists.id GROUP BY todo_lists.id'))}
+    assert stored == actual
+
+
+def _seed(client, headers):
+    lists = [client.post('/api/tasks/lists', json={'title': title}, headers=headers).get_json()['id']
+             for title in ('Home', 'Work', 'Later')]
+    root = client.post(f'/api/tasks/lists/{lists[0]}/tasks', json={'title': 'Root'}, headers=headers).get_json()['id']
+    child = client.post(f'/api/tasks/add/{root}/subtasks/create', json={'title': 'Child'},
+                        headers=headers).get_json()['id']
+    grandchild = client.post(f'/api/tasks/add/{child}/subtasks/create', json={'title': 'Grandchild'},
+                             headers=headers).get_json()['id']
+    return lists, root, child, grandchild
+
+
+def test_stats_after_moves(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    lists, root, child, grandchild = _seed(client, headers)
+    client.put(f'/api/tasks/complete/subtask/{grandchild}', json={'completed': True}, headers=headers)
+
+    assert client.put(f'/api/tasks/move/{child}/to/{lists[1]}', headers=headers).status_code == 200
+    _stats_match_counts(app)
+    assert client.put(f'/api/tasks/move/{root}/to/{lists[2]}', headers=headers).status_code == 200
+    _stats_match_counts(app)
+    assert client.put(f'/api/tasks/update/{child}', json={'list_id': lists[0]}, headers=headers).status_code == 200
+    _stats_match_counts(app)
+
+
+def test_stats_after_moving_a_tree_that_spans_lists(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    lists, root, child, grandchild = _seed(client, headers)
+    # What moving a subtask alone used to leave behind: one tree in two lists
+    with app.app_context():
+        db.session.execute(db.text('UPDATE tasks SET list_id = :list_id WHERE id IN (:child, :grandchild)'),
+                           {'list_id': lists[1], 'child': child, 'grandchild': grandchild})
+        db.session.execute(db.text('UPDATE list_stats SET task_count = task_count + '
+                                   'CASE list_id WHEN :home THEN -2 ELSE 2 END WHERE list_id IN (:home, :work)'),
+                           {'home': lists[0], 'work': lists[1]})
+        db.session.commit()
+    _stats_match_counts(app)
+
+    assert client.put(f'/api/tasks/move/{root}/to/{lists[2]}', headers=headers).status_code == 200
+    _stats_match_counts(app)
+    assert client.delete(f'/api/tasks/delete/{root}', headers=headers).status_code == 200
+    _stats_match_counts(app)
+
+
+def test_stats_after_complete_delete_archive_and_import(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    lists, root, child, grandchild = _seed(client, headers)
+
+    client.put(f'/api/tasks/complete/subtask/{child}', json={'completed': True}, headers=headers)
+    client.put(f'/api/tasks/update/{root}', json={'completed': True}, headers=headers)
+    _stats_match_counts(app)
+    client.put(f'/api/tasks/update/{root}', json={'completed': False}, headers=headers)
+    _stats_match_counts(app)
+
+    export = client.get('/api/tasks/export', headers=headers).get_data()
+    assert client.post('/api/tasks/import', data=export, headers=headers).status_code == 201
+    _stats_match_counts(app)
+
+    assert client.delete(f'/api/tasks/delete/{child}', headers=headers).status_code == 200
+    _stats_match_counts(app)
+
+    with app.app_context():
+        db.session.execute(db.text('UPDATE tasks SET completed = 1, completed_at = :old WHERE id = :id'),
+                           {'old': datetime.utcnow() - timedelta(days=200), 'id': root})
+        db.session.execute(db.text('UPDATE list_stats SET completed_count = completed_count + 1 '
+                                   'WHERE list_id = :list_id'), {'list_id': lists[0]})
+        db.session.commit()
+        assert archive_batch(datetime.utcnow() - timedelta(days=90)) == (1, 1)
+    _stats_match_counts(app)
+    assert client.post(f'/api/tasks/archive/{root}/restore', json={'list_id': lists[1]},
+                       headers=headers).status_code == 201
+    _stats_match_counts(app)
+
+    assert client.delete(f'/api/tasks/lists/{lists[0]}', headers=headers).status_code == 200
+    _stats_match_counts(app)
+
+
+def test_stats_after_random_moves_and_deletes(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    rng = random.Random(0)
+    lists = [client.post('/api/tasks/lists', json={'title': f'List {n}'}, headers=headers).get_json()['id']
+             for n in range(3)]
+    tasks = []
+    for n in range(30):
+        if tasks and rng.random() < 0.6:
+            response = client.post(f'/api/tasks/add/{rng.choice(tasks)}/subtasks/create',
+                                   json={'title': f'Task {n}'}, headers=headers)
+        else:
+            response = client.post(f'/api/tasks/lists/{rng.choice(lists)}/tasks', json={'title': f'Task {n}'},
+                                   headers=headers)
+        tasks.append(response.get_json()['id'])
+
+    for _ in range(40):
+        task_id = rng.choice(tasks)
+        action = rng.random()
+        if action < 0.5:
+            response = client.put(f'/api/tasks/move/{task_id}/to/{rng.choice(lists)}', headers=headers)
+        elif action < 0.7:
+            response = client.put(f'/api/tasks/complete/subtask/{task_id}', json={'completed': rng.random() < 0.5},
+                                  headers=headers)
+        else:
+            response = client.delete(f'/api/tasks/tasks/delete/{task_id}', headers=headers)
+        if response.status_code == 404:
+            # Deleted along with an ancestor
+            tasks.remove(task_id)
+            continue
+        assert response.status_code == 200, response.get_json()
+        _stats_match_counts(app)
@@ -0,0 +1,37 @@
+from metrics import MetricsRegistry, Sample
+
+
+def test_metrics_require_a_token(make_app):
+    client = make_app().test_client()
+    assert client.get('/metrics').status_code == 403
+
+    client = make_app(METRICS_TOKEN='s3cret').test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200 and 'http_requests_total' in response.get_data(as_text=True)
+
+
+def test_shared_metrics_add_up_across_processes(tmp_path):
+    # Two registries stand in for two workers sharing a METRICS_DIR
+    first, second = MetricsRegistry(), MetricsRegistry()
+    for registry, requests in ((first, 2), (second, 3)):
+        registry.share(str(tmp_path))
+        for _ in range(requests):
+            sample = Sample()
+            sample.statements = 4
+            registry.record('tasks.lists', 'GET', 200, sample, slow=False)
+        registry.slow_query()
+    first.write_snapshot()
+
+    text = second.render()
+    assert 'http_requests_total{endpoint="tasks.lists",method="GET",status="200"} 5' in text
+    assert 'http_request_sql_statements_count{endpoint="tasks.lists",method="GET"} 5' in text
+    assert 'http_request_sql_statements_sum{endpoint="tasks.lists",method="GET"} 20' in text
+    assert 'db_slow_queries_total 2' in text
+
+    # Both still count after they exit, for a worker started later
+    second.write_snapshot()
+    third = MetricsRegistry()
+    third.share(str(tmp_path))
+    assert 'db_slow_queries_total 2' in third.render()
@@ -0,0 +1,60 @@
+from conftest import login
+from models import db, Task
+
+
+def _list(client, headers, title):
+    return client.post('/api/tasks/lists', json={'title': title}, headers=headers).get_json()['id']
+
+
+def _task(client, headers, list_id, title):
+    return client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': title}, headers=headers).get_json()['id']
+
+
+def _subtask(client, headers, parent_id, title):
+    return client.post(f'/api/tasks/add/{parent_id}/subtasks/create', json={'title': title},
+                       headers=headers).get_json()['id']
+
+
+def test_subtask_moved_to_another_list_becomes_top_level(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    home, work = _list(client, headers, 'Home'), _list(client, headers, 'Work')
+    root = _task(client, headers, home, 'Root')
+    child = _subtask(client, headers, root, 'Child')
+    grandchild = _subtask(client, headers, child, 'Grandchild')
+    sibling = _subtask(client, headers, root, 'Sibling')
+
+    response = client.put(f'/api/tasks/move/{child}/to/{work}', headers=headers)
+    assert response.status_code == 200
+    moved = response.get_json()
+    assert (moved['list_id'], moved['parent_id']) == (work, None)
+    assert [subtask['id'] for subtask in moved['subtasks']] == [grandchild]
+
+    tasks = client.get(f'/api/tasks/lists/{work}/tasks', headers=headers).get_json()
+    assert [task['id'] for task in tasks] == [child]
+    assert tasks[0]['subtasks'][0]['list_id'] == work
+    old_root = client.get(f'/api/tasks/lists/{home}/tasks', headers=headers).get_json()[0]
+    assert [subtask['title'] for subtask in old_root['subtasks']] == ['Sibling']
+    assert old_root['completion_fraction'] == '0/1'
+    with app.app_context():
+        paths = dict(db.session.execute(db.select(Task.id, Task.path).where(Task.id.in_([child, grandchild]))).all())
+    assert paths == {child: '/', grandchild: f'/{child}/'}
+
+    # Deleting the new list takes the moved tree with it, the old list keeps its own
+    assert client.delete(f'/api/tasks/lists/{work}', headers=headers).status_code == 200
+    with app.app_context():
+        assert db.session.execute(db.select(Task.id).order_by(Task.id)).scalars().all() == [root, sibling]
+    assert client.get(f'/api/tasks/tasks/{root}', headers=headers).get_json()['completion_fraction'] == '0/1'
+
+
+def test_update_list_id_of_a_subtask_detaches_it(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    home, work = _list(client, headers, 'Home'), _list(client, headers, 'Work')
+    root = _task(client, headers, home, 'Root')
+    child = _subtask(client, headers, root, 'Child')
+
+    response = client.put(f'/api/tasks/update/{child}', json={'list_id': work}, headers=headers)
+    assert response.status_code == 200 and response.get_json()['parent_id'] is None
+    assert [task['id'] for task in client.get(f'/api/tasks/lists/{work}/tasks', headers=headers).get_json()] == [child]
+    assert client.get(f'/api/tasks/tasks/{root}', headers=headers).get_json()['subtasks'] == []
@@ -0,0 +1,48 @@
+import time
+import pytest
+from werkzeug.security import generate_password_hash
+from conftest import PASSWORD
+from database import ensure_schema
+from models import db, User
+from password_hasher import PasswordHasher, HasherBusy, password_hasher
+
+
+def test_needs_rehash_compares_with_the_configured_parameters():
+    # A fresh hasher, as in a worker that has not hashed anything yet
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=0)
+    assert not hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:2000'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha512:1000'))
+
+    hasher.configure('scrypt', 0, 4, 10, 10)
+    assert not hasher.needs_rehash('scrypt:32768:8:1$salt$hash')
+    assert hasher.needs_rehash('scrypt:16384:8:1$salt$hash')
+    hasher.configure('pbkdf2', 0, 4, 10, 10)
+    assert not hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2'))
+
+
+def test_first_login_does_not_rehash_a_current_hash(make_app, monkeypatch):
+    app = make_app(PASSWORD_HASH_METHOD='pbkdf2:sha256:1234')
+    # Stored without going through this process's hasher, as by another worker
+    stored = generate_password_hash(PASSWORD, 'pbkdf2:sha256:1234')
+    ensure_schema(app)
+    with app.app_context():
+        db.session.add(User(username='alice', password_hash=stored))
+        db.session.commit()
+    hashed = []
+    monkeypatch.setattr(password_hasher, 'hash', lambda password: hashed.append(password))
+
+    response = app.test_client().post('/api/auth/login', json={'username': 'alice', 'password': PASSWORD})
+    assert response.status_code == 200
+    assert hashed == []
+    with app.app_context():
+        assert db.session.execute(db.select(User.password_hash)).scalar() == stored
+
+
+def test_timeout_raises_busy():
+    hasher = PasswordHasher(workers=1, timeout=0.05)
+    try:
+        with pytest.raises(HasherBusy):
+            hasher._run(time.sleep, 2)
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,113 @@
+import random
+import pytest
+from conftest import login
+from models import db
+from positions import DIGITS, FIRST_KEY, MAX_KEY_LENGTH, is_valid_key, key_between, nth_key
+
+
+def _check(lower, upper):
+    key = key_between(lower, upper)
+    assert is_valid_key(key)
+    assert lower is None or lower < key
+    assert upper is None or key < upper
+    return key
+
+
+def test_key_between_neighbours():
+    assert key_between(None, None) == FIRST_KEY
+    for lower, upper in [('a0', 'a1'), ('a0', 'a2'), ('a0', 'b00'), ('a0V', 'a1'), ('a0', 'a0V'),
+                         ('a01', 'a02'), ('Zz', 'a0'), ('a0z', 'a1'), ('a0zzz', 'a1'), ('b00', 'b001')]:
+        _check(lower, upper)
+    with pytest.raises(ValueError):
+        key_between('a1', 'a0')
+    with pytest.raises(ValueError):
+        key_between('a1', 'a1')
+
+
+def test_key_between_at_both_ends():
+    # Appending counts up the integer part; prepending counts down past 'a0'
+    key = FIRST_KEY
+    for n in range(1, 200):
+        key = _check(key, None)
+        assert key == nth_key(n)
+    key = FIRST_KEY
+    for _ in range(200):
+        key = _check(None, key)
+    assert key.startswith('Y')
+    # A fraction is dropped rather than counted down from
+    assert key_between(None, 'a0V') == 'a0'
+    assert key_between('az', None) == 'b00'
+
+
+def test_repeated_inserts_at_the_same_gap():
+    # Always right after the lower key, then always right before the upper one
+    for pick in (lambda keys, new: (keys[0], new), lambda keys, new: (new, keys[1])):
+        keys = ('a0', 'a1')
+        lengths = []
+        for _ in range(300):
+            new = _check(*keys)
+            keys = pick(keys, new)
+            lengths.append(len(new))
+        # About one more character per six inserts
+        assert lengths[-1] <= 2 + 300 // 5
+
+
+def test_random_inserts_keep_order():
+    rng = random.Random(1)
+    keys = [FIRST_KEY]
+    for _ in range(2000):
+        index = rng.randrange(len(keys) + 1)
+        lower = keys[index - 1] if index else None
+        upper = keys[index] if index < len(keys) else None
+        keys.insert(index, _check(lower, upper))
+    assert keys == sorted(keys) and len(set(keys)) == len(keys)
+    assert all(char in DIGITS for key in keys for char in key)
+
+
+def test_nth_key_sorts_in_order():
+    keys = [nth_key(n) for n in range(len(DIGITS) ** 2 + 10)]
+    assert keys == sorted(keys) and keys[0] == FIRST_KEY
+    assert all(is_valid_key(key) for key in keys)
+    assert not is_valid_key('a') and not is_valid_key('a00') and not is_valid_key('') and not is_valid_key(None)
+
+
+def _order(client, headers, list_id):
+    return [task['id'] for task in client.get(f'/api/tasks/lists/{list_id}/tasks', headers=headers).get_json()]
+
+
+def test_reorder_route(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+    a, b, c, d = [client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': title}, headers=headers)
+                  .get_json()['id'] for title in 'ABCD']
+    child = client.post(f'/api/tasks/add/{a}/subtasks/create', json={'title': 'Child'},
+                        headers=headers).get_json()['id']
+    assert _order(client, headers, list_id) == [a, b, c, d]
+
+    def reorder(task_id, **body):
+        return client.put(f'/api/tasks/reorder/{task_id}', json=body, headers=headers)
+
+    assert reorder(d, before_id=a).status_code == 200
+    assert _order(client, headers, list_id) == [d, a, b, c]
+    assert reorder(d, after_id=b).status_code == 200
+    assert _order(client, headers, list_id) == [a, b, d, c]
+    assert reorder(a, after_id=d, before_id=c).status_code == 200
+    assert _order(client, headers, list_id) == [b, d, a, c]
+    assert reorder(b).status_code == 200
+    assert _order(client, headers, list_id) == [d, a, c, b]
+
+    # Neighbours must be siblings, in order
+    assert reorder(d, before_id=child).status_code == 400
+    assert reorder(d, after_id=c, before_id=a).status_code == 400
+    assert reorder(d, before_id=d).status_code == 400
+    assert _order(client, headers, list_id) == [d, a, c, b]
+
+    # Moving back and forth into one gap renumbers the siblings once keys get long
+    for n in range(400):
+        mover, lower = (b, c) if n % 2 else (c, b)
+        assert reorder(mover, after_id=a, before_id=lower).status_code == 200
+    with app.app_context():
+        longest = db.session.execute(db.text('SELECT MAX(LENGTH(position)) FROM tasks')).scalar()
+    assert longest <= MAX_KEY_LENGTH
+    assert _order(client, headers, list_id) == [d, a, b, c]
@@ -0,0 +1,46 @@
+from sqlalchemy import event
+from conftest import login
+from models import db
+
+
+def _seed(client, headers, depth, width):
+    """One list holding a chain `depth` tasks deep with `width` subtasks under every task."""
+    list_id = client.post('/api/tasks/lists', json={'title': 'List'}, headers=headers).get_json()['id']
+    parent = client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'Root'}, headers=headers).get_json()['id']
+    for level in range(depth):
+        children = [client.post(f'/api/tasks/add/{parent}/subtasks/create', json={'title': f'{level}.{n}'},
+                                headers=headers).get_json()['id'] for n in range(width)]
+        parent = children[0]
+
+
+def _count_statements(app, client, headers):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        response = client.get('/api/tasks/lists', headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    assert response.status_code == 200
+    return len(statements), response.get_json()
+
+
+def test_get_lists_query_count_does_not_grow_with_the_tree(app):
+    client = app.test_client()
+    shallow, deep = login(client, 'shallow'), login(client, 'deeper')
+    _seed(client, shallow, depth=1, width=1)
+    _seed(client, deep, depth=8, width=6)
+
+    shallow_count, _ = _count_statements(app, client, shallow)
+    deep_count, lists = _count_statements(app, client, deep)
+
+    task = lists[0]['tasks'][0]
+    for _ in range(8):
+        assert len(task['subtasks']) == 6
+        task = task['subtasks'][0]
+    assert shallow_count == deep_count
+    assert deep_count <= 3
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+import pytest
+from conftest import login
+from archive import archive_batch
+from models import db
+
+
+def _search(client, headers, q, **params):
+    response = client.get('/api/tasks/search', query_string=dict(params, q=q), headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return [task['id'] for task in response.get_json()]
+
+
+def _index_matches_tasks(app):
+    """Assert tasks_fts indexes exactly the current rows of tasks.
+
+    The index is contentless, so its terms are compared with those of an
+    index freshly built from tasks.
+    """
+    with app.app_context():
+        conn = db.session.connection()
+        conn.execute(db.text(
+            "CREATE VIRTUAL TABLE temp.fresh_fts USING fts5(title, description, owner, content='', "
+            "tokenize='unicode61 remove_diacritics 2')"))
+        conn.execute(db.text("INSERT INTO temp.fresh_fts (rowid, title, description, owner) "
+                             "SELECT id, title, description, 'u' || user_id FROM tasks"))
+        terms = []
+        for schema, name in (('main', 'tasks_fts'), ('temp', 'fresh_fts')):
+            conn.execute(db.text(f'CREATE VIRTUAL TABLE temp.{name}_terms USING fts5vocab({schema}, {name}, instance)'))
+            terms.append(conn.execute(db.text(f'SELECT * FROM temp.{name}_terms ORDER BY 1, 2, 3, 4')).all())
+        db.session.rollback()
+        for name in ('temp.tasks_fts_terms', 'temp.fresh_fts_terms', 'temp.fresh_fts'):
+            db.session.execute(db.text(f'DROP TABLE IF EXISTS {name}'))
+        db.session.commit()
+    assert terms[0] == terms[1] and terms[0]
+
+
+def _create(client, headers, list_id, title, description=''):
+    return client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': title, 'description': description},
+                       headers=headers).get_json()['id']
+
+
+def test_index_follows_writes(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    home, work = [client.post('/api/tasks/lists', json={'title': title}, headers=headers).get_json()['id']
+                  for title in ('Home', 'Work')]
+    groceries = _create(client, headers, home, 'Groceries', 'milk and eggs')
+    child = client.post(f'/api/tasks/add/{groceries}/subtasks/create', json={'title': 'Buy bread'},
+                        headers=headers).get_json()['id']
+    report = _create(client, headers, work, 'Quarterly report')
+    _index_matches_tasks(app)
+    assert _search(client, headers, 'milk') == [groceries]
+    assert _search(client, headers, 'groc') == [groceries]
+
+    client.put(f'/api/tasks/update/{groceries}', json={'title': 'Market', 'description': 'cheese'}, headers=headers)
+    _index_matches_tasks(app)
+    assert _search(client, headers, 'milk') == [] and _search(client, headers, 'cheese') == [groceries]
+    client.put(f'/api/tasks/update/{groceries}/subtasks/update/{child}', json={'title': 'Buy butter'},
+               headers=headers)
+    assert _search(client, headers, 'bread') == [] and _search(client, headers, 'butter') == [child]
+
+    # Moves keep the row and change the list filter
+    client.put(f'/api/tasks/move/{groceries}/to/{work}', headers=headers)
+    _index_matches_tasks(app)
+    assert _search(client, headers, 'butter', list_id=work) == [child]
+    assert _search(client, headers, 'butter', list_id=home) == []
+
+    export = client.get('/api/tasks/export', headers=headers).get_data()
+    assert client.post('/api/tasks/import', data=export, headers=headers).status_code == 201
+    _index_matches_tasks(app)
+    assert len(_search(client, headers, 'butter')) == 2
+    copy, = set(_search(client, headers, 'quarterly')) - {report}
+
+    client.delete(f'/api/tasks/delete/{groceries}', headers=headers)
+    _index_matches_tasks(app)
+    assert len(_search(client, headers, 'butter')) == 1
+
+    # Archived trees leave the index, restored ones come back
+    with app.app_context():
+        db.session.execute(db.text('UPDATE tasks SET completed = 1, completed_at = :old WHERE id = :id'),
+                           {'old': datetime.utcnow() - timedelta(days=200), 'id': report})
+        db.session.commit()
+        archive_batch(datetime.utcnow() - timedelta(days=90))
+    _index_matches_tasks(app)
+    assert _search(client, headers, 'quarterly') == [copy]
+    client.post(f'/api/tasks/archive/{report}/restore', headers=headers)
+    _index_matches_tasks(app)
+    assert sorted(_search(client, headers, 'quarterly')) == [report, copy]
+
+    client.delete(f'/api/tasks/lists/{work}', headers=headers)
+    _index_matches_tasks(app)
+    assert _search(client, headers, 'quarterly') == [copy]
+
+
+@pytest.mark.parametrize('q', [
+    '"', '""', "'", '*', '-', '^', '(', ')', 'AND', 'OR', 'NOT', 'NEAR', 'NEAR(a b)', 'a OR b', 'a NOT b',
+    'title:secret', 'owner:u2', '{title owner}: secret', '"unterminated', 'secret*', '+secret', 'sec"ret',
+    'secret AND', '^secret', 'x' * 200, 'é€☃',
+])
+def test_user_input_is_searched_as_text(app, q):
+    client = app.test_client()
+    alice = login(client, 'alice')
+    bob = login(client, 'bob')
+    bob_list = client.post('/api/tasks/lists', json={'title': 'Bob'}, headers=bob).get_json()['id']
+    _create(client, bob, bob_list, 'secret', 'a b OR NOT NEAR')
+    alice_list = client.post('/api/tasks/lists', json={'title': 'Alice'}, headers=alice).get_json()['id']
+    _create(client, alice, alice_list, 'Plans')
+
+    # Never an FTS5 syntax error, and never another user's task
+    assert _search(client, alice, q) == []
+
+
+def test_operators_typed_by_users_match_literally(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+    either = _create(client, headers, list_id, 'Tea OR coffee')
+    tea = _create(client, headers, list_id, 'Tea')
+    quoted = _create(client, headers, list_id, 'Say "hello" to C++')
+
+    assert _search(client, headers, 'tea OR coffee') == [either]
+    assert sorted(_search(client, headers, 'tea')) == [either, tea]
+    assert _search(client, headers, '"hello"') == [quoted]
+    assert _search(client, headers, 'c++ say') == [quoted]
+    assert _search(client, headers, 'title:tea') == []
+    # Only a trailing * makes a prefix, other words must be whole
+    assert _search(client, headers, 'te* coffee') == [either]
+    assert _search(client, headers, 'te coffee') == []
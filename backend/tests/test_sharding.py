@@ -0,0 +1,32 @@
+import sqlite3
+from conftest import PASSWORD, login
+from models import db
+
+
+def test_failed_signup_leaves_no_shard_user(make_app, tmp_path, monkeypatch):
+    shards = [tmp_path / f'shard{n}.db' for n in range(2)]
+    app = make_app(SHARD_DATABASE_URLS=[f'sqlite:///{path}' for path in shards])
+    client = app.test_client()
+    login(client, 'alice')
+
+    def users(path):
+        with sqlite3.connect(path) as conn:
+            return conn.execute('SELECT id, username FROM users ORDER BY id').fetchall()
+
+    def fail():
+        raise RuntimeError('disk I/O error')
+
+    # The main database fails to commit after the shard row was written
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'commit', fail)
+        response = client.post('/api/auth/signup', json={'username': 'bob', 'password': PASSWORD})
+    assert response.status_code == 500
+    assert users(tmp_path / 'todo.db') == [(1, 'alice')]
+    assert users(shards[1]) == [(1, 'alice')] and users(shards[0]) == []
+
+    # The id comes round again, for another user, who lands on the shard cleanly
+    headers = login(client, 'carol')
+    assert users(tmp_path / 'todo.db') == [(1, 'alice'), (2, 'carol')]
+    assert users(shards[0]) == [(2, 'carol')]
+    list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+    assert client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'Task'}, headers=headers).status_code == 201
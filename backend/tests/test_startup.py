@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+from conftest import login
+from models import db
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT = os.path.dirname(BACKEND)
+
+# Generous next to benchmarks/startup_bench.py's medians (about 15 and 30 ms)
+CREATE_APP_BUDGET_MS = 100
+FIRST_REQUEST_BUDGET_MS = 300
+
+CHILD = '''
+import contextlib, io, json, os, sys, threading, time
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+connections = []
+event.listen(Pool, 'connect', lambda *args: connections.append(1))
+threads = set(threading.enumerate())
+output = io.StringIO()
+with contextlib.redirect_stdout(output):
+    import wsgi
+result = {'printed': output.getvalue(), 'files': sorted(os.listdir(os.environ['TEST_DB_DIR'])),
+          'connections': len(connections),
+          'threads': sorted(thread.name for thread in set(threading.enumerate()) - threads)}
+import app
+start = time.perf_counter()
+application = app.create_app()
+result['create_app'] = time.perf_counter() - start
+client = application.test_client()
+start = time.perf_counter()
+response = client.get('/api/tasks/lists', headers={'Authorization': os.environ['TEST_AUTHORIZATION']})
+result['first_request'] = time.perf_counter() - start
+result['status'] = response.status_code
+print(json.dumps(result))
+'''
+
+
+def _run_child(database, headers):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', TEST_DB_DIR=os.path.dirname(database),
+               TEST_AUTHORIZATION=headers['Authorization'])
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_importing_wsgi_has_no_side_effects(make_app, tmp_path):
+    # A user and a schema in another file, so the child's database stays absent
+    seeded = tmp_path / 'seeded'
+    seeded.mkdir()
+    app = make_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{seeded / 'todo.db'}")
+    headers = login(app.test_client(), 'alice')
+
+    empty = tmp_path / 'empty'
+    empty.mkdir()
+    result = _run_child(str(empty / 'todo.db'), headers)
+    assert result['printed'] == ''
+    assert result['files'] == []
+    assert result['connections'] == 0
+    assert result['threads'] == []
+
+
+def test_create_app_and_first_request_within_budget(make_app, tmp_path):
+    database = tmp_path / 'todo.db'
+    app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{database}')
+    client = app.test_client()
+    headers = login(client, 'alice')
+    client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers)
+    with app.app_context():
+        db.engine.dispose()
+
+    result = _run_child(str(database), headers)
+    assert result['status'] == 200
+    assert result['create_app'] * 1000 < CREATE_APP_BUDGET_MS
+    assert result['first_request'] * 1000 < FIRST_REQUEST_BUDGET_MS
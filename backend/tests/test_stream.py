@@ -0,0 +1,25 @@
+from conftest import login
+from change_hub import change_hub
+
+
+def test_stream_refused_on_sync_workers(make_app):
+    client = make_app(SERVER_THREADS=1).test_client()
+    headers = login(client, 'alice')
+    response = client.get('/api/tasks/stream', headers=headers)
+    assert response.status_code == 503
+    assert change_hub.stats()['subscribers'] == 0
+
+
+def test_streams_leave_a_request_thread_free(make_app):
+    client = make_app(SERVER_THREADS=3).test_client()
+    headers = login(client, 'alice')
+    streams = [client.get('/api/tasks/stream', headers=headers) for _ in range(2)]
+    try:
+        assert [stream.status_code for stream in streams] == [200, 200]
+        assert client.get('/api/tasks/stream', headers=headers).status_code == 503
+        # Other routes still answer
+        assert client.get('/api/tasks/lists', headers=headers).status_code == 200
+    finally:
+        for stream in streams:
+            stream.close()
+    assert change_hub.stats()['subscribers'] == 0
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from conftest import login
+from archive import archive_batch
+from models import db
+
+
+def _changes(client, headers, since):
+    response = client.get(f'/api/tasks/changes?since={since}', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _sync(client, headers, replica):
+    """Apply /changes since the replica's revision to it, as a client would."""
+    changes = _changes(client, headers, replica['revision'])
+    if changes['reset']:
+        replica['lists'].clear()
+        replica['tasks'].clear()
+    for kind in ('lists', 'tasks'):
+        for row_id in changes['deleted'][kind]:
+            replica[kind].pop(row_id, None)
+        replica[kind].update({row['id']: row for row in changes[kind]})
+    replica['revision'] = changes['revision']
+    return changes
+
+
+def _assert_in_sync(app, client, headers, replica):
+    _sync(client, headers, replica)
+    full = _changes(client, headers, 0)
+    assert replica['revision'] == full['revision']
+    assert replica['lists'] == {row['id']: row for row in full['lists']}
+    assert replica['tasks'] == {row['id']: row for row in full['tasks']}
+    with app.app_context():
+        assert set(replica['tasks']) == set(db.session.execute(db.text('SELECT id FROM tasks')).scalars())
+
+
+def _age_tombstones(app, days):
+    with app.app_context():
+        db.session.execute(db.text('UPDATE tombstones SET deleted_at = :old'),
+                           {'old': datetime.utcnow() - timedelta(days=days)})
+        db.session.commit()
+
+
+def test_changes_round_trip(make_app):
+    app = make_app(EXPANSION_FLUSH_MS=0)
+    client = app.test_client()
+    headers = login(client, 'alice')
+    replica = {'revision': 0, 'lists': {}, 'tasks': {}}
+    _assert_in_sync(app, client, headers, replica)
+
+    home, work = [client.post('/api/tasks/lists', json={'title': title}, headers=headers).get_json()['id']
+                  for title in ('Home', 'Work')]
+    root, other = [client.post(f'/api/tasks/lists/{home}/tasks', json={'title': title}, headers=headers)
+                   .get_json()['id'] for title in ('Root', 'Other')]
+    child = client.post(f'/api/tasks/add/{root}/subtasks/create', json={'title': 'Child'},
+                        headers=headers).get_json()['id']
+    _assert_in_sync(app, client, headers, replica)
+
+    steps = [
+        lambda: client.put(f'/api/tasks/complete/subtask/{child}', json={'completed': True}, headers=headers),
+        lambda: client.put(f'/api/tasks/update/{root}', json={'title': 'Renamed'}, headers=headers),
+        lambda: client.put(f'/api/tasks/toggle/{root}', headers=headers),
+        lambda: client.put(f'/api/tasks/reorder/{other}', json={'before_id': root}, headers=headers),
+        lambda: client.put(f'/api/tasks/move/{child}/to/{work}', headers=headers),
+        lambda: client.put(f'/api/tasks/lists/{work}', json={'title': 'Office'}, headers=headers),
+        lambda: client.post('/api/tasks/batch', headers=headers, json={'operations': [
+            {'op': 'create', 'ref': 'new', 'list_id': work, 'title': 'New'},
+            {'op': 'delete', 'id': other}]}),
+        lambda: client.post('/api/tasks/import', data=client.get('/api/tasks/export', headers=headers).get_data(),
+                            headers=headers),
+        lambda: client.delete(f'/api/tasks/delete/{root}', headers=headers),
+        lambda: client.delete(f'/api/tasks/lists/{work}', headers=headers),
+    ]
+    for step in steps:
+        assert step().status_code in (200, 201)
+        _assert_in_sync(app, client, headers, replica)
+    # Nothing new: the same revision and an empty delta
+    changes = _sync(client, headers, replica)
+    assert (changes['lists'], changes['tasks'], changes['deleted']) == ([], [], {'lists': [], 'tasks': []})
+
+    # Archiving a tree deletes it for the client; restoring brings it back
+    task_id = next(iter(replica['tasks']))
+    with app.app_context():
+        db.session.execute(db.text('UPDATE tasks SET completed = 1, completed_at = :old WHERE parent_id IS NULL'),
+                           {'old': datetime.utcnow() - timedelta(days=200)})
+        db.session.commit()
+        archive_batch(datetime.utcnow() - timedelta(days=90))
+    _assert_in_sync(app, client, headers, replica)
+    assert not replica['tasks']
+    assert client.post(f'/api/tasks/archive/{task_id}/restore', headers=headers).status_code == 201
+    _assert_in_sync(app, client, headers, replica)
+
+
+def test_old_since_gets_a_full_resync_after_pruning(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+    kept, deleted = [client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': title}, headers=headers)
+                     .get_json()['id'] for title in ('Kept', 'Deleted')]
+    stale = {'revision': 0, 'lists': {}, 'tasks': {}}
+    _sync(client, headers, stale)
+    client.delete(f'/api/tasks/delete/{deleted}', headers=headers)
+    current = dict(stale, tasks=dict(stale['tasks']))
+    assert _sync(client, headers, current)['deleted']['tasks'] == [deleted]
+
+    # Kept for the retention period
+    runner = app.test_cli_runner()
+    _age_tombstones(app, 10)
+    assert 'Pruned 0 tombstones' in runner.invoke(args=['prune-tombstones']).output
+    assert _changes(client, headers, stale['revision'])['deleted']['tasks'] == [deleted]
+
+    _age_tombstones(app, 40)
+    assert 'Pruned 1 tombstones' in runner.invoke(args=['prune-tombstones']).output
+    with app.app_context():
+        assert db.session.execute(db.text('SELECT COUNT(*) FROM tombstones')).scalar() == 0
+
+    # The stale client cannot learn of the deletion, so it starts over
+    changes = _sync(client, headers, stale)
+    assert changes['reset'] and changes['deleted'] == {'lists': [], 'tasks': []}
+    assert set(stale['tasks']) == {kept} and set(stale['lists']) == {list_id}
+    # A client that had already seen the deletion just gets the next delta
+    changes = _sync(client, headers, current)
+    assert not changes['reset'] and changes['tasks'] == []
+    assert current == stale
+    assert not _changes(client, headers, 0)['reset']
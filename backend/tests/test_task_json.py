@@ -0,0 +1,62 @@
+from flask import jsonify
+from sqlalchemy import select
+from conftest import login
+from models import db, Task
+from task_json import TASK_COLUMNS, task_layout
+from task_tree import load_subtree, TASK_FIELDS
+
+
+def _seed(client, headers):
+    list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+    root = client.post(f'/api/tasks/lists/{list_id}/tasks',
+                       json={'title': 'Quotes " and \\ slashes', 'description': 'Café ☃ \U0001f600\n\ttab'},
+                       headers=headers).get_json()['id']
+    child = client.post(f'/api/tasks/add/{root}/subtasks/create', json={'title': '<b>&amp;</b>'},
+                        headers=headers).get_json()['id']
+    client.post(f'/api/tasks/add/{root}/subtasks/create', json={'title': ''}, headers=headers)
+    client.post(f'/api/tasks/add/{child}/subtasks/create', json={'title': 'Leaf', 'description': None},
+                headers=headers)
+    client.put(f'/api/tasks/complete/subtask/{child}', json={'completed': True}, headers=headers)
+    client.put(f'/api/tasks/update/{root}', json={'is_expanded': False}, headers=headers)
+    return root
+
+
+def _rows(task):
+    # Core rows of the task and its descendants, in the order the read routes use
+    rows = db.session.execute(select(*TASK_COLUMNS).where(task.subtree_filter())
+                              .order_by(Task.position, Task.id)).all()
+    children = {}
+    for row in rows:
+        children.setdefault(row.parent_id, []).append(row)
+    return next(row for row in rows if row.id == task.id), children
+
+
+def _pick(task_dict, fields):
+    picked = {key: task_dict[key] for key in fields}
+    if 'subtasks' in fields:
+        picked['subtasks'] = [_pick(subtask, fields) for subtask in task_dict['subtasks']]
+    return picked
+
+
+def test_rows_encode_like_jsonify_of_to_dict(make_app):
+    app = make_app(EXPANSION_FLUSH_MS=0)
+    client = app.test_client()
+    root_id = _seed(client, login(client, 'alice'))
+
+    with app.app_context():
+        for task in Task.query.order_by(Task.id):
+            row, children = _rows(task)
+            expected = jsonify(task.to_dict(children=load_subtree(task))).get_data(as_text=True).rstrip('\n')
+            assert task_layout().encode(row, children) == expected
+
+            flat = task.to_dict(include_subtasks=False)
+            expected = jsonify(flat).get_data(as_text=True).rstrip('\n')
+            assert task_layout(tuple(flat)).encode(row, children, depth=0) == expected
+
+        # Every subset a client can ask for with ?fields= is a subset of to_dict's keys
+        task = db.session.get(Task, root_id)
+        full = task.to_dict(children=load_subtree(task))
+        row, children = _rows(task)
+        for fields in (('id',), ('title', 'id'), ('completion_fraction', 'position'), TASK_FIELDS):
+            expected = jsonify(_pick(full, fields)).get_data(as_text=True).rstrip('\n')
+            assert task_layout(fields).encode(row, children) == expected
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from conftest import login
+from archive import archive_batch
+from models import db
+
+
+def test_import_does_not_reuse_archived_or_deleted_ids(app):
+    client = app.test_client()
+    headers = login(client, 'alice')
+    list_id = client.post('/api/tasks/lists', json={'title': 'Home'}, headers=headers).get_json()['id']
+    first, archived, deleted = [
+        client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': title}, headers=headers).get_json()['id']
+        for title in ('First', 'Archived', 'Deleted')]
+
+    with app.app_context():
+        db.session.execute(db.text('UPDATE tasks SET completed = 1, completed_at = :old WHERE id = :id'),
+                           {'old': datetime.utcnow() - timedelta(days=200), 'id': archived})
+        db.session.commit()
+        assert archive_batch(datetime.utcnow() - timedelta(days=90)) == (1, 1)
+    assert client.delete(f'/api/tasks/delete/{deleted}', headers=headers).status_code == 200
+
+    export = client.get('/api/tasks/export', headers=headers).get_data()
+    assert client.post('/api/tasks/import', data=export, headers=headers).status_code == 201
+
+    changes = client.get('/api/tasks/changes?since=0', headers=headers).get_json()
+    live = {task['id'] for task in changes['tasks']}
+    assert len(live) == 2 and min(live) == first and max(live) > deleted
+    assert not live & set(changes['deleted']['tasks'])
+
+    # The imported copy can be archived next to the original
+    imported = max(live)
+    with app.app_context():
+        db.session.execute(db.text('UPDATE tasks SET completed = 1, completed_at = :old WHERE id = :id'),
+                           {'old': datetime.utcnow() - timedelta(days=200), 'id': imported})
+        db.session.commit()
+        assert archive_batch(datetime.utcnow() - timedelta(days=90)) == (1, 1)
+    archive = client.get('/api/tasks/archive', headers=headers).get_json()
+    assert [entry['task']['id'] for entry in archive] == [imported, archived]
+
+    # New tasks keep counting from past the imported block
+    task_id = client.post(f'/api/tasks/lists/{list_id}/tasks', json={'title': 'Next'}, headers=headers).get_json()['id']
+    assert task_id > imported
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event
+from models import User
+
+# What token_required hands to the routes instead of a User row; the routes
+# only ever read id and username from current_user. shard is where the
+# user's data lives (see sharding.py).
+UserSnapshot = namedtuple('UserSnapshot', ['id', 'username', 'shard'])
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class TokenCache:
+    """Bounded LRU of verified tokens -> UserSnapshot with a per-entry expiry.
+
+    An entry lives for at most `ttl` seconds and never past the token's own
+    `exp` claim. Entries for a user are dropped as soon as that user row is
+    updated or deleted in this process; the TTL bounds staleness elsewhere.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(token)
+            self.misses += 1
+            return None
+
+    def put(self, token, user, token_exp):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        lifetime = self.ttl if token_exp is None else min(self.ttl, token_exp - time.time())
+        if lifetime <= 0:
+            return
+        expires = time.monotonic() + lifetime
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (user, expires)
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, ()):
+                self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[0].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[0].id]
+
+
+token_cache = TokenCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user_tokens(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
@@ -0,0 +1,216 @@
+import json
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import func, select
+from models import db, Task, TodoList, User, ListStats
+from task_json import TASK_COLUMNS, encode_string, task_layout
+from search import indexed_in_bulk
+from positions import key_between, is_valid_key
+from archive import reserve_task_ids
+
+# Bulk export and import of a user's lists and task trees as NDJSON, one
+# record per line:
+#
+#     {"export":{"version":1}}
+#     {"list":{"created_at":"...","id":3,"title":"Home"}}
+#     {"task":{"completed":false,"created_at":"...","description":null,"id":7,...}}
+#
+# Lists come before tasks and every task after its parent, so an import can
+# give each row its new id as it reads it.
+
+EXPORT_VERSION = 1
+# Rows fetched per round trip while exporting
+EXPORT_BATCH = 1000
+DEFAULT_IMPORT_CHUNK = 10000
+TASK_EXPORT_FIELDS = ('id', 'title', 'description', 'completed', 'list_id', 'parent_id',
+                      'is_expanded', 'position', 'created_at')
+
+# Bound positionally by the driver: at a million rows, building and
+# processing a parameter dict per row costs more than the insert itself
+INSERT_TASKS = (
+    'INSERT INTO tasks (id, title, description, completed, list_id, parent_id, user_id, created_at, '
+    'is_expanded, subtask_total, subtask_completed, path, revision, completed_at, position) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?, ?, ?)')
+ADD_SUBTASKS = ('UPDATE tasks SET subtask_total = subtask_total + ?, '
+                'subtask_completed = subtask_completed + ? WHERE id = ?')
+
+
+class ImportFormatError(Exception):
+    def __init__(self, line_number, message):
+        super().__init__(f'line {line_number}: {message}')
+        self.line_number = line_number
+        self.message = message
+
+
+def export_lines(user_id):
+    """NDJSON lines of everything `user_id` owns, read through open cursors.
+
+    Rows are fetched EXPORT_BATCH at a time and written as they arrive, so
+    memory use does not depend on the size of the workspace. Tasks come in
+    id order: a subtask is always created after its parent, so that puts
+    parents first.
+    """
+    yield f'{{"export":{{"version":{EXPORT_VERSION}}}}}\n'
+    lists = db.session.execute(
+        select(TodoList.id, TodoList.title, TodoList.created_at)
+        .where(TodoList.user_id == user_id).order_by(TodoList.id)
+        .execution_options(yield_per=EXPORT_BATCH))
+    for list_id, title, created_at in lists:
+        yield f'{{"list":{{"created_at":"{created_at.isoformat()}","id":{list_id},"title":{encode_string(title)}}}}}\n'
+
+    layout = task_layout(TASK_EXPORT_FIELDS)
+    tasks = db.session.execute(
+        select(*TASK_COLUMNS).where(Task.user_id == user_id).order_by(Task.id)
+        .execution_options(yield_per=EXPORT_BATCH))
+    for rows in tasks.partitions():
+        yield ''.join([f'{{"task":{layout.encode(row, {})}}}\n' for row in rows])
+
+
+def _datetime(value):
+    parsed = datetime.fromisoformat(value) if value is not None else datetime.utcnow()
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class _Importer:
+    """Writes chunks of parsed records, remembering the ids it handed out.
+
+    task_paths maps each imported task's id in the file to the path its
+    children get ('/<root>/.../<new id>/'); the new id itself is the last
+    element, so one string per task is all the state a million-task import
+    keeps. last_positions holds the largest position given out per group of
+    siblings, for records that come without one.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.list_ids = {}
+        self.task_paths = {}
+        self.last_positions = {}
+        self.lists = 0
+        self.tasks = 0
+
+    def write(self, chunk):
+        # The revision bump takes SQLite's write lock, so no other writer can
+        # take the ids reserved below before this transaction commits
+        revision = User.bump_revision(self.user_id)
+        next_list = (db.session.execute(select(func.max(TodoList.id))).scalar() or 0) + 1
+        # Above every task id ever given out, archived and deleted ones too
+        next_task = reserve_task_ids(db.session, sum(kind == 'task' for _, kind, _ in chunk))
+        # Exports carry no completion time; imported completed tasks count as
+        # completed now, so the archival job leaves them alone for a while
+        now = datetime.utcnow().isoformat(' ', 'microseconds')
+        lists, tasks = [], []
+        list_counts, list_completed = Counter(), Counter()
+        subtask_counts, subtask_completed = Counter(), Counter()
+
+        for line_number, kind, record in chunk:
+            if not isinstance(record.get('id'), (int, str)) or not isinstance(record.get('title'), str):
+                raise ImportFormatError(line_number, f'{kind} needs an id and a string title')
+            try:
+                created_at = _datetime(record.get('created_at'))
+            except (TypeError, ValueError):
+                raise ImportFormatError(line_number, 'created_at is not an ISO 8601 date')
+            if kind == 'list':
+                self.list_ids[record['id']] = next_list
+                lists.append({'id': next_list, 'title': record['title'], 'user_id': self.user_id,
+                              'created_at': created_at, 'revision': revision})
+                next_list += 1
+                continue
+
+            list_id = self.list_ids.get(record.get('list_id'))
+            if list_id is None:
+                raise ImportFormatError(line_number, f"task {record['id']} is in list {record.get('list_id')}, "
+                                                     'which does not come before it')
+            parent_id, path = None, '/'
+            if record.get('parent_id') is not None:
+                path = self.task_paths.get(record['parent_id'])
+                if path is None:
+                    raise ImportFormatError(line_number, f"task {record['id']} has parent {record['parent_id']}, "
+                                                         'which does not come before it')
+                parent_id = int(path.rsplit('/', 2)[-2])
+            completed = bool(record.get('completed', False))
+            # Every group of siblings is new, so exported positions can be kept
+            group = (list_id, parent_id)
+            position = record.get('position')
+            if not is_valid_key(position):
+                position = key_between(self.last_positions.get(group), None)
+            self.last_positions[group] = max(position, self.last_positions.get(group, position))
+            # created_at in the text form SQLAlchemy stores DateTime columns in
+            tasks.append((next_task, record['title'], record.get('description'), completed, list_id, parent_id,
+                          self.user_id, created_at.isoformat(' ', 'microseconds'),
+                          bool(record.get('is_expanded', True)), path, revision, now if completed else None,
+                          position))
+            self.task_paths[record['id']] = f'{path}{next_task}/'
+            next_task += 1
+            list_counts[list_id] += 1
+            list_completed[list_id] += completed
+            if parent_id is not None:
+                subtask_counts[parent_id] += 1
+                subtask_completed[parent_id] += completed
+
+        if lists:
+            db.session.execute(TodoList.__table__.insert(), lists)
+            db.session.execute(ListStats.__table__.insert(), [
+                {'list_id': row['id'], 'user_id': self.user_id, 'last_activity_at': datetime.utcnow()}
+                for row in lists])
+        if tasks:
+            with indexed_in_bulk(db.session, tasks[0][0]):
+                db.session.connection().exec_driver_sql(INSERT_TASKS, tasks)
+        # Stored subtask counters and list stats move by this chunk's counts
+        if subtask_counts:
+            db.session.connection().exec_driver_sql(ADD_SUBTASKS, [
+                (total, subtask_completed[parent_id], parent_id) for parent_id, total in subtask_counts.items()])
+        for list_id, count in list_counts.items():
+            ListStats.bump(db.session, list_id, tasks=count, completed=list_completed[list_id])
+        db.session.commit()
+        self.lists += len(lists)
+        self.tasks += len(tasks)
+
+
+def import_lines(user_id, lines, chunk_size=DEFAULT_IMPORT_CHUNK, progress=None):
+    """Add the lists and tasks of an export (lines of NDJSON) to a user's workspace.
+
+    Everything gets new ids; parent and list references are remapped.
+    Records are inserted chunk_size at a time, each chunk in its own
+    transaction with executemany, and progress(lists, tasks, seconds) is
+    called after each one. If a line is malformed, ImportFormatError is
+    raised and the chunks before it stay imported. Returns the counts.
+    """
+    importer = _Importer(user_id)
+    start = time.perf_counter()
+    chunk = []
+    try:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ImportFormatError(line_number, 'not valid JSON')
+            if not isinstance(record, dict) or len(record) != 1:
+                raise ImportFormatError(line_number, 'expected an object with one key')
+            (kind, fields), = record.items()
+            if kind == 'export':
+                if not isinstance(fields, dict) or fields.get('version') != EXPORT_VERSION:
+                    raise ImportFormatError(line_number, f'only export version {EXPORT_VERSION} is supported')
+                continue
+            if kind not in ('list', 'task') or not isinstance(fields, dict):
+                raise ImportFormatError(line_number, f'unknown record {kind!r}')
+            chunk.append((line_number, kind, fields))
+            if len(chunk) >= chunk_size:
+                importer.write(chunk)
+                chunk = []
+                if progress:
+                    progress(importer.lists, importer.tasks, time.perf_counter() - start)
+        if chunk:
+            importer.write(chunk)
+            if progress:
+                progress(importer.lists, importer.tasks, time.perf_counter() - start)
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'lists': importer.lists, 'tasks': importer.tasks,
+            'seconds': round(time.perf_counter() - start, 3)}
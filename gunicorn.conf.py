@@ -0,0 +1,68 @@
+# gunicorn settings, picked up automatically from the working directory by
+# `gunicorn wsgi:app` (see Procfile). Every setting can be overridden on the
+# command line or through GUNICORN_CMD_ARGS.
+import os
+import shutil
+import tempfile
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Import the app once in the master and fork workers from it: importing
+# wsgi has no side effects and opens no connections, so this is safe, and a
+# restarted worker only pays for warm_up instead of a full import.
+preload_app = True
+
+
+def when_ready(server):
+    # Create and migrate the schema once here rather than in every worker
+    # at the same time, then close the master's connections (to the main
+    # database and every shard) before forking
+    from wsgi import app
+    from database import ensure_schema
+    from metrics import metrics
+    from sharding import databases
+    ensure_schema(app)
+    with app.app_context():
+        for _, engine in databases():
+            engine.dispose()
+    # Each worker counts its own requests; sharing the totals through a
+    # directory lets a scrape of /metrics on any worker report all of them
+    if app.config['METRICS_ENABLED'] and not app.config['METRICS_DIR']:
+        app.config['METRICS_DIR'] = server.metrics_dir = tempfile.mkdtemp(prefix='todo-metrics-')
+        metrics.share(app.config['METRICS_DIR'])
+
+
+def post_fork(server, worker):
+    from wsgi import app
+    from app import warm_up
+    app.config['SERVER_THREADS'] = _request_threads(worker)
+    warm_up(app)
+
+
+def _request_threads(worker):
+    # Requests the worker serves at once, which bounds the open /stream
+    # connections (each holds one); None for async workers, whose greenlets
+    # are not a fixed pool
+    from gunicorn.workers.gthread import ThreadWorker
+    from gunicorn.workers.sync import SyncWorker
+    if isinstance(worker, ThreadWorker):
+        return worker.cfg.threads
+    if isinstance(worker, SyncWorker):
+        return 1
+    return None
+
+
+def worker_exit(server, worker):
+    # Write the expand/collapse toggles this worker still holds in memory
+    from expansion_buffer import expansion_buffer
+    from metrics import metrics
+    expansion_buffer.flush()
+    metrics.write_snapshot()
+
+
+def on_exit(server):
+    # Only a directory made in when_ready; one set through METRICS_DIR stays
+    if getattr(server, 'metrics_dir', None):
+        shutil.rmtree(server.metrics_dir, ignore_errors=True)
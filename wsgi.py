@@ -1,4 +1,13 @@
-from backend.app import app
+import os
+import sys
+
+# The backend modules import each other as top-level modules (from models
+# import db), so backend/ itself has to be on the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run()